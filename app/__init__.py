@@ -2,7 +2,7 @@ from flask import Flask
 from loguru import logger
 from app.config import LOG_PATH, SECRET_KEY, BASE_DIR
 from app.database import db
-from app.blueprints import main, api
+from app.blueprints import main, api, history, jobs, metrics, capture
 
 def configure_logging():
     """配置 loguru 日志"""
@@ -34,6 +34,10 @@ def create_app():
     # 注册蓝图
     app.register_blueprint(main.bp)
     app.register_blueprint(api.bp)
+    app.register_blueprint(history.bp)
+    app.register_blueprint(jobs.bp)
+    app.register_blueprint(metrics.bp)
+    app.register_blueprint(capture.bp)
 
     # 初始化数据库（在应用启动时检查）
     # 注意：在生产环境中，这通常通过单独的迁移脚本或 CLI 命令完成
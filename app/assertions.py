@@ -0,0 +1,239 @@
+import ast
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# 序列重复 (如 "a" * n) 结果按嵌套展开后的最大元素数，防止一条断言耗尽内存或 CPU
+MAX_REPEAT_SIZE = 100_000
+
+
+def _numeric_sum(values, start=0):
+    """只允许对数字求和：sum(lists, []) 的拼接代价随元素数平方增长"""
+    if not isinstance(start, (int, float)):
+        raise ValueError("sum() only adds numbers")
+    return sum(values, start)
+
+
+# 断言表达式中允许调用的内置函数
+SAFE_FUNCTIONS = {
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "list": list,
+    "dict": dict,
+    "set": set,
+    "tuple": tuple,
+    "any": any,
+    "all": all,
+    "min": min,
+    "max": max,
+    "sum": _numeric_sum,
+    "abs": abs,
+    "round": round,
+    "sorted": sorted,
+}
+
+# 允许访问的属性 (仅限 dict / str / list 上的只读方法)
+SAFE_ATTRIBUTES = {
+    "get", "keys", "values", "items", "count", "index",
+    "startswith", "endswith", "lower", "upper", "strip", "split", "find",
+}
+
+# 允许出现的 AST 节点；不在列表中的语法 (lambda、赋值表达式、幂运算等) 一律拒绝
+ALLOWED_NODES = (
+    ast.Expression, ast.Load,
+    ast.BoolOp, ast.And, ast.Or,
+    ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Call, ast.keyword, ast.Name, ast.Attribute, ast.Constant,
+    ast.Subscript, ast.Slice, ast.List, ast.Tuple, ast.Dict, ast.Set,
+)
+
+
+class AssertionSyntaxError(ValueError):
+    """断言表达式包含不允许的语法"""
+
+
+class _Validator(ast.NodeVisitor):
+    def generic_visit(self, node):
+        if not isinstance(node, ALLOWED_NODES):
+            raise AssertionSyntaxError(f"Disallowed syntax: {type(node).__name__}")
+        super().generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id.startswith("_"):
+            raise AssertionSyntaxError(f"Disallowed name: {node.id}")
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if node.attr not in SAFE_ATTRIBUTES:
+            raise AssertionSyntaxError(f"Disallowed attribute: {node.attr}")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id not in SAFE_FUNCTIONS:
+                raise AssertionSyntaxError(f"Disallowed function: {func.id}")
+        elif not isinstance(func, ast.Attribute):
+            raise AssertionSyntaxError("Only named functions and safe methods may be called")
+        self.generic_visit(node)
+
+
+def _deep_size(value: Any, sizes: Dict[int, int]) -> int:
+    """
+    按嵌套展开计算的元素数 (字符串按字符数)，被多处引用的同一对象每处都计入，
+    即 str() 等展开操作实际要处理的量；sizes 按对象 id 缓存，计算本身与不同对象的个数成线性
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value) or 1
+    if not isinstance(value, (list, tuple, set, frozenset, dict)):
+        return 1
+    size = sizes.get(id(value))
+    if size is None:
+        items = value.items() if isinstance(value, dict) else ((v,) for v in value)
+        size = sizes[id(value)] = max(1, sum(_deep_size(v, sizes) for item in items for v in item))
+    return size
+
+
+def _safe_mult(left: Any, right: Any) -> Any:
+    """
+    断言中的乘法：序列与整数相乘时限制结果按嵌套展开后的元素数，
+    ['a' * 1000] * 1000 这类外层很短、内容很大的重复同样受限
+    """
+    for seq, times in ((left, right), (right, left)):
+        if isinstance(seq, (str, bytes, list, tuple)) and isinstance(times, int) and times > 0:
+            if _deep_size(seq, {}) * times > MAX_REPEAT_SIZE:
+                raise ValueError(f"Sequence repetition exceeds {MAX_REPEAT_SIZE} items")
+    return left * right
+
+
+def _safe_mod(left: Any, right: Any) -> Any:
+    """断言中的取模：不允许 % 字符串格式化 (宽度参数同样可以生成任意长的字符串)"""
+    if isinstance(left, (str, bytes)):
+        raise ValueError("String formatting is not allowed")
+    return left % right
+
+
+# 运行时检查的二元运算 -> 作用域中的函数名 (下划线开头，规则文本本身无法引用)
+_GUARDED_OPS = {ast.Mult: "_safe_mult", ast.Mod: "_safe_mod"}
+
+
+class _GuardOperators(ast.NodeTransformer):
+    """校验通过后把乘法与取模改写为带检查的函数调用，操作数类型只有运行时才能确定"""
+
+    def visit_BinOp(self, node: ast.BinOp):
+        self.generic_visit(node)
+        name = _GUARDED_OPS.get(type(node.op))
+        if name is None:
+            return node
+        call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+class CompiledRule:
+    """编译后的断言规则；语法不合法时 code 为 None，error 记录原因"""
+
+    __slots__ = ("rule", "code", "error")
+
+    def __init__(self, rule: Any, code=None, error: Optional[str] = None):
+        self.rule = rule
+        self.code = code
+        self.error = error
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(rule: str) -> CompiledRule:
+    """解析并校验断言表达式，按规则文本缓存编译结果"""
+    try:
+        tree = ast.parse(rule, mode="eval")
+        _Validator().visit(tree)
+        tree = ast.fix_missing_locations(_GuardOperators().visit(tree))
+        return CompiledRule(rule, compile(tree, "<assertion>", "eval"))
+    except (SyntaxError, AssertionSyntaxError) as e:
+        return CompiledRule(rule, error=str(e))
+
+
+def compile_rules(rules: List[Any]) -> List[CompiledRule]:
+    """编译一组断言规则 (同一文本只解析一次)"""
+    compiled = []
+    for rule in rules or []:
+        item = compile_rule(str(rule))
+        # 保留调用方传入的原始规则对象，用于结果展示
+        compiled.append(CompiledRule(rule, item.code, item.error))
+    return compiled
+
+
+def _make_scope() -> Dict[str, Any]:
+    # 上下文放在 globals 中，生成器表达式内部也能访问 response / params
+    scope = dict(SAFE_FUNCTIONS)
+    scope["_safe_mult"] = _safe_mult
+    scope["_safe_mod"] = _safe_mod
+    scope["__builtins__"] = {}
+    return scope
+
+
+def evaluate(compiled: List[CompiledRule], response: Any, params: Any, scope: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """对单个响应执行全部断言；批量执行时可复用同一个 scope"""
+    if scope is None:
+        scope = _make_scope()
+    scope["response"] = response
+    scope["params"] = params
+
+    results = []
+    for item in compiled:
+        if item.code is None:
+            results.append({"rule": item.rule, "status": "error", "message": item.error})
+            continue
+        try:
+            is_pass = bool(eval(item.code, scope))
+            results.append({"rule": item.rule, "status": "pass" if is_pass else "fail"})
+        except Exception as e:
+            results.append({"rule": item.rule, "status": "error", "message": str(e)})
+    return results
+
+
+class AssertionBatch:
+    """
+    对一次运行的结果逐条执行同一组断言，规则只编译一次、作用域复用。
+    结果可以逐条加入 (流式输出时边执行边断言)，同时累计每条规则的计数。
+    """
+
+    def __init__(self, rules: List[Any]):
+        self.compiled = compile_rules(rules)
+        self.counts = [{"rule": item.rule, "pass": 0, "fail": 0, "error": 0} for item in self.compiled]
+        self._scope = _make_scope()
+
+    def add(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """对一条结果执行断言，写回其 assertions 字段；结果带 timings 时同时记录 assert 阶段耗时 (毫秒)"""
+        if not self.compiled:
+            return result
+        timings = result.get("timings")
+        started = time.perf_counter() if timings is not None else 0
+        checked = evaluate(self.compiled, result.get("response"), result.get("request_params"), self._scope)
+        if timings is not None:
+            timings["assert"] = round((time.perf_counter() - started) * 1000, 3)
+        result["assertions"] = checked
+        for counts, item in zip(self.counts, checked):
+            counts[item["status"]] += 1
+        return result
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """每条规则的 pass/fail/error 计数"""
+        return self.counts
+
+
+def evaluate_batch(rules: List[Any], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    对一次运行的全部结果批量执行断言，写回每条结果的 assertions 字段。
+    :param results: 包含 response 与 request_params 字段的结果列表
+    :return: 每条规则的 pass/fail/error 计数汇总
+    """
+    batch = AssertionBatch(rules)
+    for result in results:
+        batch.add(result)
+    return batch.summary()
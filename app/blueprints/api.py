@@ -1,91 +1,157 @@
 import json
+import time
+import queue
 import random
-import os
-import yaml
+import threading
 from datetime import datetime
-from flask import Blueprint, jsonify, request, session, current_app
+from flask import Blueprint, Response, jsonify, request, session, current_app, stream_with_context
 from loguru import logger
 from app.database import db
-from app.connect import execute_protocol, log_protocol_history
-from app.config import GAME_SERVER, TEST_CASES_PATH
+from app.connect import (
+    execute_protocol, execute_protocol_pipelined, get_pool_stats, is_error_response,
+    log_protocol_history, prepare_protocol_params, resolve_url,
+)
+from app.config import GAME_SERVER
+from app.registry import registry
+from app.assertions import AssertionBatch, evaluate_batch
+from app.catalog import CASE_FIELDS, GZIP_MIN_SIZE, catalog_cache, select_fields
+from app.feeder import FeederError, ParamFeeder, PayloadQueue
+from app.metrics import PhaseTimer
+from app.runner import iter_parallel
+from app.stats import MAX_FAILURES, SAMPLE_SIZE, RunAggregator, RunSummary, summarize_run
 
 # 创建 API 蓝图
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 def get_test_cases_dir():
-    return str(TEST_CASES_PATH)
+    return str(registry.directory)
+
+# 流式输出格式 -> MIME 类型
+STREAM_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+def format_stream_event(fmt: str, event: str, data) -> str:
+    """
+    编码一个流式事件。
+    ndjson: 每行一个 {"event": ..., "data": ...}；sse: 标准 Server-Sent Events 帧
+    """
+    if fmt == "sse":
+        return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+    return current_app.json.dumps({"event": event, "data": data}) + "\n"
+
+def get_target_info(case, global_url: str) -> str:
+    """协议的目标地址 (用于历史记录)"""
+    target_config = case.get("target_config", {})
+    call_type = (case.get("call_type") or "socket").lower()
+    if call_type == "http":
+        return resolve_url(global_url, target_config.get("url", ""))
+    return f"{target_config.get('host')}:{target_config.get('port')}"
 
 def load_all_test_cases():
-    """从 test_cases 目录加载所有 yaml 配置"""
-    directory = get_test_cases_dir()
-    cases = []
-    
-    if not os.path.exists(directory):
-        logger.warning(f"Test cases directory not found: {directory}")
-        return cases
+    """从 test_cases 注册表获取所有协议配置 (仅在文件变化时重新解析)"""
+    return registry.all()
 
-    # 按文件名排序，保证 ID 相对稳定
-    files = sorted([f for f in os.listdir(directory) if f.endswith('.yaml') or f.endswith('.yml')])
-    
-    for idx, filename in enumerate(files):
-        filepath = os.path.join(directory, filename)
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = yaml.safe_load(f)
-                if not isinstance(content, dict):
-                    continue
-                
-                # 构造符合前端预期的结构
-                cases.append({
-                    "id": idx + 1,  # 动态生成 ID
-                    "name": content.get("name", filename),
-                    "description": content.get("description", ""),
-                    "params": content.get("params", {}),
-                    "sample_return": content.get("sample_return", {}),
-                    "assertions": content.get("assertions", []),
-                    "call_type": content.get("call_type", "http"),
-                    "target_config": content.get("target_config", {}),
-                    "test_cases": content.get("test_cases", []),
-                    # 保留原始文件名以便调试或其他用途
-                    "file_source": filename 
-                })
-        except Exception as e:
-            logger.error(f"Failed to load test case {filename}: {e}")
-            
-    return cases
+# /api/doc 分页的单页最大条数
+MAX_DOC_PAGE_SIZE = 500
+
+def catalog_response(version: str, key, build):
+    """
+    返回可缓存的目录接口响应。
+    If-None-Match 命中时直接返回 304，不生成响应体；否则使用缓存的序列化结果 (客户端接受时发送 gzip 版本)。
+    :param build: 生成响应数据的函数，仅在该变体未缓存时调用
+    """
+    encoding = "gzip" if request.accept_encodings["gzip"] else None
+    # 目录随 YAML 文件变化，每次使用前都需向服务端验证
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if "If-None-Match" in request.headers:
+        # 是否压缩取决于响应体大小，两种编码的 ETag 都视为命中 (内容相同)
+        for enc in (encoding, None):
+            etag = catalog_cache.etag(version, key, enc)
+            if request.if_none_match.contains_weak(etag):
+                catalog_cache.count("not_modified")
+                headers["ETag"] = f'"{etag}"'
+                return Response(status=304, headers=headers)
+
+    # 与 jsonify 相同的序列化结果
+    entry = catalog_cache.get(version, key, lambda: current_app.json.response(build()).get_data())
+    if encoding and len(entry.body) >= GZIP_MIN_SIZE:
+        catalog_cache.count("gzip")
+        body = entry.gzipped()
+        headers["Content-Encoding"] = "gzip"
+    else:
+        encoding = None
+        body = entry.body
+    headers["ETag"] = f'"{catalog_cache.etag(version, key, encoding)}"'
+    return Response(body, content_type="application/json", headers=headers)
 
 @bp.route("/protocols", methods=["GET"])
 def get_protocols():
     """获取所有协议列表"""
-    cases = load_all_test_cases()
+    version, cases = catalog_cache.snapshot()
     # 仅返回 ID 和 Name 给下拉列表使用
-    return jsonify([{"id": c["id"], "name": c["name"]} for c in cases])
+    return catalog_response(version, ("protocols",), lambda: [{"id": c["id"], "name": c["name"]} for c in cases])
 
 @bp.route("/doc", methods=["GET"])
 def get_doc():
-    """获取所有协议的清单列表"""
-    cases = load_all_test_cases()
-    return jsonify(cases)
+    """
+    获取所有协议的清单列表。
+    fields=a,b 只返回指定字段 (id 总会返回)；
+    传入 limit 时分页返回 {"items", "total", "offset", "next_offset"}，通过 next_offset 获取下一页
+    """
+    try:
+        fields = tuple(f for f in request.args.get("fields", "").split(",") if f) or None
+        unknown = sorted(set(fields or ()) - set(CASE_FIELDS))
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+        limit = request.args.get("limit")
+        limit = min(max(int(limit), 1), MAX_DOC_PAGE_SIZE) if limit else None
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    version, cases = catalog_cache.snapshot()
+
+    def build():
+        if limit is None:
+            return [select_fields(c, fields) for c in cases[offset:]]
+        end = offset + limit
+        return {
+            "items": [select_fields(c, fields) for c in cases[offset:end]],
+            "total": len(cases),
+            "offset": offset,
+            "next_offset": end if end < len(cases) else None,
+        }
+
+    return catalog_response(version, ("doc", fields, offset, limit), build)
+
+@bp.route("/protocols/stats", methods=["GET"])
+def get_registry_stats():
+    """获取用例注册表的加载计数器与目录响应缓存的命中计数"""
+    return jsonify(dict(registry.stats(), cache=catalog_cache.stats()))
+
+@bp.route("/pools/stats", methods=["GET"])
+def get_connection_pool_stats():
+    """获取传输层连接池的命中/未命中计数"""
+    return jsonify(get_pool_stats())
 
 @bp.route("/protocol/<int:protocol_id>", methods=["GET"])
 def get_protocol_detail(protocol_id: int):
     """获取单个协议详细信息"""
-    cases = load_all_test_cases()
-    # 查找匹配 ID 的 case
-    case = next((c for c in cases if c["id"] == protocol_id), None)
+    version, _ = catalog_cache.snapshot()
+    case = registry.get(protocol_id)
     
     if not case:
         return jsonify({"error": "protocol not found"}), 404
         
-    return jsonify(case)
+    return catalog_response(version, ("protocol", protocol_id), lambda: case)
 
 
 @bp.route("/protocol/<int:protocol_id>/call", methods=["POST"])
 def call_protocol(protocol_id: int):
     """发起协议调用"""
-    cases = load_all_test_cases()
-    # 查找匹配 ID 的 case
-    case = next((c for c in cases if c["id"] == protocol_id), None)
+    case = registry.get(protocol_id)
     
     if not case:
         return jsonify({"error": "protocol not found"}), 404
@@ -94,52 +160,98 @@ def call_protocol(protocol_id: int):
     params = payload.get("params", {})
     # 优先使用 api 传入的断言，没传则使用配置中默认的
     assertions = payload.get("assertions")
-    concurrency = int(payload.get("concurrency", 1))
+    try:
+        concurrency = int(payload.get("concurrency", 1))
+        max_workers = payload.get("max_workers")
+        max_workers = int(max_workers) if max_workers is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency / max_workers must be integers"}), 400
+    if max_workers is not None and max_workers < 1:
+        return jsonify({"error": "max_workers must be at least 1"}), 400
     with_random = bool(payload.get("with_random", False))
+    # 多次调用默认返回结果数组 (与旧版一致)，为 true 时返回带 summary 的对象
+    with_summary = bool(payload.get("with_summary", False))
+    # 执行模式：parallel (默认，线程池并发) / sequential (逐个串行) / pipeline (单连接流水线，仅 protobuf)
+    mode = (payload.get("mode") or "parallel").lower()
+    # 流式输出：ndjson / sse，每个结果完成即发送，最后发送 summary 事件
+    stream_format = (payload.get("stream") or "").lower() or None
+    # 分阶段计时：每个结果附带 timings (connect / encode / send / wait / read / decode / assert，毫秒)
+    with_timings = bool(payload.get("timings", False))
+    # 参数生成：true 使用协议 params 定义中的 feed 规则，也可以传入 {字段: 规则} 覆盖
+    feed = payload.get("feed")
+    # 汇总模式：true 或 {"samples": n, "failures": k}，结果逐条折叠为统计，只返回有限的样本与失败结果
+    aggregate = payload.get("aggregate")
+    if mode not in ("parallel", "sequential", "pipeline"):
+        return jsonify({"error": f"unknown mode: {mode}"}), 400
+    if stream_format and stream_format not in STREAM_MIMETYPES:
+        return jsonify({"error": f"unknown stream format: {stream_format}"}), 400
+    if aggregate:
+        if stream_format:
+            return jsonify({"error": "aggregate cannot be combined with stream"}), 400
+        options = aggregate if isinstance(aggregate, dict) else {}
+        try:
+            sample_size = int(options.get("samples", SAMPLE_SIZE))
+            max_failures = int(options.get("failures", MAX_FAILURES))
+        except (TypeError, ValueError):
+            return jsonify({"error": "aggregate samples / failures must be integers"}), 400
 
     if assertions is None:
         assertions = case.get("assertions", [])
 
     base_return = case.get("sample_return", {})
     protocol_name = case.get("name", "Unknown Protocol")
+    # 每次运行读取一次全局地址 (进程内缓存)，所有调用使用同一个值
+    global_url = db.get_setting("global_target_url", GAME_SERVER)
+
+    count = max(concurrency, 1)
+
+    # 每次调用使用生成的参数时，由后台线程按批生成并预处理，调用时直接取用
+    payloads = None
+    if feed:
+        try:
+            feeder = ParamFeeder(case.get("params"), params, overrides=feed if isinstance(feed, dict) else None)
+        except FeederError as e:
+            return jsonify({"error": str(e)}), 400
+        if feeder.dynamic:
+            payloads = PayloadQueue(feeder, lambda p: prepare_protocol_params(case, p, global_url), total=count)
+
+    # 多次发送同一组参数时预先编码一次 (如 protobuf)，各次调用直接复用
+    call_params = prepare_protocol_params(case, params, global_url) if count > 1 and payloads is None else params
+
+    # perf_counter 到 UTC 时间的换算偏移，用于生成各调用的起止时间
+    clock_offset = time.time() - time.perf_counter()
 
     # 并发模拟函数
     def build_response(index: int):
         # 尝试调用后端具体逻辑
         # execute_protocol 现在支持传入 dict 类型的 target_config
-        real_response = execute_protocol(case, params)
+        request_params, call_args = payloads.get() if payloads is not None else (params, call_params)
+        timer = PhaseTimer() if with_timings else None
+        started = time.perf_counter()
+        real_response = execute_protocol(case, call_args, global_url=global_url, timer=timer)
+        resp = build_result(index, real_response, started, time.perf_counter(), request_params)
+        if timer is not None:
+            resp["timings"] = timer.as_ms()
+        return resp
+
+    def build_result(index: int, real_response, started: float, ended: float, request_params=params):
+        start_time = datetime.utcfromtimestamp(clock_offset + started)
+        end_time = datetime.utcfromtimestamp(clock_offset + ended)
+        elapsed_ms = (ended - started) * 1000
         final_data = real_response if real_response else base_return
         
-        # 执行自定义断言
-        assertion_results = []
-        if assertions:
-            # 安全上下文：仅允许访问 response, params 以及基础类型
-            context = {
-                "response": final_data,
-                "params": params,
-                "len": len,
-                "str": str,
-                "int": int,
-                "float": float,
-                "bool": bool,
-                "list": list,
-                "dict": dict
-            }
-            for rule in assertions:
-                try:
-                    # 使用 eval 动态求值，禁用 __builtins__ 以提升安全性
-                    is_pass = bool(eval(str(rule), {"__builtins__": None}, context))
-                    assertion_results.append({"rule": rule, "status": "pass" if is_pass else "fail"})
-                except Exception as e:
-                    assertion_results.append({"rule": rule, "status": "error", "message": str(e)})
-
         resp = {
             "index": index,
-            "request_params": params,
+            "request_params": request_params,
             "response": final_data,
-            "assertions": assertion_results,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "assertions": [],
+            "timestamp": end_time.isoformat() + "Z",
+            "start_time": start_time.isoformat() + "Z",
+            "end_time": end_time.isoformat() + "Z",
+            "elapsed_ms": round(elapsed_ms, 3),
         }
+        if is_error_response(real_response):
+            resp["error"] = real_response["error"]
         if with_random:
             resp["random"] = {
                 "seed": random.randint(1, 999999),
@@ -147,29 +259,143 @@ def call_protocol(protocol_id: int):
             }
         return resp
 
-    results = [build_response(i + 1) for i in range(max(concurrency, 1))]
+    def iter_results():
+        """按完成顺序产出结果；结束 (包括提前中止) 时停止参数生成线程"""
+        try:
+            if mode == "parallel" and count > 1:
+                yield from iter_parallel(build_response, count, limit=max_workers)
+            elif mode == "pipeline":
+                # 在一条持久连接上流水线发送全部请求，timings 记录每个请求的发送/收到时间
+                if payloads is not None:
+                    request_list, call_list = zip(*(payloads.get() for _ in range(count)))
+                else:
+                    request_list, call_list = [params] * count, [call_params] * count
+                pipeline_started = time.perf_counter()
+                timings = []
+                # 流水线在后台线程中收发，每解码一个响应就交给调用方，流式输出不必等整批完成
+                received: "queue.Queue" = queue.Queue()
+
+                def run_pipeline():
+                    try:
+                        execute_protocol_pipelined(
+                            case, list(call_list), global_url=global_url, timings=timings, on_result=received.put,
+                        )
+                    finally:
+                        received.put(None)
+
+                threading.Thread(target=run_pipeline, name="pipeline", daemon=True).start()
+                for i, resp in enumerate(iter(received.get, None)):
+                    span = timings[i] if i < len(timings) else (pipeline_started, time.perf_counter())
+                    yield build_result(i + 1, resp, *span, request_list[i])
+            else:
+                for i in range(count):
+                    yield build_response(i + 1)
+        finally:
+            if payloads is not None:
+                payloads.close()
+
+    username = session.get("username")
+
+    if stream_format:
+        def generate():
+            yield format_stream_event(stream_format, "start", {
+                "protocol_id": protocol_id,
+                "protocol_name": protocol_name,
+                "concurrency": count,
+                "mode": mode,
+            })
+            # 结果逐条断言、汇总后立即发送，不在内存中保留结果列表
+            batch = AssertionBatch(assertions)
+            summary = RunSummary()
+            run_started = time.perf_counter()
+            try:
+                for result in iter_results():
+                    batch.add(result)
+                    summary.add(result)
+                    yield format_stream_event(stream_format, "result", result)
+            except Exception as e:
+                logger.error(f"Streamed run failed: {e}")
+                yield format_stream_event(stream_format, "error", {"error": str(e)})
+                return
+            run_summary = dict(summary.result(time.perf_counter() - run_started), assertions=batch.summary())
+            yield format_stream_event(stream_format, "summary", run_summary)
+
+            # 流式运行只记录汇总，不保留逐条结果
+            if username:
+                try:
+                    log_protocol_history(
+                        username, protocol_name, get_target_info(case, global_url),
+                        params, {"streamed": True, "summary": run_summary}, assertions,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to log history: {e}")
+
+        response = Response(
+            stream_with_context(generate()),
+            mimetype=STREAM_MIMETYPES[stream_format],
+            # 禁止代理缓冲，保证结果实时到达客户端
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        if payloads is not None:
+            # 客户端在第一个事件之前断开时 generate 不会执行，响应关闭时同样停止参数生成线程
+            response.call_on_close(payloads.close)
+        return response
+
+    if aggregate:
+        aggregator = RunAggregator(sample_size=sample_size, max_failures=max_failures)
+        # 结果逐条断言并计入统计后即丢弃，只有样本与失败结果留在内存中
+        batch = AssertionBatch(assertions)
+        run_started = time.perf_counter()
+        try:
+            for result in iter_results():
+                aggregator.add(batch.add(result))
+        except FeederError as e:
+            # 参数生成在调用过程中失败 (如数据文件中无法解析的行)
+            return jsonify({"error": str(e)}), 400
+        run_summary = aggregator.result(time.perf_counter() - run_started, batch.summary())
+        samples = sorted(aggregator.samples, key=lambda r: r["index"])
+
+        # 历史记录只保存汇总、样本与失败结果
+        if username:
+            try:
+                log_protocol_history(
+                    username, protocol_name, get_target_info(case, global_url), params,
+                    {"aggregated": True, "summary": run_summary, "samples": samples, "failures": aggregator.failures},
+                    assertions,
+                )
+            except Exception as e:
+                logger.error(f"Failed to log history: {e}")
+
+        return jsonify({
+            "protocol_id": protocol_id,
+            "protocol_name": protocol_name,
+            "concurrency": count,
+            "mode": mode,
+            "aggregate": True,
+            "summary": run_summary,
+            "samples": samples,
+            "failures": aggregator.failures,
+        })
+
+    run_started = time.perf_counter()
+    try:
+        results = sorted(iter_results(), key=lambda r: r["index"])
+    except FeederError as e:
+        return jsonify({"error": str(e)}), 400
+    wall_time = time.perf_counter() - run_started
+
+    # 断言按规则文本编译一次，在全部结果上批量执行
+    assertion_summary = evaluate_batch(assertions, results)
 
     # 尝试记录历史
-    if session.get("username"):
+    if username:
         try:
-             # 解析目标地址用于记录
-            target_config = case.get("target_config", {})
-            call_type = (case.get("call_type") or "socket").lower()
-            if call_type == "http":
-                # 再次获取 global setting 以拼凑完整 URL (仅做展示用)
-                global_url = db.get_setting("global_target_url", GAME_SERVER)
-                rel_url = target_config.get("url", "")
-                from urllib.parse import urljoin
-                target_info = urljoin(global_url, rel_url) if not rel_url.startswith("http") else rel_url
-            else:
-                target_info = f"{target_config.get('host')}:{target_config.get('port')}"
-            
             # 记录所有结果（如果需要详细记录每一条，这里简化为只记录第一条的参数，但 result 放列表）
             # 或者按照原逻辑，这里将 results 作为 response_body 存入
             log_protocol_history(
-                session.get("username"),
+                username,
                 protocol_name,
-                target_info,
+                get_target_info(case, global_url),
                 params, 
                 results if len(results) > 1 else results[0],
                 assertions
@@ -177,10 +403,40 @@ def call_protocol(protocol_id: int):
         except Exception as e:
             logger.error(f"Failed to log history: {e}")
 
-    if concurrency == 1:
+    if count == 1:
         return jsonify(results[0])
-    else:
+    if not with_summary:
         return jsonify(results)
+    return jsonify({
+        "protocol_id": protocol_id,
+        "protocol_name": protocol_name,
+        "concurrency": count,
+        "mode": mode,
+        "results": results,
+        "summary": dict(summarize_run(results, wall_time), assertions=assertion_summary),
+    })
+
+@bp.route("/suite/run", methods=["POST"])
+def run_test_suite():
+    """
+    并发运行协议 YAML 中的 test_cases，返回逐用例的耗时与状态报告。
+    可选 protocols (ID 或名称)、cases (用例名称)、call_types 过滤，concurrency 限制并发用例数。
+    """
+    # 延迟导入：app.suite 同时作为命令行入口 (python -m app.suite)
+    from app.suite import run_suite, select_cases
+
+    payload = request.get_json(silent=True) or {}
+    selected = select_cases(payload.get("protocols"), payload.get("cases"), payload.get("call_types"))
+    if not selected:
+        return jsonify({"error": "no test cases selected"}), 400
+
+    try:
+        concurrency = payload.get("concurrency")
+        concurrency = int(concurrency) if concurrency is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    global_url = db.get_setting("global_target_url", GAME_SERVER)
+    return jsonify(run_suite(selected, global_url, concurrency))
 
 @bp.route("/login", methods=["POST"])
 def login():
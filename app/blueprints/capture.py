@@ -0,0 +1,79 @@
+import re
+from flask import Blueprint, current_app, jsonify, request
+from app.connect.capture import CAPTURE_DIR, SUFFIX, CaptureReader, capture
+
+# 创建抓包蓝图
+bp = Blueprint('capture', __name__, url_prefix='/api/capture')
+
+# 抓包文件名只允许字母、数字、- _ .，文件固定保存在 CAPTURE_DIR 下
+NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+def _multi_process_error():
+    """以多个 worker 进程运行时抓包开关只影响处理请求的进程，直接拒绝"""
+    workers = current_app.config.get("SERVER_WORKERS", 1)
+    if workers > 1:
+        return jsonify({"error": f"capture control unavailable with {workers} server workers, run with --workers 1"}), 409
+    return None
+
+
+def _capture_path(name: str):
+    if not name or not NAME_PATTERN.match(name) or name.startswith("."):
+        raise ValueError("invalid capture name")
+    return CAPTURE_DIR / (name if name.endswith(SUFFIX) else name + SUFFIX)
+
+
+@bp.route("", methods=["GET"])
+def get_capture():
+    """当前抓包状态与已有的抓包文件"""
+    files = []
+    if CAPTURE_DIR.is_dir():
+        for path in sorted(CAPTURE_DIR.glob(f"*{SUFFIX}")):
+            files.append({"name": path.name, "size": path.stat().st_size})
+    return jsonify(dict(capture.status(), files=files))
+
+
+@bp.route("/start", methods=["POST"])
+def start_capture():
+    """
+    开始记录 socket / protobuf 传输的原始请求与响应。
+    请求体可选 name (文件名)，缺省时按时间与进程号生成；同名文件在末尾追加新会话
+    """
+    error = _multi_process_error()
+    if error:
+        return error
+    payload = request.get_json(silent=True) or {}
+    try:
+        path = _capture_path(payload["name"]) if payload.get("name") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    capture.start(path)
+    return jsonify(capture.status())
+
+
+@bp.route("/stop", methods=["POST"])
+def stop_capture():
+    """停止抓包；回放使用 python -m app.replay <文件>"""
+    error = _multi_process_error()
+    if error:
+        return error
+    status = capture.status()
+    capture.stop()
+    status["active"] = False
+    return jsonify(status)
+
+
+@bp.route("/files/<name>", methods=["GET"])
+def get_capture_file(name: str):
+    """抓包文件概要：各流的协议、目标与请求/响应数"""
+    try:
+        path = _capture_path(name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not path.is_file():
+        return jsonify({"error": "capture not found"}), 404
+    try:
+        with CaptureReader(path) as reader:
+            return jsonify(reader.summary())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
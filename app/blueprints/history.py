@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import sqlite3
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app.config import DB_PATH
+from app.database import db
+from app.history import (
+    FILTER_COLUMNS, HISTORY_COLUMNS, history_writer, iter_history, query_history, row_to_dict,
+)
+
+# 创建历史记录蓝图
+bp = Blueprint('history', __name__, url_prefix='/api/history')
+
+# 列表接口单页最大条数
+MAX_PAGE_SIZE = 500
+
+def _parse_filters():
+    """从查询参数中提取过滤条件"""
+    filters = {key: request.args.get(key) for key in FILTER_COLUMNS + ("since", "until", "q")}
+    if filters.get("q") and not db.has_history_fts():
+        raise ValueError("full-text search is not available")
+    return filters
+
+@bp.route("", methods=["GET"])
+def list_history():
+    """
+    分页查询历史记录。
+    支持 username / protocol_name / target_url / since / until / q 过滤，
+    通过上一页返回的 next_cursor 获取下一页。
+    """
+    try:
+        filters = _parse_filters()
+        limit = min(max(int(request.args.get("limit", 50)), 1), MAX_PAGE_SIZE)
+        include_body = request.args.get("include_body", "0") in ("1", "true")
+        # 列表默认不返回体积较大的响应内容
+        columns = HISTORY_COLUMNS if include_body else tuple(c for c in HISTORY_COLUMNS if c != "response_body")
+        page = query_history(db.connection, filters, request.args.get("cursor"), limit, columns)
+    except (ValueError, sqlite3.OperationalError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+@bp.route("/<int:history_id>", methods=["GET"])
+def get_history(history_id: int):
+    """获取单条历史记录详情"""
+    row = db.connection.execute(
+        f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history_compat WHERE id = ?", (history_id,)
+    ).fetchone()
+    if row is None:
+        return jsonify({"error": "history not found"}), 404
+    return jsonify(row_to_dict(row))
+
+@bp.route("/export", methods=["GET"])
+def export_history():
+    """以 NDJSON (默认) 或 CSV 格式流式导出满足条件的历史记录"""
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": f"unsupported format: {fmt}"}), 400
+    try:
+        filters = _parse_filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = iter_history(DB_PATH, filters)
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(row_to_dict(row), ensure_ascii=False) + "\n"
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(HISTORY_COLUMNS)
+        for row in rows:
+            writer.writerow(tuple(row))
+            # 缓冲区达到一定大小就输出并清空，内存占用与总行数无关
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    if fmt == "csv":
+        body, mimetype = generate_csv(), "text/csv"
+    else:
+        body, mimetype = generate_ndjson(), "application/x-ndjson"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=history.{fmt}"},
+    )
+
+@bp.route("/compact", methods=["POST"])
+def compact_history():
+    """
+    立即执行一次历史保留策略。
+    请求体可覆盖 config.yaml 中 history.retention 的 retention_days / downsample_after_days / downsample_keep_every
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        options = {
+            key: float(data[key]) for key in ("retention_days", "downsample_after_days") if key in data
+        }
+        if "downsample_keep_every" in data:
+            options["downsample_keep_every"] = int(data["downsample_keep_every"])
+        result = history_writer.compact(**options)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@bp.route("/stats", methods=["GET"])
+def get_history_stats():
+    """获取历史记录写入队列的深度、写入数与丢弃数，以及紧凑存储的占用情况"""
+    data = history_writer.stats()
+    row = db.connection.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM history_blobs"
+    ).fetchone()
+    data["storage"] = {
+        "result_rows": db.connection.execute("SELECT COUNT(*) FROM history_results").fetchone()[0],
+        "blobs": row[0],
+        "blob_raw_bytes": row[1],
+        "blob_stored_bytes": row[2],
+    }
+    return jsonify(data)
@@ -0,0 +1,108 @@
+from flask import Blueprint, current_app, jsonify, request, session
+from app.config import GAME_SERVER, JOBS_CONFIG
+from app.database import db
+from app.jobs import LoadJob, job_manager, parse_stages
+from app.registry import registry
+
+# 创建负载任务蓝图
+bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+# 单个任务同时在途调用数的默认值与上限
+DEFAULT_MAX_IN_FLIGHT = int(JOBS_CONFIG.get("max_in_flight", 64))
+MAX_IN_FLIGHT_LIMIT = int(JOBS_CONFIG.get("max_in_flight_limit", 1024))
+
+
+def _get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return None, (jsonify({"error": "job not found"}), 404)
+    return job, None
+
+
+@bp.route("", methods=["POST"])
+def start_job():
+    """
+    启动后台负载任务。
+    请求体：protocol_id, params, assertions, max_in_flight, feed，
+    以及 rate + duration (+ ramp_up) 或 stages: [{"duration": 秒, "rate": 每秒请求数}, ...]；
+    workers 大于 1 时按速率均分到多个工作进程运行
+    """
+    workers = current_app.config.get("SERVER_WORKERS", 1)
+    if workers > 1:
+        # 任务只保存在启动它的进程中，后续查询与停止可能被分发到其他进程
+        return jsonify({"error": f"load jobs unavailable with {workers} server workers, run with --workers 1"}), 409
+    payload = request.get_json(silent=True) or {}
+    try:
+        case = registry.get(int(payload.get("protocol_id")))
+    except (TypeError, ValueError):
+        return jsonify({"error": "protocol_id is required"}), 400
+    if not case:
+        return jsonify({"error": "protocol not found"}), 404
+
+    try:
+        stages = parse_stages(payload)
+        max_in_flight = min(int(payload.get("max_in_flight") or DEFAULT_MAX_IN_FLIGHT), MAX_IN_FLIGHT_LIMIT)
+        workers = int(payload.get("workers") or 1)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    job_class, options = LoadJob, {}
+    if workers > 1:
+        # 延迟导入：app.workers 同时作为命令行入口 (python -m app.workers)
+        from app.workers import DistributedLoadJob
+        job_class, options = DistributedLoadJob, {"processes": workers}
+    try:
+        job = job_class(
+            case,
+            payload.get("params", {}),
+            stages,
+            global_url=db.get_setting("global_target_url", GAME_SERVER),
+            assertions=payload.get("assertions"),
+            max_in_flight=max_in_flight,
+            max_queue=int(JOBS_CONFIG.get("max_queue", 10000)),
+            username=session.get("username"),
+            feed=payload.get("feed"),
+            **options,
+        )
+    except ValueError as e:
+        # 参数生成规则不合法
+        return jsonify({"error": str(e)}), 400
+    try:
+        job_manager.start(job)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job.status()), 201
+
+
+@bp.route("", methods=["GET"])
+def list_jobs():
+    """任务列表 (最近的在前)"""
+    return jsonify([job.status() for job in reversed(job_manager.list())])
+
+
+@bp.route("/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    """任务实时进度"""
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    return jsonify(job.status())
+
+
+@bp.route("/<job_id>/stop", methods=["POST"])
+def stop_job(job_id: str):
+    """停止任务：不再发送新的调用，等待执行中的调用结束"""
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    job.stop()
+    return jsonify(job.status())
+
+
+@bp.route("/<job_id>/results", methods=["GET"])
+def get_job_results(job_id: str):
+    """任务结果汇总；运行中返回截至当前的部分结果"""
+    job, error = _get_job(job_id)
+    if error:
+        return error
+    return jsonify(job.results())
@@ -0,0 +1,26 @@
+from flask import Blueprint, Response
+from app.connect import get_pool_stats
+from app.history import history_writer
+from app.metrics import metrics
+
+# 创建指标蓝图 (Prometheus 抓取路径为 /metrics，不带 /api 前缀)
+bp = Blueprint('metrics', __name__)
+
+# Prometheus 文本格式的 Content-Type
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _runtime_gauges():
+    """连接池与历史写入队列的计数，以 gauge 形式附加在调用指标之后"""
+    for transport, stats in get_pool_stats().items():
+        for key, value in stats.items():
+            yield f"connection_pool_{key}", "gauge", {"transport": transport}, value
+    for key, value in history_writer.stats().items():
+        if isinstance(value, (int, float)):
+            yield f"history_writer_{key}", "gauge", {}, int(value)
+
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """按协议名与 call_type 统计的调用数、错误数与耗时直方图 (Prometheus 文本格式)"""
+    return Response(metrics.render(_runtime_gauges()), content_type=PROMETHEUS_MIMETYPE)
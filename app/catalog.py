@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from app.config import CATALOG_CONFIG
+from app.registry import TestCaseRegistry, registry
+
+# 响应体不小于该字节数且客户端接受 gzip 时压缩发送
+GZIP_MIN_SIZE = int(CATALOG_CONFIG.get("gzip_min_size", 1024))
+GZIP_LEVEL = int(CATALOG_CONFIG.get("gzip_level", 6))
+# 缓存的响应变体 (接口 + 分页 + 字段组合) 数上限，超出后淘汰最久未使用的
+MAX_ENTRIES = int(CATALOG_CONFIG.get("max_entries", 256))
+
+# 用例可选择返回的字段 (/api/doc?fields=...)
+CASE_FIELDS = (
+    "id", "name", "description", "params", "sample_return", "assertions",
+    "call_type", "target_config", "test_cases", "file_source",
+)
+
+
+class CachedBody:
+    """一个响应变体的序列化结果；gzip 版本在首次需要时压缩一次"""
+
+    __slots__ = ("body", "_gzipped", "_lock")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._gzipped: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            with self._lock:
+                if self._gzipped is None:
+                    self._gzipped = gzip.compress(self.body, GZIP_LEVEL, mtime=0)
+        return self._gzipped
+
+
+class CatalogCache:
+    """
+    协议目录接口 (/api/protocols、/api/protocol/<id>、/api/doc) 的响应缓存。
+
+    ETag 由用例集合的版本与响应变体的键计算，不需要生成响应体即可判断 If-None-Match；
+    序列化后的响应体按变体缓存，用例集合版本变化时整体失效。
+    """
+
+    def __init__(self, source: TestCaseRegistry = registry, max_entries: int = MAX_ENTRIES):
+        self.source = source
+        self.max_entries = max_entries
+        self._version: Optional[str] = None
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "gzip": 0, "invalidations": 0}
+
+    def snapshot(self) -> Tuple[str, List[Dict[str, Any]]]:
+        """当前的 (用例集合版本, 全部用例)"""
+        return self.source.versioned()
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def etag(version: str, key: Hashable, encoding: Optional[str] = None) -> str:
+        """强 ETag (不含引号)：同一版本、同一变体、同一内容编码的响应字节完全相同"""
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+        return f"{version}-{digest}" + (f"-{encoding}" if encoding else "")
+
+    def get(self, version: str, key: Hashable, build: Callable[[], bytes]) -> CachedBody:
+        """取出变体的响应体，未缓存时调用 build 生成"""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self._stats["invalidations"] += 1
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+
+        entry = CachedBody(build())
+        with self._lock:
+            # 生成期间版本未变化时才放入缓存
+            if version == self._version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._entries)
+            data["version"] = self._version
+        return data
+
+
+def select_fields(case: Dict[str, Any], fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    """按字段列表裁剪用例 (id 总会返回)"""
+    if not fields:
+        return case
+    return {key: case[key] for key in ("id",) + fields if key in case}
+
+
+# 模块级单例
+catalog_cache = CatalogCache()
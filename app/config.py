@@ -28,6 +28,42 @@ SECRET_KEY = APP_CONFIG.get("secret_key", "dev-secret-key")
 TITLE = APP_CONFIG.get("title", "协议测试平台")
 GAME_SERVER = APP_CONFIG.get("game_server", "http://game_backend.com")
 
+# 生产服务配置 (python -m app.serve)
+SERVER_CONFIG = _config_data.get("server", {})
+
+# HTTP 连接池配置
+HTTP_CONFIG = _config_data.get("http", {})
+
+# TCP 持久连接池配置 (protobuf / socket 传输)
+TCP_CONFIG = _config_data.get("tcp", {})
+
+# 历史记录异步写入配置
+HISTORY_CONFIG = _config_data.get("history", {})
+
+# 调用指标 (/metrics) 配置
+METRICS_CONFIG = _config_data.get("metrics", {})
+
+# 协议目录接口的响应缓存配置
+CATALOG_CONFIG = _config_data.get("catalog", {})
+
+# 后台负载任务配置
+JOBS_CONFIG = _config_data.get("jobs", {})
+
+# 多进程负载任务配置
+WORKERS_CONFIG = _config_data.get("workers", {})
+
+# 参数生成配置
+FEEDER_CONFIG = _config_data.get("feeder", {})
+
+# 传输层抓包与回放配置
+CAPTURE_CONFIG = _config_data.get("capture", {})
+
+# 汇总模式 (只返回统计与有限样本) 配置
+AGGREGATE_CONFIG = _config_data.get("aggregate", {})
+
+# mock 后端默认配置 (python -m app.mock_server)
+MOCK_CONFIG = _config_data.get("mock", {})
+
 def get_raw_config():
     """获取完整配置字典"""
     return _config_data
@@ -1,46 +1,74 @@
+import sys
 import json
-from datetime import datetime
+import time
+import asyncio
+from functools import lru_cache
 from urllib.parse import urljoin
-from typing import Dict, Any, Type, Optional
+from typing import Callable, Dict, Any, List, Optional
+from loguru import logger
 from app.database import db
+from app.history import history_writer
 from app.config import GAME_SERVER
+from app.metrics import PhaseTimer, activate_timer, deactivate_timer, metrics
 from .base import BaseProtocolHandler
-from .http import HttpProtocolHandler
-from .socket import SocketProtocolHandler
-from .protobuf import ProtobufProtocolHandler
+from .capture import capture
+from .handlers import BUILTIN_HANDLERS, HandlerRegistry
+from .pool import tcp_pool
 
 from enum import Enum
 
 class CallType(str, Enum):
+    """内置的 call_type (插件注册的 call_type 以普通字符串表示)"""
     HTTP = "http"
     SOCKET = "socket"
     PROTOBUF = "protobuf"
 
-# 协议处理器注册表
-HANDLER_REGISTRY: Dict[CallType, Type[BaseProtocolHandler]] = {
-    CallType.HTTP: HttpProtocolHandler,
-    CallType.SOCKET: SocketProtocolHandler,
-    CallType.PROTOBUF: ProtobufProtocolHandler,
-}
+# 协议处理器注册表 (处理器模块在首次使用时导入，第三方传输通过 entry point 注册)
+HANDLER_REGISTRY = HandlerRegistry(BUILTIN_HANDLERS)
 
-def get_handler(call_type: CallType) -> BaseProtocolHandler:
+def get_handler(call_type: str) -> BaseProtocolHandler:
     """工厂方法：根据类型获取处理器实例"""
-    handler_class = HANDLER_REGISTRY.get(call_type)
-    if not handler_class:
+    try:
+        handler_class = HANDLER_REGISTRY[call_type]
+    except KeyError:
         raise ValueError(f"Unknown call_type: {call_type}")
     return handler_class()
 
-def execute_protocol(protocol_row: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+def get_pool_stats() -> Dict[str, Any]:
+    """返回各传输层连接池的命中/未命中计数 (HTTP 处理器未加载时不含 http)"""
+    stats = {}
+    http = sys.modules.get(f"{__name__}.http")
+    if http is not None:
+        stats["http"] = http.session_pool.stats()
+    stats["tcp"] = tcp_pool.stats()
+    return stats
+
+def close_pools():
+    """关闭所有传输层连接池 (进程退出时也会自动调用)"""
+    http = sys.modules.get(f"{__name__}.http")
+    if http is not None:
+        http.session_pool.close_all()
+    tcp_pool.close_all()
+
+@lru_cache(maxsize=1024)
+def resolve_url(global_url: str, relative_url: str) -> str:
     """
-    统一入口函数，用于向下兼容旧的调用方式
+    将相对 url 拼接到全局目标地址上 (绝对地址原样返回)。
+    按 (全局地址, 相对地址) 缓存，全局地址变更后自然使用新的键。
+    """
+    # 如果是相对路径或为空，则拼接全局 URL
+    if relative_url.lower().startswith(("http://", "https://")):
+        return relative_url
+    # urljoin 处理 path 拼接很智能
+    # 比如 base="http://a.com/api", path="/login" -> "http://a.com/login"
+    # 比如 base="http://a.com/api/", path="login" -> "http://a.com/api/login"
+    return urljoin(global_url, relative_url)
+
+def resolve_target_config(protocol_row: Dict[str, Any], global_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    解析协议的目标配置，并将相对 url 拼接到全局目标地址上。
+    :param global_url: 预先读取的全局目标地址；为空时读取设置缓存。
     """
-    raw_call_type = (protocol_row.get("call_type") or "socket").lower()
-    try:
-        call_type = CallType(raw_call_type)
-    except ValueError:
-        return {"error": f"Unknown or unsupported call_type: {raw_call_type}"}
-    
-    # 解析目标配置
     # 兼容处理：如果已经是 dict 则直接使用，如果是 json 字符串则解析
     t_config = protocol_row.get("target_config")
     t_config_json = protocol_row.get("target_config_json")
@@ -53,14 +81,59 @@ def execute_protocol(protocol_row: Dict[str, Any], params: Dict[str, Any]) -> Di
     config = target_config.copy()
 
     # 处理全局 URL
-    global_url = db.get_setting("global_target_url", GAME_SERVER)
-    relative_url = config.get("url", "")
-    # 如果是相对路径或为空，则拼接全局 URL
-    if not relative_url.lower().startswith(("http://", "https://")):
-        # urljoin 处理 path 拼接很智能
-        # 比如 base="http://a.com/api", path="/login" -> "http://a.com/login"
-        # 比如 base="http://a.com/api/", path="login" -> "http://a.com/api/login"
-        config["url"] = urljoin(global_url, relative_url)
+    if global_url is None:
+        global_url = db.get_setting("global_target_url", GAME_SERVER)
+    config["url"] = resolve_url(global_url, config.get("url", ""))
+    if capture.active:
+        # 抓包记录中的流以协议名区分
+        config["_protocol_name"] = protocol_row.get("name", "")
+    return config
+
+def _parse_call_type(protocol_row: Dict[str, Any]) -> str:
+    raw_call_type = (protocol_row.get("call_type") or "socket").lower()
+    if raw_call_type not in HANDLER_REGISTRY:
+        raise ValueError(f"Unknown or unsupported call_type: {raw_call_type}")
+    return raw_call_type
+
+def _observe(protocol_row: Dict[str, Any], seconds: float, result: Any, timer: Optional[PhaseTimer] = None):
+    """记录一次调用的指标 (按协议名与 call_type 分组)"""
+    metrics.observe_call(
+        protocol_row.get("name") or str(protocol_row.get("id", "")),
+        (protocol_row.get("call_type") or "socket").lower(),
+        seconds, is_error_response(result), timer,
+    )
+
+def execute_protocol(
+    protocol_row: Dict[str, Any],
+    params: Dict[str, Any],
+    global_url: Optional[str] = None,
+    timer: Optional[PhaseTimer] = None
+) -> Dict[str, Any]:
+    """
+    统一入口函数，用于向下兼容旧的调用方式
+    :param global_url: 预先读取的全局目标地址；为空时读取设置缓存。
+    :param timer: 传入时记录本次调用各阶段 (connect / encode / send / wait / read / decode) 的耗时
+    """
+    if not metrics.enabled and timer is None:
+        return _execute(protocol_row, params, global_url)
+
+    token = activate_timer(timer) if timer is not None else None
+    started = time.perf_counter()
+    try:
+        result = _execute(protocol_row, params, global_url)
+    finally:
+        if token is not None:
+            deactivate_timer(token)
+    _observe(protocol_row, time.perf_counter() - started, result, timer)
+    return result
+
+def _execute(protocol_row: Dict[str, Any], params: Dict[str, Any], global_url: Optional[str]) -> Dict[str, Any]:
+    try:
+        call_type = _parse_call_type(protocol_row)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    config = resolve_target_config(protocol_row, global_url)
     
     try:
         handler = get_handler(call_type)
@@ -68,6 +141,122 @@ def execute_protocol(protocol_row: Dict[str, Any], params: Dict[str, Any]) -> Di
     except Exception as e:
         return {"error": str(e)}
 
+def prepare_protocol_params(
+    protocol_row: Dict[str, Any],
+    params: Dict[str, Any],
+    global_url: Optional[str] = None
+) -> Any:
+    """
+    预处理需要重复发送的固定参数 (如 protobuf 预编码)，返回值可代替 params 传给 execute_protocol。
+    预处理失败时原样返回 params，由实际调用报告错误。
+    """
+    try:
+        call_type = _parse_call_type(protocol_row)
+        config = resolve_target_config(protocol_row, global_url)
+        return get_handler(call_type).prepare(config, params)
+    except Exception:
+        return params
+
+def execute_protocol_pipelined(
+    protocol_row: Dict[str, Any],
+    params_list: List[Dict[str, Any]],
+    global_url: Optional[str] = None,
+    timings: Optional[List] = None,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    """
+    在一条持久连接上流水线执行多次调用 (目前仅 protobuf 传输支持)。
+    中途失败时已收到的响应保留，其余位置都返回同一个 {"error": ...}。
+    :param timings: 传入列表时，按顺序追加每个请求的 (发送时刻, 收到响应时刻) perf_counter 值
+    :param on_result: 按顺序对每个位置的结果 (包括失败的位置) 调用一次，用于边收边处理
+    """
+    started = time.perf_counter()
+    received: List[Dict[str, Any]] = []
+
+    def deliver(result: Dict[str, Any]):
+        received.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    try:
+        call_type = _parse_call_type(protocol_row)
+        if call_type != CallType.PROTOBUF:
+            raise ValueError(f"Pipelining is not supported for call_type: {call_type}")
+        config = resolve_target_config(protocol_row, global_url)
+        if metrics.enabled and timings is None:
+            timings = []
+        results = get_handler(call_type).execute_pipelined(config, params_list, timings=timings, on_result=deliver)
+    except Exception as e:
+        for _ in params_list[len(received):]:
+            deliver({"error": str(e)})
+        results = received
+    if metrics.enabled:
+        # 每个请求按各自的 (发送, 收到响应) 时刻记录；整批失败时按整批耗时记录
+        ended = time.perf_counter()
+        for i, result in enumerate(results):
+            sent_at, received_at = timings[i] if timings and i < len(timings) else (started, ended)
+            _observe(protocol_row, received_at - sent_at, result)
+    return results
+
+async def execute_protocol_async(
+    protocol_row: Dict[str, Any],
+    params: Dict[str, Any],
+    global_url: Optional[str] = None,
+    timer: Optional[PhaseTimer] = None
+) -> Dict[str, Any]:
+    """execute_protocol 的异步版本，在事件循环中执行，不占用线程"""
+    if not metrics.enabled and timer is None:
+        return await _execute_async(protocol_row, params, global_url)
+
+    # 每个 asyncio 任务拥有独立的上下文，计时器不会串到并发的其他调用上
+    token = activate_timer(timer) if timer is not None else None
+    started = time.perf_counter()
+    try:
+        result = await _execute_async(protocol_row, params, global_url)
+    finally:
+        if token is not None:
+            deactivate_timer(token)
+    _observe(protocol_row, time.perf_counter() - started, result, timer)
+    return result
+
+async def _execute_async(protocol_row: Dict[str, Any], params: Dict[str, Any], global_url: Optional[str]) -> Dict[str, Any]:
+    try:
+        call_type = _parse_call_type(protocol_row)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    config = resolve_target_config(protocol_row, global_url)
+
+    try:
+        handler = get_handler(call_type)
+        return await handler.execute_async(config, params)
+    except Exception as e:
+        return {"error": str(e)}
+
+async def execute_many_async(
+    protocol_row: Dict[str, Any],
+    params_list: List[Dict[str, Any]],
+    global_url: Optional[str] = None,
+    limit: int = 1000
+) -> List[Dict[str, Any]]:
+    """
+    在同一事件循环中并发执行多次调用，按 params_list 顺序返回结果。
+    :param limit: 同时在途的最大调用数
+    """
+    if global_url is None:
+        global_url = db.get_setting("global_target_url", GAME_SERVER)
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run_one(params: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await execute_protocol_async(protocol_row, params, global_url)
+
+    return await asyncio.gather(*(run_one(p) for p in params_list))
+
+def is_error_response(response: Any) -> bool:
+    """判断 execute_protocol 的返回值是否为调用失败 ({"error": ...})"""
+    return isinstance(response, dict) and len(response) == 1 and "error" in response
+
 def log_protocol_history(
     username: str,
     protocol_name: str,
@@ -78,29 +267,8 @@ def log_protocol_history(
 ):
     """
     记录协议测试历史到数据库。
+    记录先进入内存队列，由后台线程批量写入，调用方无需等待数据库写入完成。
     """
-    try:
-        conn = db.connection
-        conn.execute(
-            """
-            INSERT INTO history (
-                username, action, protocol_name, target_url, 
-                request_body, response_body, assertions, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                username, 
-                "test_protocol", 
-                protocol_name, 
-                target_url,
-                json.dumps(request_params, ensure_ascii=False) if not isinstance(request_params, str) else request_params,
-                json.dumps(response_data, ensure_ascii=False) if not isinstance(response_data, str) else response_data,
-                json.dumps(assertions, ensure_ascii=False) if assertions and not isinstance(assertions, str) else (assertions or "[]"),
-                datetime.utcnow().isoformat() + "Z"
-            ),
-        )
-        conn.commit()
-    except Exception as e:
+    if not history_writer.submit(username, protocol_name, target_url, request_params, response_data, assertions):
         # 避免日志记录失败影响主流程，仅打印错误
-        print(f"Failed to log history: {e}")
-
+        logger.warning("History queue is full, dropping record")
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any, Dict
 
@@ -13,3 +14,17 @@ class BaseProtocolHandler(ABC):
         :return: 调用结果字典
         """
         pass
+
+    async def execute_async(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        异步执行协议调用。
+        默认实现将同步的 execute 放到线程中执行，子类可覆盖为原生 asyncio 实现。
+        """
+        return await asyncio.to_thread(self.execute, config, params)
+
+    def prepare(self, config: Dict[str, Any], params: Dict[str, Any]) -> Any:
+        """
+        预处理一组需要重复发送的固定参数，返回值可代替 params 多次传给 execute。
+        默认原样返回，二进制协议可在此预先编码。
+        """
+        return params
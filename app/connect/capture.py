@@ -0,0 +1,252 @@
+import os
+import json
+import mmap
+import time
+import atexit
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Tuple
+from loguru import logger
+from app.config import BASE_DIR, CAPTURE_CONFIG
+
+# 抓包文件格式 (追加写入，单条记录自描述，进程中途退出时只会截断最后一条记录)：
+#   文件头: MAGIC
+#   记录:   RECORD 头 (类型, 流编号, 序号, 时间戳, 内容长度) + 内容
+# 内容为不含分帧字节 (长度前缀 / 换行符) 的消息本身，分帧方式记录在流定义中。
+MAGIC = b"PTCAP\x00\x01\n"
+RECORD = struct.Struct("<BHIdI")
+
+# 记录类型
+SESSION = 0   # 一次抓包会话的开始，之后的流编号与序号重新计数；内容为 JSON
+STREAM = 1    # 流定义 (协议名、传输、目标地址、分帧方式等)；内容为 JSON
+REQUEST = 2   # 发出的请求
+RESPONSE = 3  # 收到的响应，序号与对应请求相同
+ERROR = 4     # 请求未收到响应 (连接断开、超时等)；内容为错误信息
+
+# 抓包文件目录与写缓冲区
+CAPTURE_DIR = BASE_DIR / CAPTURE_CONFIG.get("dir", "logs/captures")
+BUFFER_SIZE = int(CAPTURE_CONFIG.get("buffer_size", 1024 * 1024))
+# 缓冲数据最迟在该时长 (秒) 后写入文件
+FLUSH_INTERVAL = float(CAPTURE_CONFIG.get("flush_interval", 1))
+# 抓包文件扩展名
+SUFFIX = ".ptcap"
+
+
+class Record(NamedTuple):
+    kind: int
+    stream: int
+    seq: int
+    ts: float
+    data: memoryview
+
+
+class CaptureWriter:
+    """
+    把 socket / protobuf 传输上收发的原始消息追加写入抓包文件。
+
+    未开启时处理器只检查一次 active，不产生额外开销；
+    开启后每条记录在锁内写入带缓冲的文件，缓冲区满或超过 FLUSH_INTERVAL 时落盘。
+    """
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.active = False
+        self.path: Optional[Path] = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._streams: Dict[Tuple, int] = {}
+        self._seq = 0
+        self._last_flush = 0.0
+        self._stats = {"requests": 0, "responses": 0, "errors": 0, "bytes": 0}
+
+    def start(self, path: Optional[Path] = None) -> Path:
+        """开始抓包；path 为空时在 CAPTURE_DIR 下按时间与进程号生成文件名。已存在的文件在末尾追加新会话"""
+        if path is None:
+            path = CAPTURE_DIR / f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{SUFFIX}"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._close()
+            self._file = open(path, "ab", buffering=self.buffer_size)
+            if self._file.tell() == 0:
+                self._file.write(MAGIC)
+            self.path = path
+            self._streams = {}
+            self._seq = 0
+            self._stats = dict.fromkeys(self._stats, 0)
+            self._write(SESSION, 0, 0, json.dumps({"pid": os.getpid(), "started_at": time.time()}).encode("utf-8"))
+            self._last_flush = time.monotonic()
+            self.active = True
+        logger.info(f"Capture started: {path}")
+        return path
+
+    def stop(self) -> Optional[Path]:
+        """停止抓包并关闭文件，返回文件路径"""
+        with self._lock:
+            path = self.path if self.active else None
+            self.active = False
+            self._close()
+        if path:
+            logger.info(f"Capture stopped: {path}")
+        return path
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stream(self, config: Dict[str, Any], call_type: str, framing: str) -> int:
+        """返回调用对应的流编号，首次出现时写入流定义"""
+        key = (
+            config.get("_protocol_name", ""), call_type, config.get("host"), int(config.get("port") or 0), framing,
+            config.get("proto_module"), config.get("request_class"), config.get("response_class"),
+        )
+        stream = self._streams.get(key)
+        if stream is not None:
+            return stream
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None and self._file is not None:
+                stream = len(self._streams) + 1
+                meta = dict(zip(
+                    ("protocol", "call_type", "host", "port", "framing", "proto_module", "request_class", "response_class"),
+                    key,
+                ))
+                meta["raw_decode"] = bool(config.get("raw_decode", False))
+                self._write(STREAM, stream, 0, json.dumps(meta).encode("utf-8"))
+                self._streams[key] = stream
+        return stream or 0
+
+    def request(self, stream: int, data) -> int:
+        """记录一个请求，返回其序号 (对应的响应使用同一序号)"""
+        with self._lock:
+            self._seq += 1
+            self._stats["requests"] += 1
+            self._write(REQUEST, stream, self._seq, data)
+            return self._seq
+
+    def response(self, stream: int, seq: int, data):
+        with self._lock:
+            self._stats["responses"] += 1
+            self._write(RESPONSE, stream, seq, data)
+
+    def error(self, stream: int, seq: int, message: str):
+        with self._lock:
+            self._stats["errors"] += 1
+            self._write(ERROR, stream, seq, message.encode("utf-8", "replace"))
+
+    def _write(self, kind: int, stream: int, seq: int, data):
+        """写入一条记录 (调用方持有锁)；data 可为 bytes 或 memoryview，写入缓冲区时即完成复制"""
+        if self._file is None:
+            return
+        self._file.write(RECORD.pack(kind, stream, seq, time.time(), len(data)))
+        self._file.write(data)
+        self._stats["bytes"] += RECORD.size + len(data)
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._file.flush()
+            self._last_flush = now
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["active"] = self.active
+            data["path"] = str(self.path) if self.path else None
+            data["streams"] = len(self._streams)
+        return data
+
+
+class CaptureReader:
+    """
+    以内存映射方式顺序读取抓包文件，记录内容为指向映射区域的 memoryview，不会把整个文件读入内存。
+    文件末尾不完整的记录 (抓包进程异常退出) 会被忽略，并设置 truncated。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.truncated = False
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC):
+            self._file.close()
+            raise ValueError(f"not a capture file: {self.path}")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if self._view[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"not a capture file: {self.path}")
+
+    def __iter__(self) -> Iterator[Record]:
+        view = self._view
+        size = len(view)
+        offset = len(MAGIC)
+        while offset + RECORD.size <= size:
+            kind, stream, seq, ts, length = RECORD.unpack_from(view, offset)
+            start = offset + RECORD.size
+            if start + length > size:
+                break
+            yield Record(kind, stream, seq, ts, view[start:start + length])
+            offset = start + length
+        self.truncated = offset != size
+
+    def summary(self) -> Dict[str, Any]:
+        """统计各流的请求/响应数与时间范围"""
+        sessions = 0
+        streams: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        first = last = None
+        for record in self:
+            if record.kind == SESSION:
+                sessions += 1
+                continue
+            if record.kind == STREAM:
+                meta = json.loads(str(record.data, "utf-8"))
+                streams[(sessions, record.stream)] = dict(meta, requests=0, responses=0, errors=0)
+                continue
+            stats = streams.get((sessions, record.stream))
+            if stats is None:
+                continue
+            if record.kind == REQUEST:
+                stats["requests"] += 1
+                first = record.ts if first is None else first
+                last = record.ts
+            elif record.kind == RESPONSE:
+                stats["responses"] += 1
+            elif record.kind == ERROR:
+                stats["errors"] += 1
+        return {
+            "path": str(self.path),
+            "size": len(self._view),
+            "sessions": sessions,
+            "duration_s": round(last - first, 3) if first is not None else 0,
+            "truncated": self.truncated,
+            "streams": list(streams.values()),
+        }
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有记录内容的视图被外部持有，映射在这些视图释放后由 GC 关闭
+            pass
+        self._file.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 进程级抓包写入器；配置中开启时启动即抓包 (文件名含进程号，多进程任务的各工作进程各写一个文件)
+capture = CaptureWriter()
+if CAPTURE_CONFIG.get("enabled"):
+    capture.start()
+atexit.register(capture.stop)
@@ -0,0 +1,176 @@
+import base64
+import typing
+import importlib
+import dataclasses
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+from google.protobuf import json_format
+
+
+class EncodedRequest:
+    """
+    预先编码好的请求体。
+    同一组参数需要发送很多次时，先编码一次再交给处理器，避免每次调用重复序列化。
+    """
+
+    __slots__ = ("data", "params")
+
+    def __init__(self, data: bytes, params: Dict[str, Any]):
+        self.data = data
+        self.params = params
+
+
+@lru_cache(maxsize=None)
+def _dataclass_field_names(cls) -> Tuple[str, ...]:
+    return tuple(f.name for f in dataclasses.fields(cls))
+
+
+@lru_cache(maxsize=None)
+def _dataclass_hints(cls) -> Dict[str, Any]:
+    try:
+        return typing.get_type_hints(cls)
+    except Exception:
+        return {}
+
+
+def _find_dataclass(tp: Any) -> Optional[type]:
+    """在类型注解 (Optional[X]、List[X] 等) 中查找消息 dataclass"""
+    if isinstance(tp, type) and dataclasses.is_dataclass(tp):
+        return tp
+    for arg in typing.get_args(tp):
+        found = _find_dataclass(arg)
+        if found is not None:
+            return found
+    return None
+
+
+def _coerce(tp: Any, value: Any) -> Any:
+    if isinstance(value, dict):
+        target = _find_dataclass(tp)
+        if target is not None:
+            return _build_dataclass(target, value)
+    elif isinstance(value, list):
+        target = _find_dataclass(tp)
+        if target is not None:
+            return [_build_dataclass(target, v) if isinstance(v, dict) else v for v in value]
+    return value
+
+
+def _build_dataclass(cls, data: Dict[str, Any]) -> Any:
+    """
+    字典转 pure-protobuf 消息。
+    忽略不在 dataclass 字段中的键，嵌套消息字段的字典递归构造为对应的消息对象。
+    """
+    hints = _dataclass_hints(cls)
+    return cls(**{
+        name: _coerce(hints.get(name), data[name])
+        for name in _dataclass_field_names(cls) if name in data
+    })
+
+
+def _bytes_to_text(value: Any) -> Any:
+    """bytes 字段转为 base64 字符串 (与 json_format 的映射一致)，结果可直接序列化为 JSON"""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    return value
+
+
+def _dataclass_to_dict(obj: Any) -> Any:
+    """
+    pure-protobuf 消息转字典。
+    与 dataclasses.asdict 结果相同，但使用缓存的字段列表且不对标量做深拷贝；bytes 字段转为 base64 字符串。
+    """
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {name: _dataclass_to_dict(getattr(obj, name)) for name in _dataclass_field_names(type(obj))}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_dataclass_to_dict(v) for v in obj)
+    if isinstance(obj, dict):
+        return {k: _dataclass_to_dict(v) for k, v in obj.items()}
+    return _bytes_to_text(obj)
+
+
+def _is_repeated(field) -> bool:
+    is_repeated = getattr(field, "is_repeated", None)
+    if is_repeated is not None:
+        return is_repeated
+    return field.label == field.LABEL_REPEATED
+
+
+def _message_to_dict(message) -> Dict[str, Any]:
+    """
+    google.protobuf 消息直接按已设置字段转字典 (raw 模式)。
+    不经过 JSON 映射：枚举保留整数值，int64 保留 int；bytes 仍转为 base64 字符串，保证结果可以序列化为 JSON。
+    """
+    result = {}
+    for field, value in message.ListFields():
+        if field.message_type is not None:
+            if field.message_type.GetOptions().map_entry:
+                value = {k: _message_to_dict(v) if hasattr(v, "ListFields") else _bytes_to_text(v) for k, v in value.items()}
+            elif _is_repeated(field):
+                value = [_message_to_dict(v) for v in value]
+            else:
+                value = _message_to_dict(value)
+        elif field.type == field.TYPE_BYTES:
+            value = [_bytes_to_text(v) for v in value] if _is_repeated(field) else _bytes_to_text(value)
+        elif _is_repeated(field):
+            value = list(value)
+        result[field.name] = value
+    return result
+
+
+class ProtoCodec:
+    """
+    请求/响应消息的编解码器。
+    类的解析、字段集合等只在创建时计算一次，通过 get_codec 按配置缓存复用。
+    """
+
+    def __init__(self, module_name: str, request_class: str, response_class: str):
+        # 动态加载模块和类
+        module = importlib.import_module(module_name)
+        self.request_class = getattr(module, request_class)
+        self.response_class = getattr(module, response_class)
+        # 判断是否为 pure-protobuf (使用 dataclass)
+        self.is_pure = dataclasses.is_dataclass(self.request_class)
+
+    def _encode(self, message_class, data: Dict[str, Any]) -> bytes:
+        if self.is_pure:
+            # === Pure Python Mode ===
+            # 过滤掉不在 dataclass 字段中的参数，防止 __init__ 报错
+            return _build_dataclass(message_class, data).dumps()
+        # === Standard Google Protobuf Mode ===
+        obj = message_class()
+        json_format.ParseDict(data, obj, ignore_unknown_fields=True)
+        return obj.SerializeToString()
+
+    def encode(self, params: Dict[str, Any]) -> bytes:
+        """将参数字典编码为请求消息字节"""
+        return self._encode(self.request_class, params)
+
+    def encode_response(self, data: Dict[str, Any]) -> bytes:
+        """将字典编码为响应消息字节 (mock 服务端使用)"""
+        return self._encode(self.response_class, data)
+
+    def pre_encode(self, params: Dict[str, Any]) -> EncodedRequest:
+        """预编码一组固定参数"""
+        return EncodedRequest(self.encode(params), params)
+
+    def decode(self, data, raw: bool = False) -> Dict[str, Any]:
+        """
+        解码响应消息 (data 可以是 bytes 或 memoryview)。
+        :param raw: google.protobuf 消息直接返回字段值，不经过 JSON 映射
+        """
+        if self.is_pure:
+            # === Pure Python Mode ===
+            return _dataclass_to_dict(self.response_class.loads(data))
+        # === Standard Google Protobuf Mode ===
+        res_obj = self.response_class()
+        res_obj.ParseFromString(data)
+        if raw:
+            return _message_to_dict(res_obj)
+        return json_format.MessageToDict(res_obj, preserving_proto_field_name=True)
+
+
+@lru_cache(maxsize=256)
+def get_codec(module_name: str, request_class: str, response_class: str) -> ProtoCodec:
+    """按 (proto_module, request_class, response_class) 缓存编解码器"""
+    return ProtoCodec(module_name, request_class, response_class)
@@ -0,0 +1,108 @@
+import importlib
+import threading
+from collections.abc import Mapping
+from importlib import metadata
+from typing import Dict, Iterator, Optional, Type, Union
+from loguru import logger
+from .base import BaseProtocolHandler
+
+# 第三方传输通过该 entry point 组注册处理器，名称即 call_type，例如 (插件包的 pyproject.toml)：
+#   [project.entry-points."protocol_test.handlers"]
+#   websocket = "my_plugin.ws:WebSocketProtocolHandler"
+ENTRY_POINT_GROUP = "protocol_test.handlers"
+
+# 内置处理器；模块在首次调用对应 call_type 时才导入 (http 依赖 requests / aiohttp，protobuf 依赖 google.protobuf)
+BUILTIN_HANDLERS: Dict[str, str] = {
+    "http": "app.connect.http:HttpProtocolHandler",
+    "socket": "app.connect.socket:SocketProtocolHandler",
+    "protobuf": "app.connect.protobuf:ProtobufProtocolHandler",
+}
+
+HandlerSpec = Union[str, Type[BaseProtocolHandler]]
+
+
+def load_handler_class(spec: HandlerSpec) -> Type[BaseProtocolHandler]:
+    """把 "模块:类名" 导入为处理器类 (已是类时原样返回)"""
+    if isinstance(spec, str):
+        module_name, _, attr = spec.partition(":")
+        obj = importlib.import_module(module_name)
+        for part in filter(None, attr.split(".")):
+            obj = getattr(obj, part)
+    else:
+        obj = spec
+    if not (isinstance(obj, type) and issubclass(obj, BaseProtocolHandler)):
+        raise TypeError(f"{spec!r} is not a BaseProtocolHandler subclass")
+    return obj
+
+
+class HandlerRegistry(Mapping):
+    """
+    call_type -> 处理器类的注册表。
+
+    注册值可以是处理器类或 "模块:类名" 字符串，字符串在首次取用时才导入，
+    只使用一种传输的进程不会加载其他传输的依赖。
+    entry point 插件只在遇到未注册的 call_type 时扫描一次，内置类型的调用不触发扫描；
+    插件不能覆盖已注册的同名 call_type。
+    """
+
+    def __init__(self, specs: Optional[Dict[str, HandlerSpec]] = None, group: Optional[str] = ENTRY_POINT_GROUP):
+        self.group = group
+        self._specs: Dict[str, HandlerSpec] = dict(specs or {})
+        self._classes: Dict[str, Type[BaseProtocolHandler]] = {}
+        self._discovered = group is None
+        self._lock = threading.Lock()
+
+    def register(self, call_type: str, handler: HandlerSpec):
+        """注册 (或替换) 一个 call_type 的处理器"""
+        with self._lock:
+            self._specs[call_type] = handler
+            self._classes.pop(call_type, None)
+
+    def _discover(self):
+        with self._lock:
+            if self._discovered:
+                return
+            self._discovered = True
+            try:
+                entry_points = metadata.entry_points(group=self.group)
+            except Exception as e:
+                logger.warning(f"Failed to scan handler plugins: {e}")
+                return
+            for ep in entry_points:
+                name = ep.name.lower()
+                if name in self._specs:
+                    logger.warning(f"Handler plugin {ep.value} ignored, call_type {name} is already registered")
+                    continue
+                self._specs[name] = ep.value
+                logger.info(f"Handler plugin registered: {name} -> {ep.value}")
+
+    def __getitem__(self, call_type: str) -> Type[BaseProtocolHandler]:
+        handler_class = self._classes.get(call_type)
+        if handler_class is not None:
+            return handler_class
+        if call_type not in self:
+            raise KeyError(call_type)
+        handler_class = self._classes[call_type] = load_handler_class(self._specs[call_type])
+        return handler_class
+
+    def __contains__(self, call_type) -> bool:
+        """只检查是否注册，不导入处理器模块"""
+        if call_type in self._specs:
+            return True
+        if not self._discovered:
+            self._discover()
+        return call_type in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        if not self._discovered:
+            self._discover()
+        return iter(list(self._specs))
+
+    def __len__(self) -> int:
+        if not self._discovered:
+            self._discover()
+        return len(self._specs)
+
+    def loaded(self) -> Dict[str, str]:
+        """已导入的处理器 (call_type -> 类的完整名称)"""
+        return {name: f"{cls.__module__}.{cls.__qualname__}" for name, cls in list(self._classes.items())}
@@ -1,7 +1,245 @@
+import json
+import time
+import atexit
+import asyncio
+import http.cookiejar
+import threading
 import requests
-from typing import Any, Dict
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from app.config import HTTP_CONFIG
+from app.metrics import current_timer, phase
 from .base import BaseProtocolHandler
 
+try:
+    # aiohttp 为可选依赖：安装后异步调用走原生 asyncio 路径，否则回退到线程执行
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+
+# 不接受任何 Cookie 的策略 (allowed_domains 为空列表时所有域都被拒绝)
+_REJECT_ALL_COOKIES = http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+
+class _PhaseTimedConnection:
+    """
+    分阶段计时的 urllib3 连接：建立连接 (含 TLS 握手) 计入 connect，发送请求计入 send，
+    等待响应头计入 wait。连接池复用的连接没有 connect 阶段。
+    """
+
+    def connect(self):
+        with phase("connect"):
+            super().connect()
+
+    def request(self, *args, **kwargs):
+        # 未连接时先显式建立连接，避免 http.client 在发送过程中自动连接而把握手计入 send
+        if self.sock is None:
+            self.connect()
+        with phase("send"):
+            super().request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        with phase("wait"):
+            return super().getresponse(*args, **kwargs)
+
+
+class _TimedHTTPConnection(_PhaseTimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_PhaseTimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """连接池使用分阶段计时连接的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _timing_trace_config():
+    """
+    aiohttp 的分阶段计时：建立连接计入 connect，从拿到连接到请求写完计入 send，
+    之后到收到响应头计入 wait。回调在发起请求的任务中执行，直接写入当前上下文的计时器。
+    """
+
+    async def on_request_start(session, ctx, params):
+        ctx.send_start = ctx.sent = time.perf_counter()
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        now = time.perf_counter()
+        timer = current_timer()
+        if timer is not None:
+            timer.add("connect", now - ctx.connect_start)
+        ctx.send_start = ctx.sent = now
+
+    async def on_connection_reuseconn(session, ctx, params):
+        ctx.send_start = ctx.sent = time.perf_counter()
+
+    async def on_request_sent(session, ctx, params):
+        ctx.sent = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        timer = current_timer()
+        if timer is not None:
+            timer.add("send", ctx.sent - ctx.send_start)
+            timer.add("wait", time.perf_counter() - ctx.sent)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_headers_sent.append(on_request_sent)
+    trace_config.on_request_chunk_sent.append(on_request_sent)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+class HttpSessionPool:
+    """
+    按目标主机缓存的 keep-alive 会话池。
+
+    每个 (scheme, host, pool_maxsize) 对应一个 requests.Session，复用底层 TCP/TLS 连接。
+    会话被所有用户与调用共享，因此不保存响应中的 Set-Cookie，每次调用与独立的 requests.get/post 一样不携带旧 Cookie。
+    缓存的主机数超过 max_hosts 时按最近最少使用淘汰并关闭会话。
+    """
+
+    def __init__(self, max_hosts: int = 10, pool_maxsize: int = 10, pool_block: bool = False):
+        self.max_hosts = max_hosts
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._sessions: "OrderedDict[Tuple[str, str, int], requests.Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, url: str, pool_maxsize: Optional[int] = None) -> requests.Session:
+        """获取目标 url 所在主机的会话，不存在时创建"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc, int(pool_maxsize or self.pool_maxsize))
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                self._hits += 1
+                return session
+
+            self._misses += 1
+            session = requests.Session()
+            session.cookies.set_policy(_REJECT_ALL_COOKIES)
+            adapter = _TimedHTTPAdapter(pool_connections=1, pool_maxsize=key[2], pool_block=self.pool_block)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions[key] = session
+
+            while len(self._sessions) > self.max_hosts:
+                _, evicted = self._sessions.popitem(last=False)
+                self._evictions += 1
+                evicted.close()
+            return session
+
+    def stats(self) -> Dict[str, Any]:
+        """返回会话命中/未命中计数及底层连接的新建/复用计数"""
+        with self._lock:
+            sessions = list(self._sessions.items())
+            data = {
+                "hosts": len(sessions),
+                "session_hits": self._hits,
+                "session_misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+        created = requests_sent = 0
+        for _, session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in pools.keys():
+                    pool = pools.get(pool_key)
+                    if pool is not None:
+                        created += pool.num_connections
+                        requests_sent += pool.num_requests
+        data["connections_created"] = created
+        data["connections_reused"] = max(requests_sent - created, 0)
+        return data
+
+    def close_all(self):
+        """关闭所有会话及其连接"""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
+# 进程级会话池，退出时释放连接
+session_pool = HttpSessionPool(
+    max_hosts=int(HTTP_CONFIG.get("pool_connections", 10)),
+    pool_maxsize=int(HTTP_CONFIG.get("pool_maxsize", 10)),
+    pool_block=bool(HTTP_CONFIG.get("pool_block", False)),
+)
+atexit.register(session_pool.close_all)
+
+
+# 每个事件循环共享的 aiohttp 会话：事件循环 -> (会话, 负责关闭会话的异步生成器)
+_async_sessions: Dict[asyncio.AbstractEventLoop, Tuple[Any, Any]] = {}
+
+
+async def _session_lifetime(loop: asyncio.AbstractEventLoop, session):
+    """
+    挂起的异步生成器由事件循环跟踪，asyncio.run 结束前 (shutdown_asyncgens) 会关闭它，
+    借此在事件循环关闭前关闭共享会话并移除缓存，不需要调用方显式清理。
+    """
+    try:
+        yield
+    finally:
+        _async_sessions.pop(loop, None)
+        await session.close()
+
+
+async def _get_async_session():
+    """获取当前事件循环共享的 aiohttp 会话，不存在时创建 (复用连接，不保存 Cookie)"""
+    loop = asyncio.get_running_loop()
+    entry = _async_sessions.get(loop)
+    if entry is not None and not entry[0].closed:
+        return entry[0]
+    session = aiohttp.ClientSession(
+        # 在途请求数由调用方 (如 execute_many_async 的 limit) 控制，连接器不再另设上限
+        connector=aiohttp.TCPConnector(limit=0),
+        # 与同步会话池一致：会话被所有调用共享，不保存响应中的 Set-Cookie
+        cookie_jar=aiohttp.DummyCookieJar(),
+        trace_configs=[_timing_trace_config()],
+    )
+    lifetime = _session_lifetime(loop, session)
+    await lifetime.__anext__()
+    _async_sessions[loop] = (session, lifetime)
+    return session
+
+
 class HttpProtocolHandler(BaseProtocolHandler):
     """HTTP 协议处理器"""
     
@@ -11,12 +249,47 @@ class HttpProtocolHandler(BaseProtocolHandler):
         if not url:
             raise ValueError("Missing URL configuration")
 
+        # target_config 中的 pool_maxsize 可覆盖全局的单主机连接数上限
+        session = session_pool.get(url, config.get("pool_maxsize"))
+        # stream=True 时收到响应头即返回，响应体在访问 resp.content 时读取；
+        # connect / send / wait 由连接池中的连接分别计时，read 只包含读取响应体
+        if method == "GET":
+            resp = session.get(url, params=params, timeout=5, stream=True)
+        else:
+            resp = session.post(url, json=params, timeout=5, stream=True)
+        with phase("read"):
+            resp.content
+
+        with phase("decode"):
+            try:
+                return resp.json()
+            except ValueError:
+                return {"raw_text": resp.text, "status_code": resp.status_code}
+
+    async def execute_async(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        if aiohttp is None:
+            return await super().execute_async(config, params)
+
+        url = config.get("url")
+        method = config.get("method", "GET").upper()
+        if not url:
+            raise ValueError("Missing URL configuration")
+
+        session = await _get_async_session()
+        timeout = aiohttp.ClientTimeout(total=5)
         if method == "GET":
-            resp = requests.get(url, params=params, timeout=5)
+            request = session.get(url, params={k: str(v) for k, v in params.items()}, timeout=timeout)
         else:
-            resp = requests.post(url, json=params, timeout=5)
-        
+            request = session.post(url, json=params, timeout=timeout)
+        # connect / send / wait 由 trace 回调计时
+        resp = await request
         try:
-            return resp.json()
-        except ValueError:
-            return {"raw_text": resp.text, "status_code": resp.status_code}
+            with phase("read"):
+                text = await resp.text()
+        finally:
+            resp.release()
+        with phase("decode"):
+            try:
+                return json.loads(text)
+            except ValueError:
+                return {"raw_text": text, "status_code": resp.status}
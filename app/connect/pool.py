@@ -0,0 +1,245 @@
+import time
+import socket
+import select
+import atexit
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Tuple, TypeVar
+from app.config import TCP_CONFIG
+from app.metrics import phase
+
+# 接收缓冲区初始大小，不足时按倍数扩容
+INITIAL_BUFFER_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+
+class SocketConnection:
+    """
+    带预分配接收缓冲区的 TCP 连接。
+
+    数据通过 recv_into 直接读入可复用的 bytearray，读取接口返回指向缓冲区的 memoryview，
+    该视图只在下一次读取前有效，调用方需在此之前完成解码。
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 5):
+        self.key = (host, port)
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buf = bytearray(INITIAL_BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        # 缓冲区中尚未消费的数据窗口 [_start, _end)
+        self._start = 0
+        self._end = 0
+        self.reused = False
+        self.last_used = time.monotonic()
+        # 累计接收字节数，用于判断一次交互中是否已收到响应数据
+        self.bytes_received = 0
+
+    def settimeout(self, timeout: float):
+        self.sock.settimeout(timeout)
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+
+    def wait_readable(self):
+        """阻塞直到有响应数据可读 (或已有缓冲数据)，用于把等待服务端处理的时间单独计时"""
+        if self.buffered:
+            return
+        select.select([self.sock], [], [], self.sock.gettimeout())
+
+    @property
+    def buffered(self) -> int:
+        """缓冲区中已接收但尚未消费的字节数"""
+        return self._end - self._start
+
+    def _reserve(self, n: int):
+        """保证缓冲区从 _start 起至少能容纳 n 字节"""
+        if self._start + n <= len(self._buf):
+            return
+        pending = self._end - self._start
+        if n <= len(self._buf):
+            # 将未消费数据移到缓冲区头部 (等长切片赋值，不改变 bytearray 大小)
+            self._buf[:pending] = self._buf[self._start:self._end]
+        else:
+            # 换用更大的新缓冲区；旧缓冲区上已返回的视图仍然有效
+            new_buf = bytearray(max(n, len(self._buf) * 2))
+            new_buf[:pending] = self._buf[self._start:self._end]
+            self._buf = new_buf
+            self._view = memoryview(new_buf)
+        self._start, self._end = 0, pending
+
+    def fill(self) -> int:
+        """从套接字读取一次数据到缓冲区尾部 (缓冲区满时倍增扩容)，返回读取的字节数，0 表示对端已关闭"""
+        if self._end == len(self._buf):
+            self._reserve(self._end - self._start + 1)
+        n = self.sock.recv_into(self._view[self._end:])
+        self._end += n
+        self.bytes_received += n
+        return n
+
+    def pending(self) -> memoryview:
+        """返回缓冲区中尚未消费的数据视图"""
+        return self._view[self._start:self._end]
+
+    def consume(self, n: int):
+        """标记缓冲区头部 n 字节已消费"""
+        self._start += n
+
+    def read_exact(self, n: int) -> memoryview:
+        """读取恰好 n 字节，连接提前关闭时抛出 ConnectionError"""
+        self._reserve(n)
+        while self._end - self._start < n:
+            if self.fill() == 0:
+                raise ConnectionError(f"Connection closed. Expected {n} bytes, got {self._end - self._start}")
+        view = self._view[self._start:self._start + n]
+        self._start += n
+        return view
+
+    def read_until(self, delimiter: bytes = b"\n") -> memoryview:
+        """读取到分隔符为止，返回不含分隔符的内容；每次只扫描新到达的数据"""
+        scanned = 0  # 相对 _start 的已扫描长度 (缓冲区整理后 _start 会变化)
+        while True:
+            idx = self._buf.find(delimiter, self._start + scanned, self._end)
+            if idx >= 0:
+                view = self._view[self._start:idx]
+                self._start = idx + len(delimiter)
+                return view
+            scanned = max(0, self._end - self._start - len(delimiter) + 1)
+            if self.fill() == 0:
+                raise ConnectionError(f"Connection closed before delimiter. Got {self._end - self._start} bytes")
+
+    def read_to_close(self) -> memoryview:
+        """读取直到对端关闭连接"""
+        while self.fill():
+            pass
+        view = self.pending()
+        self._start = self._end
+        return view
+
+    def is_alive(self) -> bool:
+        """检查空闲连接是否仍可用 (对端未关闭且没有残留数据)"""
+        if self.buffered:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # 空闲连接上出现可读事件，意味着对端已关闭或发送了不属于任何请求的数据
+        return not readable
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """
+    按 host:port 复用的持久 TCP 连接池。
+
+    取出连接时会丢弃超过空闲时间或已被对端关闭的连接；
+    调用方在连接出错时应调用 discard 而不是 release。
+    """
+
+    def __init__(self, max_idle_per_host: int = 8, idle_timeout: float = 60):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[Tuple[str, int], Deque[SocketConnection]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "discarded": 0}
+
+    def acquire(self, host: str, port: int, timeout: float = 5) -> SocketConnection:
+        """取出一个空闲连接，没有可用连接时新建"""
+        key = (host, int(port))
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                break
+            if now - conn.last_used <= self.idle_timeout and conn.is_alive():
+                with self._lock:
+                    self._stats["hits"] += 1
+                conn.reused = True
+                conn.settimeout(timeout)
+                return conn
+            with self._lock:
+                self._stats["stale"] += 1
+            conn.close()
+
+        with self._lock:
+            self._stats["misses"] += 1
+        with phase("connect"):
+            return SocketConnection(key[0], key[1], timeout)
+
+    def release(self, conn: SocketConnection):
+        """归还连接；空闲连接数超过上限时直接关闭"""
+        conn.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle[conn.key]
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def call(self, host: str, port: int, fn: Callable[[SocketConnection], T], keep_alive: bool = True, timeout: float = 5) -> T:
+        """
+        在连接上执行一次交互 fn(conn)。
+        keep_alive 时从池中取连接并在成功后归还；复用的连接若在收到任何数据前断开，
+        说明对端已关闭空闲连接，此时透明地新建连接重试一次。
+        """
+        if not keep_alive:
+            with phase("connect"):
+                conn = SocketConnection(host, int(port), timeout)
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        for attempt in range(2):
+            conn = self.acquire(host, port, timeout)
+            received = conn.bytes_received
+            try:
+                result = fn(conn)
+            except ConnectionError:
+                self.discard(conn)
+                # 已收到部分响应时不能重发，否则服务端会重复处理
+                if conn.reused and conn.bytes_received == received and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                self.discard(conn)
+                raise
+            self.release(conn)
+            return result
+
+    def discard(self, conn: SocketConnection):
+        """关闭出错的连接，不再复用"""
+        with self._lock:
+            self._stats["discarded"] += 1
+        conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self._stats)
+            data["idle"] = sum(len(v) for v in self._idle.values())
+            data["hosts"] = sum(1 for v in self._idle.values() if v)
+        return data
+
+    def close_all(self):
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+# 进程级 TCP 连接池，退出时关闭所有空闲连接
+tcp_pool = ConnectionPool(
+    max_idle_per_host=int(TCP_CONFIG.get("max_idle_per_host", 8)),
+    idle_timeout=float(TCP_CONFIG.get("idle_timeout", 60)),
+)
+atexit.register(tcp_pool.close_all)
@@ -1,15 +1,23 @@
-import socket
+import time
 import struct
-import importlib
-import dataclasses
-from typing import Any, Dict
-from google.protobuf import json_format
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.metrics import current_timer, phase
 from .base import BaseProtocolHandler
+from .capture import capture
+from .codec import EncodedRequest, get_codec
+from .pool import SocketConnection, tcp_pool
+
+# 4 字节大端序长度前缀
+LENGTH_PREFIX = struct.Struct(">I")
+# 流水线模式下每批在途请求数的默认值
+DEFAULT_PIPELINE_DEPTH = 16
 
 class ProtobufProtocolHandler(BaseProtocolHandler):
     """Protobuf over TCP 协议处理器 (支持 google.protobuf 和 pure-protobuf)"""
-    
-    def execute(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+
+    def _prepare(self, config: Dict[str, Any], params: Any) -> Tuple[str, int, bytes, Callable[[Any], Dict[str, Any]]]:
+        """校验配置并编码请求，返回 (host, port, 请求字节, 响应解码函数)"""
         host = config.get("host")
         port = config.get("port")
         module_name = config.get("proto_module")
@@ -19,61 +27,138 @@ class ProtobufProtocolHandler(BaseProtocolHandler):
         if not all([host, port, module_name, req_class_name, res_class_name]):
             raise ValueError("Missing protobuf configuration")
 
-        # 动态加载模块和类
-        module = importlib.import_module(module_name)
-        ReqClass = getattr(module, req_class_name)
-        ResClass = getattr(module, res_class_name)
-
-        # 判断是否为 pure-protobuf (使用 dataclass)
-        is_pure = dataclasses.is_dataclass(ReqClass)
-
-        if is_pure:
-            # === Pure Python Mode ===
-            # 过滤掉不在 dataclass 字段中的参数，防止 __init__ 报错
-            valid_keys = {f.name for f in dataclasses.fields(ReqClass)}
-            filtered_params = {k: v for k, v in params.items() if k in valid_keys}
-            req_obj = ReqClass(**filtered_params)
-            req_bytes = req_obj.dumps()
+        codec = get_codec(module_name, req_class_name, res_class_name)
+        # 已预编码的请求直接使用其字节
+        if isinstance(params, EncodedRequest):
+            req_bytes = params.data
         else:
-            # === Standard Google Protobuf Mode ===
-            req_obj = ReqClass()
-            json_format.ParseDict(params, req_obj, ignore_unknown_fields=True)
-            req_bytes = req_obj.SerializeToString()
-
-        # 发送 (Length-Prefixed: 4 bytes big-endian length + body)
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(5)
-            s.connect((host, int(port)))
-            
-            # 发送长度 + 内容
-            length_prefix = struct.pack(">I", len(req_bytes))
-            s.sendall(length_prefix + req_bytes)
-            
-            # 接收响应长度
-            length_data = s.recv(4)
-            if not length_data or len(length_data) < 4:
-                raise IOError("Failed to read response length")
-            
-            (resp_len,) = struct.unpack(">I", length_data)
-            
-            # 接收响应内容
-            resp_bytes = b""
-            while len(resp_bytes) < resp_len:
-                chunk = s.recv(min(4096, resp_len - len(resp_bytes)))
-                if not chunk:
-                    break
-                resp_bytes += chunk
-            
-            if len(resp_bytes) != resp_len:
-                raise IOError(f"Incomplete response. Expected {resp_len}, got {len(resp_bytes)}")
-
-            # 解析响应
-            if is_pure:
-                # === Pure Python Mode ===
-                res_obj = ResClass.loads(resp_bytes)
-                return dataclasses.asdict(res_obj)
-            else:
-                # === Standard Google Protobuf Mode ===
-                res_obj = ResClass()
-                res_obj.ParseFromString(resp_bytes)
-                return json_format.MessageToDict(res_obj, preserving_proto_field_name=True)
+            with phase("encode"):
+                req_bytes = codec.encode(params)
+        raw = bool(config.get("raw_decode", False))
+
+        def decode(resp_bytes) -> Dict[str, Any]:
+            with phase("decode"):
+                return codec.decode(resp_bytes, raw=raw)
+
+        return host, int(port), req_bytes, decode
+
+    def prepare(self, config: Dict[str, Any], params: Dict[str, Any]) -> EncodedRequest:
+        """预编码一组固定参数，返回值可作为 params 多次传给 execute / execute_pipelined"""
+        codec = get_codec(config.get("proto_module"), config.get("request_class"), config.get("response_class"))
+        return codec.pre_encode(params)
+    
+    def execute(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        host, port, req_bytes, decode = self._prepare(config, params)
+        frame = LENGTH_PREFIX.pack(len(req_bytes)) + req_bytes
+        return self._call(config, host, port, [frame], decode)[0]
+
+    def execute_pipelined(
+        self,
+        config: Dict[str, Any],
+        params_list: List[Dict[str, Any]],
+        timings: Optional[List[Tuple[float, float]]] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        在同一条持久连接上流水线发送多个请求，按发送顺序匹配响应。
+        每批最多发送 target_config.pipeline_depth 个请求后再依次读取响应。
+        :param timings: 传入列表时，按顺序追加每个请求的 (发送时刻, 收到响应时刻) perf_counter 值
+        :param on_result: 每解码一个响应即调用一次 (在 timings 追加之后)，调用方无需等待整批完成
+        """
+        if not params_list:
+            return []
+        depth = max(1, int(config.get("pipeline_depth", DEFAULT_PIPELINE_DEPTH)))
+        frames = []
+        decode = None
+        for params in params_list:
+            host, port, req_bytes, decode = self._prepare(config, params)
+            frames.append(LENGTH_PREFIX.pack(len(req_bytes)) + req_bytes)
+
+        results: List[Dict[str, Any]] = []
+        for i in range(0, len(frames), depth):
+            results.extend(self._call(config, host, port, frames[i:i + depth], decode, timings, on_result))
+        return results
+
+    def _call(self, config, host, port, frames, decode, timings=None, on_result=None) -> List[Dict[str, Any]]:
+        """通过连接池发送一批请求帧；复用的连接若在收到任何响应前断开，则透明重连一次"""
+        stream = capture.stream(config, "protobuf", "length") if capture.active else None
+        try:
+            return tcp_pool.call(
+                host, port,
+                lambda conn: self._exchange(conn, frames, decode, timings, stream, on_result),
+                keep_alive=config.get("keep_alive", True),
+            )
+        except ConnectionError as e:
+            raise IOError(str(e))
+
+    @staticmethod
+    def _exchange(conn: SocketConnection, frames, decode, timings=None, stream=None, on_result=None) -> List[Dict[str, Any]]:
+        """
+        发送全部帧 (Length-Prefixed: 4 bytes big-endian length + body)，再按顺序读取并解码响应。
+        :param stream: 抓包流编号，传入时记录每个请求与响应的原始内容
+        """
+        results: List[Dict[str, Any]] = []
+        seqs = [capture.request(stream, memoryview(f)[LENGTH_PREFIX.size:]) for f in frames] if stream else None
+        sent_at = time.perf_counter()
+        try:
+            with phase("send"):
+                conn.sendall(b"".join(frames) if len(frames) > 1 else frames[0])
+            if current_timer() is not None:
+                with phase("wait"):
+                    conn.wait_readable()
+            for _ in frames:
+                with phase("read"):
+                    # 接收响应长度
+                    try:
+                        (resp_len,) = LENGTH_PREFIX.unpack(conn.read_exact(4))
+                    except ConnectionError:
+                        raise ConnectionError("Failed to read response length")
+                    # 接收响应内容，直接在接收缓冲区的视图上解码
+                    body = conn.read_exact(resp_len)
+                if seqs:
+                    capture.response(stream, seqs[len(results)], body)
+                results.append(decode(body))
+                if timings is not None:
+                    timings.append((sent_at, time.perf_counter()))
+                if on_result is not None:
+                    on_result(results[-1])
+        except Exception as e:
+            # 未收到响应的请求记为错误
+            for seq in (seqs or [])[len(results):]:
+                capture.error(stream, seq, str(e))
+            raise
+        return results
+
+    async def execute_async(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        host, port, req_bytes, decode = self._prepare(config, params)
+
+        stream = capture.stream(config, "protobuf", "length") if capture.active else None
+        with phase("connect"):
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=5)
+        seq = capture.request(stream, req_bytes) if stream is not None else 0
+        try:
+            with phase("send"):
+                writer.write(LENGTH_PREFIX.pack(len(req_bytes)) + req_bytes)
+                await writer.drain()
+            with phase("wait"):
+                try:
+                    length_data = await asyncio.wait_for(reader.readexactly(4), timeout=5)
+                except asyncio.IncompleteReadError:
+                    raise IOError("Failed to read response length")
+
+            (resp_len,) = LENGTH_PREFIX.unpack(length_data)
+            with phase("read"):
+                try:
+                    resp_bytes = await asyncio.wait_for(reader.readexactly(resp_len), timeout=5)
+                except asyncio.IncompleteReadError as e:
+                    raise IOError(f"Incomplete response. Expected {resp_len}, got {len(e.partial)}")
+        except Exception as e:
+            if stream is not None:
+                capture.error(stream, seq, str(e))
+            raise
+        finally:
+            writer.close()
+
+        if stream is not None:
+            capture.response(stream, seq, resp_bytes)
+        return decode(resp_bytes)
@@ -1,26 +1,278 @@
+import re
 import json
-import socket
-from typing import Any, Dict
+import struct
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+from app.metrics import current_timer, phase
 from .base import BaseProtocolHandler
+from .capture import capture
+from .pool import SocketConnection, tcp_pool
+
+# 4 字节大端序长度前缀，与 protobuf 传输一致
+LENGTH_PREFIX = struct.Struct(">I")
+
+# 支持的分帧方式 (target_config.framing)：
+#   json    - 默认。发送裸 JSON，读取到一个完整的 JSON 文档或连接关闭为止 (兼容旧服务)
+#   newline - 每条消息以 \n 结尾 (NDJSON)，连接可复用
+#   length  - 4 字节大端序长度前缀 + JSON 内容，连接可复用
+#   close   - 发送裸 JSON，读取直到服务端关闭连接
+FRAMINGS = ("json", "newline", "length", "close")
+# 可在多次调用间复用连接的分帧方式
+REUSABLE_FRAMINGS = ("newline", "length")
+# asyncio StreamReader 的缓冲上限，需能容纳单条大消息
+STREAM_LIMIT = 64 * 1024 * 1024
+# json 分帧的增量扫描 (见 _JsonScanner)：
+#   _JSON_CODE        字符串之外的内容，完整的字符串整体跳过，止于尚未闭合的字符串的起始引号
+#   _JSON_STRING_REST 未闭合字符串的剩余内容，止于结束引号或末尾落单的转义符
+#   _JSON_BRACKETS    完整的字符串匹配为空分组，只捕获字符串之外的括号
+# 字符串内部写成 [^"\\]*(?:\\.[^"\\]*)* 的展开形式：每个字节只有一种匹配方式，字符串未闭合时回溯也是线性的
+_JSON_CODE = re.compile(rb'(?:[^"]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+_JSON_STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_JSON_BRACKETS = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|([][{}])', re.S)
+
+
+def _decode(data) -> Dict[str, Any]:
+    """将接收到的字节 (bytes 或 memoryview) 解码为 JSON，空数据返回 {}"""
+    if not len(data):
+        return {}
+    return json.loads(str(data, "utf-8"))
+
+
+def encode_message(params: Any, framing: str) -> bytes:
+    """按分帧方式编码一条 JSON 消息 (客户端请求与 mock 服务端响应共用)"""
+    body = json.dumps(params).encode("utf-8")
+    if framing == "newline":
+        return body + b"\n"
+    if framing == "length":
+        return LENGTH_PREFIX.pack(len(body)) + body
+    return body
+
+
+def message_body(msg: bytes, framing: str) -> memoryview:
+    """去掉 encode_message 添加的分帧字节，返回消息内容的视图"""
+    if framing == "length":
+        return memoryview(msg)[LENGTH_PREFIX.size:]
+    if framing == "newline":
+        return memoryview(msg)[:-1]
+    return memoryview(msg)
+
+
+def frame_message(body, framing: str) -> bytes:
+    """按分帧方式为消息内容添加分帧字节 (回放抓包记录时使用)"""
+    if framing == "newline":
+        return bytes(body) + b"\n"
+    if framing == "length":
+        return LENGTH_PREFIX.pack(len(body)) + body
+    return bytes(body)
+
+
+def read_frame(conn: SocketConnection, framing: str) -> memoryview:
+    """按分帧方式读取一条消息，返回不含分帧字节的原始内容 (视图在下一次读取前有效)"""
+    if framing == "newline":
+        return conn.read_until(b"\n")
+    if framing == "length":
+        (length,) = LENGTH_PREFIX.unpack(conn.read_exact(LENGTH_PREFIX.size))
+        return conn.read_exact(length)
+    if framing == "close":
+        return conn.read_to_close()
+    return SocketProtocolHandler._read_json(conn)[1]
+
+
+def _looks_complete(data) -> bool:
+    """末尾为 } 或 ] 时才尝试解析，避免对每个分片都做一次完整解析"""
+    tail = bytes(data[-16:]).rstrip()
+    return tail[-1:] in (b"}", b"]")
+
+
+class _JsonScanner:
+    """
+    json 分帧的完整性检测，总代价与响应大小成线性。
+
+    通常一次接收就是完整响应，因此先直接解析全部数据；解析失败后数据须再增长一倍才再次直接解析，
+    其间由增量扫描判断文档是否完整：跨多次接收记录括号深度与是否位于未闭合的字符串内，
+    每次只扫描新到达的字节 (由正则在 C 层完成)。
+    顶层为标量的文档没有结束标记，读取到连接关闭为止。
+    """
+
+    __slots__ = ("pos", "depth", "started", "in_string", "attempted")
+
+    def __init__(self):
+        self.pos = 0
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        # 上次直接解析失败时的数据长度
+        self.attempted = 0
+
+    def feed(self, data) -> Optional[Tuple[Dict[str, Any], int]]:
+        """收到新数据后调用 (data 为目前收到的全部数据)，文档完整时返回 (解码结果, 结束位置)，否则返回 None"""
+        if not _looks_complete(data):
+            return None
+        if len(data) >= 2 * self.attempted:
+            try:
+                return _decode(data), len(data)
+            except ValueError:
+                self.attempted = len(data)
+        end = self.scan(data)
+        if end < 0:
+            return None
+        return _decode(data[:end]), end
+
+    def scan(self, data) -> int:
+        """从上次停止处继续扫描 data，返回完整文档的结束位置 (不含)，尚不完整时返回 -1"""
+        pos, end = self.pos, len(data)
+        while pos < end:
+            if self.in_string:
+                pos = _JSON_STRING_REST.match(data, pos).end()
+                if pos >= end or data[pos] != 0x22:
+                    # 字符串在后续数据中继续 (或末尾是落单的转义符)，下次从这里接着扫描
+                    break
+                pos += 1
+                self.in_string = False
+                continue
+            stop = _JSON_CODE.match(data, pos).end()
+            brackets = b"".join(_JSON_BRACKETS.findall(data, pos, stop))
+            opens = brackets.count(b"{") + brackets.count(b"[")
+            self.depth += opens - (len(brackets) - opens)
+            self.started = self.started or opens > 0
+            if self.started and self.depth <= 0:
+                self.pos = stop
+                return stop
+            pos = stop
+            if stop < end:
+                # 停在未闭合字符串的起始引号上
+                self.in_string = True
+                pos += 1
+        self.pos = pos
+        return -1
+
 
 class SocketProtocolHandler(BaseProtocolHandler):
     """Socket (JSON over TCP) 协议处理器"""
-    
+
+    @staticmethod
+    def _framing(config: Dict[str, Any]) -> str:
+        framing = (config.get("framing") or "json").lower()
+        if framing not in FRAMINGS:
+            raise ValueError(f"Unknown framing: {framing}")
+        return framing
+
     def execute(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
         host = config.get("host")
         port = config.get("port")
         if not host or not port:
             raise ValueError("Missing host/port configuration")
-        
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(5)
-            s.connect((host, int(port)))
-            # 发送数据：JSON 字符串
-            msg = json.dumps(params)
-            s.sendall(msg.encode('utf-8'))
-            
-            # 接收数据
-            data = s.recv(4096)
-            if not data:
-                return {}
-            return json.loads(data.decode('utf-8'))
+
+        framing = self._framing(config)
+        # 发送数据：JSON 字符串
+        with phase("encode"):
+            msg = encode_message(params, framing)
+
+        stream = capture.stream(config, "socket", framing) if capture.active else None
+
+        def exchange(conn: SocketConnection) -> Dict[str, Any]:
+            if stream is None:
+                return self._exchange(conn, msg, framing)[0]
+            seq = capture.request(stream, message_body(msg, framing))
+            try:
+                result, raw = self._exchange(conn, msg, framing)
+            except Exception as e:
+                capture.error(stream, seq, str(e))
+                raise
+            capture.response(stream, seq, raw)
+            return result
+
+        keep_alive = framing in REUSABLE_FRAMINGS and config.get("keep_alive", True)
+        return tcp_pool.call(host, int(port), exchange, keep_alive=keep_alive)
+
+    @staticmethod
+    def _exchange(conn: SocketConnection, msg: bytes, framing: str) -> Tuple[Dict[str, Any], memoryview]:
+        with phase("send"):
+            conn.sendall(msg)
+        if current_timer() is not None:
+            with phase("wait"):
+                conn.wait_readable()
+        return SocketProtocolHandler._read_message(conn, framing)
+
+    @staticmethod
+    def _read_message(conn: SocketConnection, framing: str) -> Tuple[Dict[str, Any], memoryview]:
+        """按分帧方式读取一条响应并增量解码，返回 (解码结果, 原始内容视图)"""
+        if framing in ("newline", "length", "close"):
+            with phase("read"):
+                data = read_frame(conn, framing)
+            with phase("decode"):
+                return _decode(data), data
+
+        # json：没有分帧信息，读到能完整解析的文档为止 (读取与解析交替进行，整体计入 read)
+        with phase("read"):
+            return SocketProtocolHandler._read_json(conn)
+
+    @staticmethod
+    def _read_json(conn: SocketConnection) -> Tuple[Dict[str, Any], memoryview]:
+        scanner = _JsonScanner()
+        while conn.fill():
+            data = conn.pending()
+            found = scanner.feed(data)
+            if found is not None:
+                # json 分帧的连接不复用，文档之后的残留字节 (如换行) 一并丢弃
+                conn.consume(len(data))
+                result, end = found
+                return result, data[:end]
+        data = conn.pending()
+        conn.consume(len(data))
+        return _decode(data), data
+
+    async def execute_async(self, config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+        host = config.get("host")
+        port = config.get("port")
+        if not host or not port:
+            raise ValueError("Missing host/port configuration")
+
+        framing = self._framing(config)
+        with phase("encode"):
+            msg = encode_message(params, framing)
+        with phase("connect"):
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, int(port), limit=STREAM_LIMIT), timeout=5
+            )
+        stream = capture.stream(config, "socket", framing) if capture.active else None
+        seq = capture.request(stream, message_body(msg, framing)) if stream is not None else 0
+        try:
+            with phase("send"):
+                writer.write(msg)
+                await writer.drain()
+            # 异步路径不区分等待与读取，整体计入 read (含解码)
+            with phase("read"):
+                result, raw = await asyncio.wait_for(self._read_message_async(reader, framing), timeout=5)
+        except Exception as e:
+            if stream is not None:
+                capture.error(stream, seq, str(e))
+            raise
+        finally:
+            writer.close()
+        if stream is not None:
+            capture.response(stream, seq, raw)
+        return result
+
+    @staticmethod
+    async def _read_message_async(reader: asyncio.StreamReader, framing: str) -> Tuple[Dict[str, Any], bytes]:
+        if framing == "newline":
+            data = (await reader.readuntil(b"\n"))[:-1]
+        elif framing == "length":
+            (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(4))
+            data = await reader.readexactly(length)
+        elif framing == "close":
+            data = await reader.read()
+        else:
+            buf = bytearray()
+            scanner = _JsonScanner()
+            while True:
+                chunk = await reader.read(STREAM_LIMIT)
+                if not chunk:
+                    return _decode(buf), buf
+                buf += chunk
+                found = scanner.feed(buf)
+                if found is not None:
+                    result, end = found
+                    return result, buf[:end]
+        return _decode(data), data
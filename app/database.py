@@ -1,10 +1,24 @@
 import sqlite3
 import json
-from flask import g, current_app
-from app.config import DB_PATH, GAME_SERVER
+import time
+import threading
+from pathlib import Path
+from flask import g, current_app, has_app_context
+from loguru import logger
+from app.config import APP_CONFIG, DB_PATH, GAME_SERVER
+from app.history import register_sql_functions
+
+# 设置缓存检查版本号的间隔 (秒)，即其他进程修改设置后本进程最长的感知延迟
+SETTINGS_CACHE_TTL = float(APP_CONFIG.get("settings_cache_ttl", 1.0))
 
 class Database:
-    def __init__(self, app=None):
+    def __init__(self, app=None, settings_ttl: float = SETTINGS_CACHE_TTL):
+        # 进程内设置缓存：settings_version.version 变化时整表重新加载
+        self.settings_ttl = settings_ttl
+        self._settings = {}
+        self._settings_version = None
+        self._settings_checked = 0.0
+        self._settings_lock = threading.Lock()
         if app is not None:
             self.init_app(app)
 
@@ -23,8 +37,20 @@ class Database:
         if 'db' not in g:
             g.db = sqlite3.connect(DB_PATH)
             g.db.row_factory = sqlite3.Row
+            # WAL 模式下 NORMAL 足以保证一致性，并避免每次提交都 fsync
+            g.db.execute("PRAGMA synchronous=NORMAL")
+            g.db.execute("PRAGMA busy_timeout=5000")
+            register_sql_functions(g.db)
         return g.db
 
+    def after_fork(self):
+        """
+        在 fork 出的子进程中调用：重建锁并使设置缓存失效。
+        连接保存在应用上下文 (g) 中，每个请求线程各自创建、请求结束时关闭，不会跨进程共享。
+        """
+        self._settings_lock = threading.Lock()
+        self._settings_version = None
+
     def close(self, e=None):
         """关闭数据库连接"""
         db = g.pop('db', None)
@@ -32,68 +58,278 @@ class Database:
             db.close()
 
     def get_setting(self, key, default=None):
-        """获取全局设置"""
-        db = self.connection
-        row = db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
-        return row["value"] if row else default
+        """
+        获取全局设置 (读取进程内缓存)。
+        可在没有应用上下文的工作线程中调用。
+        """
+        return self._load_settings().get(key, default)
 
     def set_setting(self, key, value):
-        """更新全局设置"""
+        """更新全局设置，并递增版本号使所有进程的缓存失效"""
         db = self.connection
-        db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        db.commit()
+        with db:
+            db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            db.execute("UPDATE settings_version SET version = version + 1")
+        with self._settings_lock:
+            self._settings_version = None
+
+    def _load_settings(self):
+        """返回设置快照；距上次检查超过 settings_ttl 时比对数据库中的版本号"""
+        if self._settings_version is not None and time.monotonic() - self._settings_checked < self.settings_ttl:
+            return self._settings
+        with self._settings_lock:
+            if self._settings_version is not None and time.monotonic() - self._settings_checked < self.settings_ttl:
+                return self._settings
+            try:
+                if has_app_context():
+                    self._refresh_settings(self.connection)
+                else:
+                    # 只读打开，数据库尚未创建时不生成空文件
+                    conn = sqlite3.connect(Path(DB_PATH).resolve().as_uri() + "?mode=ro", uri=True)
+                    try:
+                        self._refresh_settings(conn)
+                    finally:
+                        conn.close()
+            except sqlite3.OperationalError:
+                # 数据库未初始化 (如独立运行的命令行工具)，使用调用方的默认值
+                self._settings, self._settings_version = {}, -1
+            self._settings_checked = time.monotonic()
+        return self._settings
+
+    def _refresh_settings(self, conn):
+        row = conn.execute("SELECT version FROM settings_version").fetchone()
+        version = row[0] if row else 0
+        if version != self._settings_version:
+            # 整体替换字典，读取方拿到的快照不会被修改
+            self._settings = {k: v for k, v in conn.execute("SELECT key, value FROM settings")}
+            self._settings_version = version
 
     def init_db(self, app):
-        """初始化数据库表结构和默认数据"""
+        """
+        初始化或升级数据库表结构。
+        已是最新版本时只执行一次查询 (schema_version)；否则依次执行尚未应用的迁移步骤。
+        """
         with app.app_context():
             conn = self.connection
+            version = self.schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                return
             cur = conn.cursor()
-            
-            # 创建设置表
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                );
-                """
-            )
+            for step, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+                migrate(cur)
+                cur.execute("CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+                cur.execute("INSERT OR REPLACE INTO schema_version (id, version) VALUES (1, ?)", (step,))
+                conn.commit()
+            logger.info(f"Database schema migrated from version {version} to {SCHEMA_VERSION}")
 
-            # 初始化默认设置
-            cur.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", ('global_target_url', GAME_SERVER))
-            
-            # 创建历史记录表
+    @staticmethod
+    def schema_version(conn) -> int:
+        """数据库当前的表结构版本 (未建立版本表的新库或旧库为 0)"""
+        try:
+            row = conn.execute("SELECT version FROM schema_version").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] if row else 0
+
+    @staticmethod
+    def _init_settings(cur):
+        """设置表与设置版本号"""
+        # 使用 WAL 日志模式 (持久化在数据库文件中)，历史写入不再阻塞读取
+        cur.execute("PRAGMA journal_mode=WAL")
+
+        # 创建设置表
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+        # 设置版本号 (单行)，set_setting 时递增，用于使各进程的设置缓存失效
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            """
+        )
+        cur.execute("INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)")
+
+        # 初始化默认设置
+        cur.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", ('global_target_url', GAME_SERVER))
+
+    @staticmethod
+    def _init_history(cur):
+        """历史记录表及查询索引"""
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                action TEXT,  -- 简要描述或操作类型
+                protocol_name TEXT,
+                target_url TEXT,
+                request_body TEXT,  -- JSON
+                response_body TEXT, -- JSON
+                assertions TEXT,    -- JSON
+                created_at TEXT NOT NULL
+            );
+            """
+        )
+
+        # 为历史表补齐新字段 (兼容旧数据库文件)
+        new_cols = [
+            ("protocol_name", "TEXT"),
+            ("target_url", "TEXT"),
+            ("request_body", "TEXT"),
+            ("response_body", "TEXT"),
+            ("assertions", "TEXT"),
+            # 紧凑格式运行的结果条数 (NULL 表示 response_body 中内联存储的旧格式)
+            ("result_count", "INTEGER"),
+            # 紧凑格式运行中不同响应体的摘录，仅供全文检索
+            ("response_digest", "TEXT"),
+        ]
+        existing = {row[1] for row in cur.execute("PRAGMA table_info(history)")}
+        for col_name, col_type in new_cols:
+            if col_name not in existing:
+                cur.execute(f"ALTER TABLE history ADD COLUMN {col_name} {col_type}")
+
+        # 历史查询索引：与 /api/history 的过滤条件及 (created_at, id) 键集分页一致
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_history_created ON history (created_at, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_history_user ON history (username, created_at, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_history_protocol ON history (protocol_name, created_at, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_history_target ON history (target_url, created_at, id)")
+
+    @staticmethod
+    def _init_history_results(cur):
+        """创建紧凑格式的逐条结果表、内容块表，以及还原旧格式的兼容视图"""
+        cur.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS history_results (
+                history_id INTEGER NOT NULL,
+                idx INTEGER NOT NULL,
+                body_hash TEXT,        -- history_blobs.hash (响应体)
+                assertions_hash TEXT,  -- history_blobs.hash (断言结果，无断言时为 NULL)
+                elapsed_ms REAL,
+                status TEXT,           -- ok / fail / error
+                start_time TEXT,
+                end_time TEXT,
+                extra TEXT,            -- JSON，其余字段 (error、random 等)
+                PRIMARY KEY (history_id, idx)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_history_results_body ON history_results (body_hash);
+            CREATE INDEX IF NOT EXISTS idx_history_results_assertions ON history_results (assertions_hash);
+
+            CREATE TABLE IF NOT EXISTS history_blobs (
+                hash TEXT PRIMARY KEY, -- 原始 JSON 文本的 SHA-1
+                encoding TEXT NOT NULL, -- json / zlib
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL  -- 原始字节数
+            );
+
+            -- 与旧版 history 表结构一致的只读视图，紧凑格式的运行还原为结果数组
+            -- blob_text 是应用在连接上注册的 Python 函数 (见 app/history.py)，未注册的连接无法读取紧凑格式的运行
+            CREATE VIEW IF NOT EXISTS history_compat AS
+            SELECT
+                h.id, h.username, h.action, h.protocol_name, h.target_url, h.request_body,
+                CASE WHEN h.result_count IS NULL THEN h.response_body ELSE (
+                    SELECT json_group_array(json(item)) FROM (
+                        SELECT json_patch(
+                            json_object(
+                                'index', r.idx,
+                                'request_params', json(h.request_body),
+                                'response', json(blob_text(b.encoding, b.body)),
+                                'assertions', json(COALESCE(blob_text(a.encoding, a.body), '[]')),
+                                'timestamp', r.end_time,
+                                'start_time', r.start_time,
+                                'end_time', r.end_time,
+                                'elapsed_ms', r.elapsed_ms
+                            ),
+                            COALESCE(r.extra, '{}')
+                        ) AS item
+                        FROM history_results r
+                        LEFT JOIN history_blobs b ON b.hash = r.body_hash
+                        LEFT JOIN history_blobs a ON a.hash = r.assertions_hash
+                        WHERE r.history_id = h.id
+                        ORDER BY r.idx
+                    )
+                ) END AS response_body,
+                h.assertions, h.created_at
+            FROM history h;
+
+            -- 全文索引的内容来源：紧凑格式的运行以响应摘录代替 response_body
+            CREATE VIEW IF NOT EXISTS history_search AS
+            SELECT id, request_body, COALESCE(response_body, response_digest) AS response_body
+            FROM history;
+            """
+        )
+
+    @staticmethod
+    def _init_history_fts(cur):
+        """创建请求/响应内容的 FTS5 全文索引 (外部内容视图 + 同步触发器)"""
+        row = cur.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+        ).fetchone()
+        if row and "history_search" in row[0]:
+            return
+        try:
+            # 旧版本以 history 表为外部内容，切换到 history_search 视图后重建
+            cur.execute("DROP TABLE IF EXISTS history_fts")
             cur.execute(
                 """
-                CREATE TABLE IF NOT EXISTS history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL,
-                    action TEXT,  -- 简要描述或操作类型
-                    protocol_name TEXT,
-                    target_url TEXT,
-                    request_body TEXT,  -- JSON
-                    response_body TEXT, -- JSON
-                    assertions TEXT,    -- JSON
-                    created_at TEXT NOT NULL
-                );
+                CREATE VIRTUAL TABLE history_fts USING fts5(
+                    request_body, response_body, content='history_search', content_rowid='id'
+                )
                 """
             )
-            conn.commit()
-
-            # 尝试为历史表添加新字段 (兼容旧数据库文件)
-            new_cols = [
-                ("protocol_name", "TEXT"),
-                ("target_url", "TEXT"),
-                ("request_body", "TEXT"),
-                ("response_body", "TEXT"),
-                ("assertions", "TEXT")
-            ]
-            for col_name, col_type in new_cols:
-                try:
-                    cur.execute(f"ALTER TABLE history ADD COLUMN {col_name} {col_type}")
-                except sqlite3.OperationalError:
-                    pass
-            
-            conn.commit()
+        except sqlite3.OperationalError as e:
+            # 部分 SQLite 编译版本不包含 FTS5，此时全文搜索不可用
+            logger.warning(f"FTS5 unavailable, history search disabled: {e}")
+            return
+
+        cur.executescript(
+            """
+            DROP TRIGGER IF EXISTS history_fts_ai;
+            DROP TRIGGER IF EXISTS history_fts_ad;
+            DROP TRIGGER IF EXISTS history_fts_au;
+            CREATE TRIGGER history_fts_ai AFTER INSERT ON history BEGIN
+                INSERT INTO history_fts (rowid, request_body, response_body)
+                VALUES (new.id, new.request_body, COALESCE(new.response_body, new.response_digest));
+            END;
+            CREATE TRIGGER history_fts_ad AFTER DELETE ON history BEGIN
+                INSERT INTO history_fts (history_fts, rowid, request_body, response_body)
+                VALUES ('delete', old.id, old.request_body, COALESCE(old.response_body, old.response_digest));
+            END;
+            CREATE TRIGGER history_fts_au AFTER UPDATE ON history BEGIN
+                INSERT INTO history_fts (history_fts, rowid, request_body, response_body)
+                VALUES ('delete', old.id, old.request_body, COALESCE(old.response_body, old.response_digest));
+                INSERT INTO history_fts (rowid, request_body, response_body)
+                VALUES (new.id, new.request_body, COALESCE(new.response_body, new.response_digest));
+            END;
+            """
+        )
+        # 为已有记录建立索引
+        cur.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+
+    def has_history_fts(self) -> bool:
+        """当前数据库是否启用了历史全文索引"""
+        row = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'history_fts'"
+        ).fetchone()
+        return row is not None
+
+# 表结构迁移步骤，按顺序执行，schema_version 记录已执行的步数。
+# 修改表结构时在末尾追加新步骤，不要修改已有步骤；
+# 引入版本表之前的数据库从第 1 步开始执行，因此前几步都是幂等的。
+MIGRATIONS = [
+    Database._init_settings,
+    Database._init_history,
+    Database._init_history_results,
+    Database._init_history_fts,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
 
 db = Database()
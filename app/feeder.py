@@ -0,0 +1,310 @@
+import csv
+import json
+import queue
+import random
+import threading
+import itertools
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from app.config import FEEDER_CONFIG, TEST_CASES_PATH
+
+# 后台生成线程每批生成的参数组数与预先生成的批数
+BATCH_SIZE = int(FEEDER_CONFIG.get("batch_size", 256))
+PREFETCH_BATCHES = int(FEEDER_CONFIG.get("prefetch_batches", 4))
+
+# range 规则生成浮点数的字段类型，其余类型生成整数
+FLOAT_TYPES = ("float", "number", "double")
+
+
+class FeederError(ValueError):
+    """参数生成规则不合法"""
+
+
+class _FileSource:
+    """
+    流式读取 CSV / JSONL 数据文件，读到末尾后从头循环。
+    同一参数组中引用同一文件的多个字段取自同一行。
+    多分片运行时每个分片只读取行号 % shards == shard 的行，各分片的数据互不重复。
+    """
+
+    def __init__(self, path: Path, shard: int = 0, shards: int = 1, name: Optional[str] = None):
+        # name 为错误信息中显示的路径 (相对用例目录，不暴露服务端的绝对路径)
+        self.name = name or path.name
+        if not path.is_file():
+            raise FeederError(f"data file not found: {self.name}")
+        self.path = path
+        self.shard = shard
+        self.shards = shards
+        self.jsonl = path.suffix.lower() in (".jsonl", ".ndjson")
+        self.header: List[str] = []
+        if not self.jsonl:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                self.header = next(csv.reader(f), [])
+        self._rows: Optional[Iterator[Any]] = None
+
+    def getter(self, column: str) -> Callable[[Any], Any]:
+        """返回从一行中取出指定列的函数 (CSV 行为列表，按表头位置取值)"""
+        if self.jsonl:
+            return lambda row: row.get(column)
+        try:
+            index = self.header.index(column)
+        except ValueError:
+            raise FeederError(f"column {column} not found in {self.name}")
+        return lambda row: row[index] if index < len(row) else None
+
+    def _open(self) -> Iterator[Any]:
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            if self.jsonl:
+                rows = (json.loads(line) for line in f if line.strip())
+            else:
+                rows = csv.reader(f)
+                next(rows, None)
+            yield from itertools.islice(rows, self.shard, None, self.shards)
+
+    def check(self):
+        """构造规则时读取一行，空文件 (或本分片没有数据) 与无法解析的首行直接报错，而不是在生成时失败"""
+        rows = self._open()
+        try:
+            next(rows)
+        except StopIteration:
+            raise FeederError(f"data file has no rows for this shard: {self.name}")
+        except ValueError as e:
+            raise FeederError(f"invalid data file {self.name}: {e}")
+        finally:
+            rows.close()
+
+    def next_row(self) -> Any:
+        for _ in range(2):
+            if self._rows is None:
+                self._rows = self._open()
+            try:
+                return next(self._rows)
+            except StopIteration:
+                self._rows = None
+            except ValueError as e:
+                self._rows = None
+                raise FeederError(f"invalid data file {self.name}: {e}")
+        raise FeederError(f"data file has no rows for this shard: {self.name}")
+
+
+class ParamFeeder:
+    """
+    根据协议 params 定义中的 feed 规则生成每次调用的参数。
+
+    每个字段可配置一种规则 (未配置的字段使用请求参数或 default)：
+      sequence: {start: 1, step: 1}          递增序列
+      range: [min, max]                      随机数 (type 为 integer 时取整数)
+      choices: [a, b, c] (可选 weights)      随机选择
+      file: data/users.csv, column: name     CSV / JSONL 数据文件 (流式读取，循环使用)
+      template: "player_{n}"                 格式化字符串，{n} 为全局唯一的调用序号
+
+    规则在构造时编译为生成函数，生成时不再解析配置。
+    shard / shards 用于多进程运行：各分片的序列与 {n} 交错取值，数据文件按行分配，保证不重复。
+    """
+
+    def __init__(
+        self,
+        schema: Dict[str, Any],
+        base_params: Optional[Dict[str, Any]] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+        shard: int = 0,
+        shards: int = 1,
+        seed: Optional[int] = None,
+        base_dir: Path = TEST_CASES_PATH,
+    ):
+        self.base_params = dict(base_params or {})
+        self.shard = shard
+        self.shards = max(1, shards)
+        self.base_dir = Path(base_dir)
+        self._random = random.Random(seed)
+        self._files: Dict[Path, _FileSource] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        rules = {}
+        for name, spec in (schema or {}).items():
+            if isinstance(spec, dict) and spec.get("feed"):
+                rules[name] = (spec.get("type"), spec["feed"])
+        for name, rule in (overrides or {}).items():
+            spec = (schema or {}).get(name)
+            rules[name] = (spec.get("type") if isinstance(spec, dict) else None, rule)
+        self._generators: List[Tuple[str, Callable[[int, Dict[Path, Dict[str, Any]]], Any]]] = [
+            (name, self._compile(name, field_type, rule)) for name, (field_type, rule) in rules.items()
+        ]
+
+    @property
+    def dynamic(self) -> bool:
+        """是否有需要逐次生成的字段"""
+        return bool(self._generators)
+
+    def _compile(self, name: str, field_type: Optional[str], rule: Any) -> Callable:
+        if not isinstance(rule, dict):
+            raise FeederError(f"feed rule for {name} must be a mapping")
+        field_type = (field_type or "").lower()
+        rnd = self._random
+
+        if "sequence" in rule:
+            seq = rule["sequence"] if isinstance(rule["sequence"], dict) else {}
+            start, step = seq.get("start", 1), seq.get("step", 1)
+            if not all(isinstance(v, (int, float)) for v in (start, step)):
+                raise FeederError(f"sequence start / step for {name} must be numbers")
+            return lambda n, rows: start + n * step
+
+        if "range" in rule:
+            try:
+                low, high = rule["range"]
+            except (TypeError, ValueError):
+                raise FeederError(f"range for {name} must be [min, max]")
+            if not all(isinstance(v, (int, float)) for v in (low, high)):
+                raise FeederError(f"range for {name} must contain numbers")
+            if field_type in FLOAT_TYPES or isinstance(low, float) or isinstance(high, float):
+                return lambda n, rows: rnd.uniform(low, high)
+            low, span = int(low), int(high) - int(low) + 1
+            if span <= 0:
+                raise FeederError(f"range for {name} must have min <= max")
+            rand = rnd.random
+            return lambda n, rows: low + int(rand() * span)
+
+        if "choices" in rule:
+            choices = list(rule["choices"] or [])
+            if not choices:
+                raise FeederError(f"choices for {name} must not be empty")
+            weights = rule.get("weights")
+            if weights:
+                if not isinstance(weights, list) or len(weights) != len(choices) \
+                        or not all(isinstance(w, (int, float)) for w in weights):
+                    raise FeederError(f"weights for {name} must be numbers, one per choice")
+                cum = list(itertools.accumulate(weights))
+                return lambda n, rows: rnd.choices(choices, cum_weights=cum)[0]
+            return lambda n, rows: rnd.choice(choices)
+
+        if "file" in rule:
+            # 规则可能来自请求体，数据文件只允许位于用例目录之内 (不接受绝对路径或 .. 跳出目录)
+            base_dir = self.base_dir.resolve()
+            path = (base_dir / str(rule["file"])).resolve()
+            if not path.is_relative_to(base_dir):
+                raise FeederError(f"data file for {name} must be inside {base_dir.name}/")
+            if path not in self._files:
+                source = _FileSource(path, self.shard, self.shards, path.relative_to(base_dir).as_posix())
+                source.check()
+                self._files[path] = source
+            source = self._files[path]
+            get = source.getter(rule.get("column", name))
+
+            def from_file(n, rows):
+                row = rows.get(path)
+                if row is None:
+                    row = rows[path] = source.next_row()
+                return get(row)
+            return from_file
+
+        if "template" in rule:
+            template = str(rule["template"])
+            try:
+                template.format(n=0)
+            except (AttributeError, KeyError, IndexError, ValueError) as e:
+                raise FeederError(f"invalid template for {name}: {e!r}")
+            return lambda n, rows: template.format(n=n)
+
+        raise FeederError(f"unknown feed rule for {name}: {sorted(rule)}")
+
+    def generate(self, count: int) -> List[Dict[str, Any]]:
+        """按顺序生成 count 组参数 (线程安全)"""
+        base = self.base_params
+        generators = self._generators
+        out = []
+        with self._lock:
+            for _ in range(count):
+                # 分片之间交错取号，全局序号不重复
+                n = next(self._counter) * self.shards + self.shard
+                rows: Dict[Path, Dict[str, Any]] = {}
+                params = dict(base)
+                for name, generate in generators:
+                    params[name] = generate(n, rows)
+                out.append(params)
+        return out
+
+
+_DONE = object()
+
+
+class PayloadQueue:
+    """
+    在后台线程中按批预先生成参数，并可选地预处理为可直接发送的请求 (如 protobuf 预编码)，
+    发送循环只从队列中取出现成的 (参数, 请求)，参数生成不在调用的关键路径上。
+    """
+
+    def __init__(
+        self,
+        feeder: ParamFeeder,
+        prepare: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        total: Optional[int] = None,
+        batch_size: int = BATCH_SIZE,
+        prefetch: int = PREFETCH_BATCHES,
+    ):
+        self.feeder = feeder
+        self.prepare = prepare
+        self.total = total
+        self.batch_size = max(1, batch_size if total is None else min(batch_size, max(total, 1)))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+        self._current: Iterator[Tuple[Dict[str, Any], Any]] = iter(())
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._produce, name="param-feeder", daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        produced = 0
+        try:
+            while not self._closed.is_set() and (self.total is None or produced < self.total):
+                n = self.batch_size if self.total is None else min(self.batch_size, self.total - produced)
+                batch = self.feeder.generate(n)
+                prepared = [(p, self.prepare(p) if self.prepare else p) for p in batch]
+                produced += n
+                while not self._closed.is_set():
+                    try:
+                        self._queue.put(prepared, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except BaseException as e:
+            self._error = e
+        finally:
+            # 与放入批次相同：队列满时等待消费方取走，关闭后不再等待 (get 会发现生成线程已退出)
+            while True:
+                try:
+                    self._queue.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    if self._closed.is_set():
+                        break
+
+    def get(self) -> Tuple[Dict[str, Any], Any]:
+        """取出下一组 (参数, 预处理后的请求)；全部取完后抛出 StopIteration"""
+        with self._lock:
+            while True:
+                item = next(self._current, None)
+                if item is not None:
+                    return item
+                try:
+                    batch = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._thread.is_alive():
+                        continue
+                    # 生成线程已退出且结束标记未能放入队列
+                    batch = _DONE
+                if batch is _DONE:
+                    # 保留结束标记，让其他等待的调用方也能结束
+                    self._current = iter(())
+                    try:
+                        self._queue.put_nowait(_DONE)
+                    except queue.Full:
+                        pass
+                    if self._error is not None:
+                        raise FeederError(str(self._error))
+                    raise StopIteration
+                self._current = iter(batch)
+
+    def close(self):
+        self._closed.set()
@@ -0,0 +1,584 @@
+import os
+import json
+import zlib
+import base64
+import hashlib
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+from app.config import DB_PATH, HISTORY_CONFIG
+
+INSERT_SQL = """
+    INSERT INTO history (
+        username, action, protocol_name, target_url,
+        request_body, response_body, assertions, created_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 紧凑格式：一次多结果运行拆分为运行头 (history) + 逐条结果 (history_results)，
+# 响应体与断言结果按内容哈希去重存入 history_blobs
+INSERT_RUN_SQL = """
+    INSERT INTO history (
+        username, action, protocol_name, target_url,
+        request_body, response_body, assertions, created_at,
+        result_count, response_digest
+    ) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?)
+"""
+INSERT_RESULT_SQL = """
+    INSERT INTO history_results (
+        history_id, idx, body_hash, assertions_hash, elapsed_ms,
+        status, start_time, end_time, extra
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_BLOB_SQL = "INSERT OR IGNORE INTO history_blobs (hash, encoding, body, size) VALUES (?, ?, ?, ?)"
+
+# 逐条结果中以独立列存储的字段，其余字段 (error、random 等) 存入 extra
+_RESULT_FIELDS = frozenset((
+    "index", "request_params", "response", "assertions",
+    "timestamp", "start_time", "end_time", "elapsed_ms",
+))
+# response_digest 最多保留的不同响应数与总长度 (仅用于全文检索)
+DIGEST_MAX_BODIES = 20
+DIGEST_MAX_CHARS = 64 * 1024
+
+# 停止写入线程的哨兵
+_STOP = object()
+
+
+def _to_json(value: Any, default: str = "null") -> str:
+    # 字符串同样编码为 JSON 字符串：兼容视图以 json() 读取这些列，原样存储的文本会被判为非法 JSON
+    if value is None:
+        return default
+    return json.dumps(value, ensure_ascii=False)
+
+
+def blob_text(encoding: Optional[str], body: Any) -> Optional[str]:
+    """还原 history_blobs 中的内容 (注册为 SQL 函数 blob_text，供兼容视图使用)"""
+    if body is None:
+        return None
+    if encoding == "zlib":
+        return zlib.decompress(body).decode("utf-8")
+    return body if isinstance(body, str) else bytes(body).decode("utf-8")
+
+
+def register_sql_functions(conn: sqlite3.Connection):
+    """在连接上注册读取紧凑历史所需的 SQL 函数"""
+    conn.create_function("blob_text", 2, blob_text, deterministic=True)
+
+
+def _result_status(result: Dict[str, Any]) -> str:
+    if "error" in result:
+        return "error"
+    if any(a.get("status") != "pass" for a in result.get("assertions") or ()):
+        return "fail"
+    return "ok"
+
+
+class HistoryWriter:
+    """
+    历史记录的异步批量写入器 (write-behind)。
+
+    请求线程只把记录放入有界内存队列，后台线程按批从队列取出，
+    在一个事务内批量插入。队列满时丢弃新记录并计数，不阻塞请求。
+    数据库使用 WAL 日志模式，读写互不阻塞。
+
+    结果数不少于 compact_min_results 的运行以紧凑格式存储：
+    相同的响应体只存一份，超过 compress_threshold 字节的内容用 zlib 压缩。
+    """
+
+    def __init__(
+        self,
+        db_path=DB_PATH,
+        queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+        synchronous: str = "NORMAL",
+        compact_min_results: int = 2,
+        compress_threshold: int = 1024,
+        retention: Optional[Dict[str, Any]] = None,
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_min_results = max(int(compact_min_results), 1)
+        self.compress_threshold = int(compress_threshold)
+        # 保留策略，见 compact_history；compact_interval 为后台线程自动执行的间隔 (秒)
+        self.retention = dict(retention or {})
+        self._next_compact = 0.0
+        if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+        self.synchronous = synchronous
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0,
+            "compact_runs": 0, "result_rows": 0, "blobs_written": 0, "blob_hits": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # 生产者接口
+    # ------------------------------------------------------------------
+    def submit(
+        self,
+        username: str,
+        protocol_name: str,
+        target_url: str,
+        request_params: Any,
+        response_data: Any,
+        assertions: Any = None,
+        action: str = "test_protocol",
+    ) -> bool:
+        """将一条历史记录放入队列，队列已满时丢弃并返回 False"""
+        self._ensure_started()
+        item = (
+            username, action, protocol_name, target_url,
+            request_params, response_data, assertions,
+            datetime.utcnow().isoformat() + "Z",
+        )
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return False
+        self._stats["enqueued"] += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中已有的记录全部写入，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 10):
+        """写完队列中剩余记录后停止后台线程 (进程退出时自动调用)"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("History queue is full, stopping writer without draining")
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        data = dict(self._stats)
+        data["queue_depth"] = self._queue.qsize()
+        data["queue_size"] = self._queue.maxsize
+        data["running"] = bool(self._thread and self._thread.is_alive())
+        return data
+
+    # ------------------------------------------------------------------
+    # 后台写入
+    # ------------------------------------------------------------------
+    def _ensure_started(self):
+        # fork 出的子进程中线程不会被继承，需要按进程重新启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # 子进程继承的队列状态可能不一致，重新创建
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        register_sql_functions(conn)
+        return conn
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                self._maybe_compact(conn)
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = [item]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = any(i is _STOP for i in batch)
+                rows = [i for i in batch if i is not _STOP]
+                try:
+                    if rows:
+                        self._write(conn, rows)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if stop:
+                    # 哨兵之后仍可能有记录，写完再退出
+                    self._drain(conn)
+                    return
+        finally:
+            conn.close()
+
+    def _drain(self, conn: sqlite3.Connection):
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        rows = [i for i in items if i is not _STOP]
+        try:
+            if rows:
+                self._write(conn, rows)
+        finally:
+            for _ in items:
+                self._queue.task_done()
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """在一个事务中批量插入，保持提交顺序与 id 顺序一致"""
+        try:
+            # 同一批次内已写入的 内容 -> 哈希，避免重复哈希与压缩
+            blobs: Dict[str, str] = {}
+            inline = []
+            with conn:
+                for row in rows:
+                    if self._is_compact(row[5]):
+                        if inline:
+                            conn.executemany(INSERT_SQL, inline)
+                            inline = []
+                        self._insert_compact(conn, row, blobs)
+                    else:
+                        inline.append(self._inline_params(row))
+                if inline:
+                    conn.executemany(INSERT_SQL, inline)
+            self._stats["written"] += len(rows)
+            self._stats["batches"] += 1
+        except Exception as e:
+            # 避免写入失败导致后台线程退出，仅记录错误
+            self._stats["errors"] += len(rows)
+            logger.error(f"Failed to write {len(rows)} history rows: {e}")
+
+    def _is_compact(self, response_data: Any) -> bool:
+        return (
+            isinstance(response_data, list)
+            and len(response_data) >= self.compact_min_results
+            and all(isinstance(r, dict) and "response" in r for r in response_data)
+        )
+
+    @staticmethod
+    def _inline_params(row: tuple) -> tuple:
+        (username, action, protocol_name, target_url,
+         request_params, response_data, assertions, created_at) = row
+        return (
+            username, action, protocol_name, target_url,
+            _to_json(request_params),
+            _to_json(response_data),
+            _to_json(assertions, default="[]") if assertions else "[]",
+            created_at,
+        )
+
+    def _insert_compact(self, conn: sqlite3.Connection, row: tuple, blobs: Dict[str, str]):
+        """以运行头 + 逐条结果 + 去重内容块的形式写入一次运行"""
+        (username, action, protocol_name, target_url,
+         request_params, results, assertions, created_at) = row
+
+        result_rows = []
+        digest: List[str] = []
+        digest_chars = 0
+        for position, result in enumerate(results):
+            text = _to_json(result.get("response"))
+            known = text in blobs
+            body_hash = self._store_blob(conn, text, blobs)
+            if not known and len(digest) < DIGEST_MAX_BODIES and digest_chars + len(text) <= DIGEST_MAX_CHARS:
+                digest.append(text)
+                digest_chars += len(text)
+
+            checked = result.get("assertions")
+            assertions_hash = self._store_blob(conn, _to_json(checked), blobs) if checked else None
+
+            extra = {k: v for k, v in result.items() if k not in _RESULT_FIELDS}
+            # 与运行参数相同的 request_params / timestamp 不重复存储
+            if result.get("request_params") != request_params:
+                extra["request_params"] = result.get("request_params")
+            if result.get("timestamp") != result.get("end_time"):
+                extra["timestamp"] = result.get("timestamp")
+
+            result_rows.append((
+                None, result.get("index", position), body_hash, assertions_hash,
+                result.get("elapsed_ms"), _result_status(result),
+                result.get("start_time"), result.get("end_time"),
+                _to_json(extra) if extra else None,
+            ))
+
+        cur = conn.execute(INSERT_RUN_SQL, (
+            username, action, protocol_name, target_url,
+            _to_json(request_params),
+            _to_json(assertions, default="[]") if assertions else "[]",
+            created_at, len(results), "\n".join(digest),
+        ))
+        history_id = cur.lastrowid
+        conn.executemany(INSERT_RESULT_SQL, [(history_id,) + r[1:] for r in result_rows])
+        self._stats["compact_runs"] += 1
+        self._stats["result_rows"] += len(result_rows)
+
+    def _store_blob(self, conn: sqlite3.Connection, text: str, blobs: Dict[str, str]) -> str:
+        """按内容哈希写入内容块，已存在时只返回哈希"""
+        body_hash = blobs.get(text)
+        if body_hash is not None:
+            self._stats["blob_hits"] += 1
+            return body_hash
+
+        raw = text.encode("utf-8")
+        body_hash = hashlib.sha1(raw).hexdigest()
+        blobs[text] = body_hash
+        encoding, body = "json", text
+        if len(raw) >= self.compress_threshold:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                encoding, body = "zlib", packed
+        cur = conn.execute(INSERT_BLOB_SQL, (body_hash, encoding, body, len(raw)))
+        if cur.rowcount:
+            self._stats["blobs_written"] += 1
+        else:
+            self._stats["blob_hits"] += 1
+        return body_hash
+
+    # ------------------------------------------------------------------
+    # 保留策略
+    # ------------------------------------------------------------------
+    def _maybe_compact(self, conn: sqlite3.Connection):
+        interval = float(self.retention.get("compact_interval") or 0)
+        if interval <= 0 or time.monotonic() < self._next_compact:
+            return
+        self._next_compact = time.monotonic() + interval
+        try:
+            result = compact_history(conn, **_retention_args(self.retention))
+            if any(result.values()):
+                logger.info(f"History compaction: {result}")
+        except Exception as e:
+            logger.error(f"History compaction failed: {e}")
+
+    def compact(self, **overrides) -> Dict[str, int]:
+        """
+        立即执行一次保留策略 (在调用线程中使用独立连接)。
+        :param overrides: 覆盖配置中的 retention_days / downsample_after_days / downsample_keep_every
+        """
+        options = dict(self.retention)
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        conn = self._connect()
+        try:
+            return compact_history(conn, **_retention_args(options))
+        finally:
+            conn.close()
+
+
+def _retention_args(options: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "retention_days": float(options.get("retention_days") or 0),
+        "downsample_after_days": float(options.get("downsample_after_days") or 0),
+        "keep_every": int(options.get("downsample_keep_every") or 10),
+    }
+
+
+def compact_history(
+    conn: sqlite3.Connection,
+    retention_days: float = 0,
+    downsample_after_days: float = 0,
+    keep_every: int = 10,
+    now: Optional[datetime] = None,
+) -> Dict[str, int]:
+    """
+    历史保留策略 (0 表示不启用对应步骤)：
+    - 删除早于 retention_days 天的运行
+    - 早于 downsample_after_days 天的紧凑运行只保留错误/断言失败的结果以及每 keep_every 条中的一条
+    - 删除不再被任何结果引用的内容块
+    降采样可重复执行，结果不变。
+    """
+    now = now or datetime.utcnow()
+    result = {"deleted_runs": 0, "deleted_results": 0, "downsampled_results": 0, "deleted_blobs": 0}
+    with conn:
+        if retention_days > 0:
+            cutoff = (now - timedelta(days=retention_days)).isoformat() + "Z"
+            cur = conn.execute(
+                "DELETE FROM history_results WHERE history_id IN (SELECT id FROM history WHERE created_at < ?)",
+                (cutoff,),
+            )
+            result["deleted_results"] = cur.rowcount
+            result["deleted_runs"] = conn.execute("DELETE FROM history WHERE created_at < ?", (cutoff,)).rowcount
+
+        if downsample_after_days > 0 and keep_every > 1:
+            cutoff = (now - timedelta(days=downsample_after_days)).isoformat() + "Z"
+            cur = conn.execute(
+                """
+                DELETE FROM history_results
+                WHERE status = 'ok' AND idx % ? != 0 AND history_id IN (
+                    SELECT id FROM history WHERE created_at < ? AND result_count IS NOT NULL
+                )
+                """,
+                (keep_every, cutoff),
+            )
+            result["downsampled_results"] = cur.rowcount
+
+        if any(result.values()):
+            cur = conn.execute(
+                """
+                DELETE FROM history_blobs
+                WHERE NOT EXISTS (SELECT 1 FROM history_results WHERE body_hash = history_blobs.hash)
+                  AND NOT EXISTS (SELECT 1 FROM history_results WHERE assertions_hash = history_blobs.hash)
+                """
+            )
+            result["deleted_blobs"] = cur.rowcount
+    return result
+
+
+# 模块级单例
+history_writer = HistoryWriter(
+    queue_size=int(HISTORY_CONFIG.get("queue_size", 10000)),
+    batch_size=int(HISTORY_CONFIG.get("batch_size", 200)),
+    flush_interval=float(HISTORY_CONFIG.get("flush_interval", 0.5)),
+    synchronous=str(HISTORY_CONFIG.get("synchronous", "NORMAL")).upper(),
+    compact_min_results=int(HISTORY_CONFIG.get("compact_min_results", 2)),
+    compress_threshold=int(HISTORY_CONFIG.get("compress_threshold", 1024)),
+    retention=HISTORY_CONFIG.get("retention"),
+)
+atexit.register(history_writer.stop)
+
+
+# ----------------------------------------------------------------------
+# 历史查询
+# ----------------------------------------------------------------------
+
+# 可精确匹配过滤的列 (均有对应的 (列, created_at, id) 索引)
+FILTER_COLUMNS = ("username", "protocol_name", "target_url")
+# 列表与导出输出的列
+HISTORY_COLUMNS = (
+    "id", "username", "action", "protocol_name", "target_url",
+    "request_body", "response_body", "assertions", "created_at",
+)
+
+
+def encode_cursor(created_at: str, row_id: int) -> str:
+    """将最后一条记录的 (created_at, id) 编码为不透明的分页游标"""
+    raw = json.dumps([created_at, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def build_history_query(
+    filters: Dict[str, Any],
+    columns=HISTORY_COLUMNS,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Tuple[str, List[Any]]:
+    """
+    构造历史查询 SQL，按 (created_at, id) 倒序。
+    :param filters: username / protocol_name / target_url 精确匹配，
+                    since / until 为 created_at 的 ISO 时间范围 [since, until)，
+                    q 为请求/响应内容的全文检索表达式 (FTS5 语法)
+    :param cursor: 上一页返回的游标，使用键集分页而不是 OFFSET
+    需要 response_body 时从兼容视图 history_compat 读取 (还原紧凑格式的结果数组)。
+    """
+    where, args = [], []
+    for column in FILTER_COLUMNS:
+        value = filters.get(column)
+        if value:
+            where.append(f"{column} = ?")
+            args.append(value)
+    if filters.get("since"):
+        where.append("created_at >= ?")
+        args.append(filters["since"])
+    if filters.get("until"):
+        where.append("created_at < ?")
+        args.append(filters["until"])
+    if filters.get("q"):
+        where.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+        args.append(filters["q"])
+    if cursor:
+        where.append("(created_at, id) < (?, ?)")
+        args.extend(decode_cursor(cursor))
+
+    source = "history_compat" if "response_body" in columns else "history"
+    sql = f"SELECT {', '.join(columns)} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+    return sql, args
+
+
+def _decode_json(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def row_to_dict(row, decode_json: bool = True) -> Dict[str, Any]:
+    """sqlite3.Row 转字典，JSON 列解析为对象"""
+    data = dict(row)
+    if decode_json:
+        for key in ("request_body", "response_body", "assertions"):
+            if key in data:
+                data[key] = _decode_json(data[key])
+    return data
+
+
+def query_history(conn: sqlite3.Connection, filters: Dict[str, Any], cursor: Optional[str] = None,
+                  limit: int = 50, columns=HISTORY_COLUMNS) -> Dict[str, Any]:
+    """查询一页历史记录，返回 items 与下一页游标 (没有更多数据时为 None)"""
+    sql, args = build_history_query(filters, columns, cursor, limit + 1)
+    rows = conn.execute(sql, args).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more and rows else None
+    return {"items": [row_to_dict(r) for r in rows], "next_cursor": next_cursor}
+
+
+def iter_history(db_path, filters: Dict[str, Any], batch_size: int = 500) -> Iterator[sqlite3.Row]:
+    """
+    流式遍历满足条件的历史记录。
+    使用独立的只读连接和服务端游标按批取数，不会一次性把结果载入内存。
+    """
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    register_sql_functions(conn)
+    try:
+        sql, args = build_history_query(filters)
+        cursor = conn.execute(sql, args)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
@@ -0,0 +1,449 @@
+import math
+import time
+import uuid
+import atexit
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from app.assertions import compile_rules, evaluate
+from app.config import JOBS_CONFIG
+from app.feeder import FeederError, ParamFeeder, PayloadQueue
+from app.connect import (
+    execute_protocol, is_error_response, log_protocol_history, prepare_protocol_params, resolve_url,
+)
+from app.stats import LatencyHistogram
+
+# 任务状态
+PENDING, RUNNING, STOPPING, FINISHED, STOPPED, FAILED = "pending", "running", "stopping", "finished", "stopped", "failed"
+FINAL_STATES = (FINISHED, STOPPED, FAILED)
+
+# 调度线程单次休眠的上限 (秒)，保证 stop 能及时生效
+MAX_SLEEP = 0.05
+
+
+def parse_stages(spec: Dict[str, Any]) -> List[Dict[str, float]]:
+    """
+    解析负载阶段。
+    - stages: [{"duration": 秒, "rate": 目标每秒请求数}, ...]，每个阶段内从上一阶段的速率线性过渡到 rate
+    - 或 rate + duration (+ ramp_up)：先在 ramp_up 秒内从 0 升到 rate，再以 rate 保持 duration 秒
+    """
+    stages = spec.get("stages")
+    if stages is None:
+        rate = float(spec.get("rate") or 0)
+        duration = float(spec.get("duration") or 0)
+        ramp_up = float(spec.get("ramp_up") or 0)
+        stages = ([{"duration": ramp_up, "rate": rate}] if ramp_up > 0 else []) + [{"duration": duration, "rate": rate}]
+        start_rate = 0.0 if ramp_up > 0 else rate
+    else:
+        start_rate = float(spec.get("start_rate") or 0)
+
+    if not isinstance(stages, list):
+        raise ValueError("stages must be a list")
+    parsed = []
+    for stage in stages:
+        if not isinstance(stage, dict):
+            raise ValueError("each stage must be an object with duration and rate")
+        duration = float(stage.get("duration") or 0)
+        rate = float(stage.get("rate") or 0)
+        if duration <= 0 or rate < 0:
+            raise ValueError("each stage needs duration > 0 and rate >= 0")
+        parsed.append({"duration": duration, "from": start_rate, "rate": rate})
+        start_rate = rate
+    if not parsed or not any(s["rate"] > 0 or s["from"] > 0 for s in parsed):
+        raise ValueError("load profile needs a positive rate and duration")
+    return parsed
+
+
+class LoadPlan:
+    """
+    按阶段计算任意时刻的目标到达速率 (开放模型：发送时刻只由计划决定，不等待上一个响应)。
+    第 n 个请求在累计期望请求数 ∫rate dt 达到 n 时发送，整个计划的发送次数等于速率曲线下的面积 (向下取整)。
+    """
+
+    def __init__(self, stages: List[Dict[str, float]]):
+        self.stages = stages
+        self.duration = sum(s["duration"] for s in stages)
+        # 速率曲线下的面积，及计划发送的请求数
+        self.total = sum(self._area(s, s["duration"]) for s in stages)
+        self.count = int(self.total + 1e-9 * max(1.0, self.total))
+
+    def rate_at(self, t: float) -> float:
+        for stage in self.stages:
+            if t < stage["duration"]:
+                return stage["from"] + (stage["rate"] - stage["from"]) * t / stage["duration"]
+            t -= stage["duration"]
+        return 0.0
+
+    @staticmethod
+    def _area(stage: Dict[str, float], u: float) -> float:
+        """阶段开始后 u 秒内的期望请求数"""
+        return stage["from"] * u + (stage["rate"] - stage["from"]) * u * u / (2 * stage["duration"])
+
+    @staticmethod
+    def _solve(stage: Dict[str, float], area: float) -> float:
+        """阶段内累计期望请求数达到 area 的时刻 (线性速率下解二次方程)"""
+        start = stage["from"]
+        slope = (stage["rate"] - start) / stage["duration"]
+        root = math.sqrt(max(start * start + 2 * slope * area, 0.0))
+        # 与 (-start + root) / slope 等价，slope 接近 0 时数值稳定
+        denominator = start + root
+        u = 2 * area / denominator if denominator > 0 else stage["duration"]
+        return min(u, stage["duration"])
+
+    def send_time(self, n: int) -> Optional[float]:
+        """第 n 个请求 (从 1 开始) 的计划发送时刻 (相对开始时间，秒)；超出计划总数时返回 None"""
+        # 按序号直接求解，不从上一个发送时刻累加，长时间运行也不会累积误差
+        if n > self.count:
+            return None
+        remaining = float(n)
+        start = 0.0
+        for stage in self.stages:
+            stage_area = self._area(stage, stage["duration"])
+            if remaining <= stage_area:
+                return start + self._solve(stage, remaining)
+            remaining -= stage_area
+            start += stage["duration"]
+        return self.duration
+
+
+class LoadJob:
+    """
+    后台按目标到达速率运行一个协议。
+
+    调度线程按计划时刻提交调用，执行线程池最多同时在途 max_in_flight 个调用；
+    线程池繁忙时请求在队列中等待，但延迟仍从计划发送时刻起算 (修正协调遗漏)，
+    排队超过 max_queue 时不再提交并计为 missed。
+    """
+
+    def __init__(
+        self,
+        case: Dict[str, Any],
+        params: Dict[str, Any],
+        stages: List[Dict[str, float]],
+        global_url: str,
+        assertions: Optional[List[Any]] = None,
+        max_in_flight: int = 64,
+        max_queue: int = 10000,
+        username: Optional[str] = None,
+        feed: Any = None,
+        shard: Tuple[int, int] = (0, 1),
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.case = case
+        self.params = params
+        self.plan = LoadPlan(stages)
+        self.global_url = global_url
+        self.assertion_rules = case.get("assertions", []) if assertions is None else assertions
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_queue = max(1, int(max_queue))
+        self.username = username
+        # 参数生成规则 (同 call_protocol 的 feed)；shard 为 (分片序号, 分片数)，多进程运行时保证生成的数据不重复
+        self.feed = feed
+        self.shard = shard
+        self._feeder: Optional[ParamFeeder] = None
+        if feed:
+            feeder = ParamFeeder(
+                case.get("params"), params, overrides=feed if isinstance(feed, dict) else None,
+                shard=shard[0], shards=shard[1],
+            )
+            self._feeder = feeder if feeder.dynamic else None
+
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._compiled = compile_rules(self.assertion_rules)
+        self._assertion_counts = [{"rule": r.rule, "pass": 0, "fail": 0, "error": 0} for r in self._compiled]
+
+        self.scheduled = 0
+        self.completed = 0
+        self.errors = 0
+        self.assertion_failures = 0
+        self.missed = 0
+        self.cancelled = 0
+        # 从计划发送时刻起算的延迟 / 从实际开始执行起算的服务时间
+        self.latency = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        # 每秒完成数与错误数 [秒, 完成, 错误]
+        self.timeline: List[List[int]] = []
+
+    # ------------------------------------------------------------------
+    # 控制
+    # ------------------------------------------------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"load-job-{self.id}", daemon=True)
+        self.state = RUNNING
+        self._thread.start()
+
+    def stop(self):
+        """请求停止：不再提交新的调用，丢弃排队中的调用，等待执行中的调用结束"""
+        if self.state in (PENDING, RUNNING):
+            self.state = STOPPING
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINAL_STATES
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+    def _run(self):
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix=f"job-{self.id}")
+        payloads = None
+        try:
+            if self._feeder is not None:
+                payloads = PayloadQueue(
+                    self._feeder, lambda p: prepare_protocol_params(self.case, p, self.global_url)
+                )
+            call_params = prepare_protocol_params(self.case, self.params, self.global_url)
+            perf = time.perf_counter
+            self.started_at = perf()
+            sent = 0
+            while not self._stop.is_set():
+                sent += 1
+                offset = self.plan.send_time(sent)
+                if offset is None:
+                    break
+                due = self.started_at + offset
+                # 等到计划时刻；落后于计划时不等待，直接补发
+                while not self._stop.is_set():
+                    remaining = due - perf()
+                    if remaining <= 0:
+                        break
+                    self._stop.wait(min(remaining, MAX_SLEEP))
+                if self._stop.is_set():
+                    break
+                with self._lock:
+                    self.scheduled += 1
+                    backlog = self.scheduled - self.completed - self.missed
+                    if backlog > self.max_in_flight + self.max_queue:
+                        self.missed += 1
+                        continue
+                executor.submit(self._call, call_params, due, payloads)
+        except Exception as e:
+            logger.error(f"Load job {self.id} failed: {e}")
+            self.error = str(e)
+        finally:
+            # 停止时丢弃仍在排队的调用，只等待已开始执行的调用
+            executor.shutdown(wait=True, cancel_futures=self._stop.is_set())
+            if payloads is not None:
+                payloads.close()
+            with self._lock:
+                self.cancelled = self.scheduled - self.completed - self.missed
+            self.ended_at = time.perf_counter()
+            if self.error:
+                self.state = FAILED
+            elif self._stop.is_set():
+                self.state = STOPPED
+            else:
+                self.state = FINISHED
+                if self.scheduled != self.plan.count:
+                    logger.warning(f"Load job {self.id} scheduled {self.scheduled} calls, plan expects {self.plan.count}")
+            self._log_history()
+
+    def _call(self, params: Any, due: float, payloads: Optional[PayloadQueue] = None):
+        # 在线程池中执行，异常不会被取回，必须在这里计入结果，否则调用会悄无声息地消失
+        try:
+            self._execute(params, due, payloads)
+        except Exception as e:
+            if isinstance(e, FeederError):
+                # 参数源失败后后续调用都拿不到参数，整个任务失败
+                with self._lock:
+                    if not self.error:
+                        logger.error(f"Load job {self.id} feed failed: {e}")
+                        self.error = str(e)
+                self._stop.set()
+            else:
+                logger.error(f"Load job {self.id} call failed: {e}")
+            self._record(None, None, time.perf_counter(), True, [])
+
+    def _execute(self, params: Any, due: float, payloads: Optional[PayloadQueue]):
+        request_params = self.params
+        if payloads is not None:
+            request_params, params = payloads.get()
+        started = time.perf_counter()
+        response = execute_protocol(self.case, params, global_url=self.global_url)
+        ended = time.perf_counter()
+        failed = is_error_response(response)
+        # 断言在执行线程内求值，每次使用独立的作用域
+        checked = evaluate(self._compiled, response, request_params) if self._compiled and not failed else []
+        self._record(due, started, ended, failed, checked)
+
+    def _record(self, due: Optional[float], started: Optional[float], ended: float, failed: bool, checked: List[Dict[str, Any]]):
+        """记录一次调用的结果；due/started 为 None 表示调用未能发出，只计为错误，不计入延迟"""
+        second = int(ended - self.started_at)
+        with self._lock:
+            self.completed += 1
+            if failed:
+                self.errors += 1
+            if any(item["status"] != "pass" for item in checked):
+                self.assertion_failures += 1
+            for counts, item in zip(self._assertion_counts, checked):
+                counts[item["status"]] += 1
+            if due is not None:
+                self.latency.record((ended - due) * 1000)
+                self.service_time.record((ended - started) * 1000)
+            while len(self.timeline) <= second:
+                self.timeline.append([len(self.timeline), 0, 0])
+            self.timeline[second][1] += 1
+            if failed:
+                self.timeline[second][2] += 1
+
+    def _log_history(self):
+        if not self.username:
+            return
+        target = self.case.get("target_config", {})
+        if (self.case.get("call_type") or "socket").lower() == "http":
+            target_url = resolve_url(self.global_url, target.get("url", ""))
+        else:
+            target_url = f"{target.get('host')}:{target.get('port')}"
+        try:
+            log_protocol_history(
+                self.username, self.case.get("name", "Unknown Protocol"), target_url, self.params,
+                {"job": self.id, "summary": self.results(include_timeline=False)}, self.assertion_rules,
+            )
+        except Exception as e:
+            logger.error(f"Failed to log job history: {e}")
+
+    # ------------------------------------------------------------------
+    # 状态
+    # ------------------------------------------------------------------
+    def _elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return max(0.0, (self.ended_at or time.perf_counter()) - self.started_at)
+
+    def status(self) -> Dict[str, Any]:
+        """运行中也可查询的实时进度"""
+        elapsed = self._elapsed()
+        with self._lock:
+            # 最近一个完整秒的实际完成速率
+            last = self.timeline[-2][1] if len(self.timeline) >= 2 and not self.done else None
+            data = {
+                "id": self.id,
+                "protocol_id": self.case.get("id"),
+                "protocol_name": self.case.get("name"),
+                "state": self.state,
+                "created_at": self.created_at.isoformat() + "Z",
+                "elapsed_s": round(elapsed, 3),
+                "duration_s": self.plan.duration,
+                "progress": round(min(elapsed / self.plan.duration, 1.0), 4) if self.plan.duration else 1.0,
+                "target_rate": round(self.plan.rate_at(elapsed), 3) if not self.done else 0.0,
+                "planned": self.plan.count,
+                "current_rate": last,
+                "scheduled": self.scheduled,
+                "completed": self.completed,
+                "in_flight": self.scheduled - self.completed - self.missed - self.cancelled,
+                "errors": self.errors,
+                "assertion_failures": self.assertion_failures,
+                "missed": self.missed,
+                "latency_ms": self.latency.summary(),
+            }
+        if self.error:
+            data["error"] = self.error
+        return data
+
+    def snapshot(self) -> Dict[str, Any]:
+        """累计计数与直方图的可序列化快照 (多进程模式下由工作进程定期发送给协调进程合并)"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "error": self.error,
+                "elapsed": self._elapsed(),
+                "scheduled": self.scheduled,
+                "completed": self.completed,
+                "errors": self.errors,
+                "assertion_failures": self.assertion_failures,
+                "missed": self.missed,
+                "cancelled": self.cancelled,
+                "assertions": [dict(c) for c in self._assertion_counts],
+                "latency": self.latency.to_dict(),
+                "service_time": self.service_time.to_dict(),
+                "timeline": [list(row) for row in self.timeline],
+            }
+
+    def results(self, include_timeline: bool = True) -> Dict[str, Any]:
+        """
+        运行结果汇总；运行中调用时返回截至当前的部分结果。
+        latency_ms 从计划发送时刻起算，service_time_ms 从实际开始执行起算。
+        """
+        elapsed = self._elapsed()
+        with self._lock:
+            data = {
+                "id": self.id,
+                "state": self.state,
+                "stages": self.plan.stages,
+                "count": self.completed,
+                "success": self.completed - self.errors,
+                "errors": self.errors,
+                "assertion_failures": self.assertion_failures,
+                "missed": self.missed,
+                "cancelled": self.cancelled,
+                "wall_time_ms": round(elapsed * 1000, 3),
+                "throughput": round(self.completed / elapsed, 3) if elapsed > 0 else 0.0,
+                "latency_ms": self.latency.summary(),
+                "service_time_ms": self.service_time.summary(),
+                "assertions": [dict(c) for c in self._assertion_counts],
+            }
+            if include_timeline:
+                data["timeline"] = [{"second": s, "completed": c, "errors": e} for s, c, e in self.timeline]
+        return data
+
+
+class JobManager:
+    """进程内的负载任务表，保留最近 max_jobs 个任务，同时运行的任务数不超过 max_running"""
+
+    def __init__(self, max_running: int = 4, max_jobs: int = 50):
+        self.max_running = max_running
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, LoadJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, job: LoadJob) -> LoadJob:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if not j.done)
+            if running >= self.max_running:
+                raise RuntimeError(f"too many running jobs (max {self.max_running})")
+            self._jobs[job.id] = job
+            # 淘汰最早的已结束任务
+            for job_id in [k for k, j in self._jobs.items() if j.done][: max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[job_id]
+        job.start()
+        return job
+
+    def get(self, job_id: str) -> Optional[LoadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[LoadJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def stop_all(self, timeout: float = 10):
+        """停止全部任务并等待结束 (进程退出时自动调用)"""
+        jobs = self.list()
+        for job in jobs:
+            job.stop()
+        for job in jobs:
+            job.join(timeout)
+
+
+# 模块级单例
+job_manager = JobManager(
+    max_running=int(JOBS_CONFIG.get("max_running", 4)),
+    max_jobs=int(JOBS_CONFIG.get("max_jobs", 50)),
+)
+atexit.register(job_manager.stop_all)
@@ -0,0 +1,219 @@
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.config import METRICS_CONFIG
+
+# 调用耗时直方图的桶上界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 未开启分阶段计时时 phase() 返回的空上下文，不产生任何开销
+_NULL_PHASE = nullcontext()
+_current_timer: ContextVar[Optional["PhaseTimer"]] = ContextVar("phase_timer", default=None)
+
+
+class PhaseTimer:
+    """
+    一次调用的分阶段耗时。
+    处理器通过 phase(name) 记录各阶段 (connect / send / wait / read / encode / decode / assert)，
+    同名阶段多次出现时累加。
+    """
+
+    __slots__ = ("phases",)
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def as_ms(self) -> Dict[str, float]:
+        """各阶段耗时 (毫秒)"""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "started")
+
+    def __init__(self, timer: PhaseTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def phase(name: str):
+    """计时一个阶段；当前上下文没有激活的 PhaseTimer 时为空操作"""
+    timer = _current_timer.get()
+    if timer is None:
+        return _NULL_PHASE
+    return _Phase(timer, name)
+
+
+def current_timer() -> Optional[PhaseTimer]:
+    return _current_timer.get()
+
+
+def activate_timer(timer: PhaseTimer):
+    """在当前上下文 (线程 / asyncio 任务) 激活计时器，返回用于 deactivate_timer 的令牌"""
+    return _current_timer.set(timer)
+
+
+def deactivate_timer(token):
+    _current_timer.reset(token)
+
+
+class Histogram:
+    """固定桶的累积直方图 (Prometheus histogram 语义)，调用方负责加锁"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, 累积计数) 列表，包含 +Inf"""
+        total = 0
+        out = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            out.append(("+Inf" if bound == float("inf") else repr(bound), total))
+        return out
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """
+    进程内的协议调用指标。
+    按 (协议名, call_type) 统计调用数、错误数和耗时直方图；
+    开启分阶段计时的调用额外按阶段记录耗时直方图。
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (protocol, call_type) -> [calls, errors, Histogram]
+        self._calls: Dict[Tuple[str, str], list] = {}
+        # (protocol, call_type, phase) -> Histogram
+        self._phases: Dict[Tuple[str, str, str], Histogram] = {}
+
+    def observe_call(self, protocol: str, call_type: str, seconds: float, error: bool,
+                     timer: Optional[PhaseTimer] = None):
+        """记录一次调用"""
+        if not self.enabled:
+            return
+        key = (protocol, call_type)
+        with self._lock:
+            series = self._calls.get(key)
+            if series is None:
+                series = self._calls[key] = [0, 0, Histogram(self.buckets)]
+            series[0] += 1
+            if error:
+                series[1] += 1
+            series[2].observe(seconds)
+            if timer is not None:
+                for name, value in timer.phases.items():
+                    hist = self._phases.get(key + (name,))
+                    if hist is None:
+                        hist = self._phases[key + (name,)] = Histogram(self.buckets)
+                    hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._phases.clear()
+
+    def render(self, extra: Iterable[Tuple[str, str, Dict[str, Any], float]] = ()) -> str:
+        """
+        输出 Prometheus 文本格式 (0.0.4)。
+        :param extra: 额外的 (指标名, 类型, 标签, 值)，如连接池与历史写入队列的计数
+        """
+        with self._lock:
+            calls = [(k, v[0], v[1], _copy(v[2])) for k, v in self._calls.items()]
+            phases = [(k, _copy(h)) for k, h in self._phases.items()]
+
+        lines = [
+            "# HELP protocol_calls_total Protocol calls executed.",
+            "# TYPE protocol_calls_total counter",
+        ]
+        for (protocol, call_type), count, _, _ in calls:
+            lines.append(f"protocol_calls_total{_labels({'protocol': protocol, 'call_type': call_type})} {count}")
+        lines += [
+            "# HELP protocol_errors_total Protocol calls that returned an error.",
+            "# TYPE protocol_errors_total counter",
+        ]
+        for (protocol, call_type), _, errors, _ in calls:
+            lines.append(f"protocol_errors_total{_labels({'protocol': protocol, 'call_type': call_type})} {errors}")
+
+        lines += [
+            "# HELP protocol_call_duration_seconds Protocol call latency.",
+            "# TYPE protocol_call_duration_seconds histogram",
+        ]
+        for (protocol, call_type), _, _, hist in calls:
+            _render_histogram(lines, "protocol_call_duration_seconds", {"protocol": protocol, "call_type": call_type}, hist)
+
+        lines += [
+            "# HELP protocol_phase_duration_seconds Protocol call latency by phase (calls with timings enabled).",
+            "# TYPE protocol_phase_duration_seconds histogram",
+        ]
+        for (protocol, call_type, name), hist in phases:
+            _render_histogram(
+                lines, "protocol_phase_duration_seconds",
+                {"protocol": protocol, "call_type": call_type, "phase": name}, hist,
+            )
+
+        typed = set()
+        for name, kind, labels, value in extra:
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _copy(hist: Histogram) -> Histogram:
+    copy = Histogram(hist.buckets)
+    copy.counts = list(hist.counts)
+    copy.sum = hist.sum
+    copy.count = hist.count
+    return copy
+
+
+def _render_histogram(lines: List[str], name: str, labels: Dict[str, Any], hist: Histogram):
+    for le, count in hist.cumulative():
+        lines.append(f"{name}_bucket{_labels(dict(labels, le=le))} {count}")
+    lines.append(f"{name}_sum{_labels(labels)} {hist.sum!r}")
+    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+
+# 模块级单例
+metrics = MetricsRegistry(
+    enabled=bool(METRICS_CONFIG.get("enabled", True)),
+    buckets=tuple(float(b) for b in METRICS_CONFIG.get("buckets") or DEFAULT_BUCKETS),
+)
@@ -0,0 +1,307 @@
+import sys
+import json
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from loguru import logger
+from app.config import MOCK_CONFIG, TEST_CASES_PATH
+from app.connect.codec import get_codec
+from app.connect.socket import FRAMINGS, LENGTH_PREFIX, STREAM_LIMIT, encode_message
+from app.registry import TestCaseRegistry
+
+# 注入错误时返回的内容；{"error": ...} 在平台侧被识别为调用失败
+ERROR_PAYLOAD = {"error": "mock injected error"}
+HTTP_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+# HTTP 请求头的最大长度
+MAX_HEADER_SIZE = 64 * 1024
+
+
+class MockServer:
+    """
+    根据 test_cases 目录中的协议定义启动 mock 后端，返回各协议的 sample_return。
+
+    - http：所有 url 的 path 统一挂在一个 HTTP 端口上 (相对 url 需把全局服务器地址指向该端口)
+    - socket：按 target_config.port 监听，按 framing 分帧返回 JSON
+    - protobuf：按 target_config.port 监听，sample_return 预先用 response_class 编码，
+      以 4 字节长度前缀返回
+
+    latency_ms / jitter_ms 为每个请求注入的延迟 (均匀分布在 latency ± jitter)，
+    error_rate 为注入错误的概率：HTTP 返回 500，socket 返回 {"error": ...}，protobuf 返回截断的帧后断开连接。
+    """
+
+    def __init__(
+        self,
+        cases: List[Dict[str, Any]],
+        host: str = "127.0.0.1",
+        http_port: int = 8080,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+    ):
+        self.host = host
+        self.http_port = http_port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # path -> (协议名, 响应体字节)
+        self.http_routes: Dict[str, Tuple[str, bytes]] = {}
+        # port -> (协议名, call_type, framing, 预编码的响应帧)
+        self.tcp_routes: Dict[int, Tuple[str, str, str, bytes]] = {}
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._servers: List[asyncio.AbstractServer] = []
+        for case in cases:
+            try:
+                self._add_route(case)
+            except Exception as e:
+                logger.warning(f"Mock skipped {case.get('name')}: {e}")
+
+    # ------------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------------
+    def _add_route(self, case: Dict[str, Any]):
+        name = case.get("name")
+        call_type = (case.get("call_type") or "socket").lower()
+        config = case.get("target_config") or {}
+        sample = case.get("sample_return") or {}
+
+        if call_type == "http":
+            path = urlsplit(config.get("url") or "/").path or "/"
+            if not path.startswith("/"):
+                path = "/" + path
+            if path in self.http_routes:
+                logger.warning(f"Mock HTTP path {path} already served by {self.http_routes[path][0]}, skipping {name}")
+                return
+            self.http_routes[path] = (name, json.dumps(sample, ensure_ascii=False).encode("utf-8"))
+            return
+
+        port = config.get("port")
+        if not port:
+            raise ValueError("missing port")
+        port = int(port)
+        if port in self.tcp_routes:
+            logger.warning(f"Mock port {port} already served by {self.tcp_routes[port][0]}, skipping {name}")
+            return
+
+        if call_type == "protobuf":
+            codec = get_codec(config.get("proto_module"), config.get("request_class"), config.get("response_class"))
+            body = codec.encode_response(sample)
+            self.tcp_routes[port] = (name, call_type, "length", LENGTH_PREFIX.pack(len(body)) + body)
+        elif call_type == "socket":
+            framing = (config.get("framing") or "json").lower()
+            if framing not in FRAMINGS:
+                raise ValueError(f"unknown framing: {framing}")
+            self.tcp_routes[port] = (name, call_type, framing, encode_message(sample, framing))
+        else:
+            raise ValueError(f"unsupported call_type: {call_type}")
+
+    # ------------------------------------------------------------------
+    # 运行
+    # ------------------------------------------------------------------
+    async def start(self):
+        if self.http_routes:
+            self._servers.append(await asyncio.start_server(self._handle_http, self.host, self.http_port, limit=STREAM_LIMIT))
+            for path, (name, _) in self.http_routes.items():
+                logger.info(f"Mock http://{self.host}:{self.http_port}{path} -> {name}")
+        for port, (name, call_type, framing, _) in self.tcp_routes.items():
+            handler = self._handle_protobuf if call_type == "protobuf" else self._handle_socket
+            self._servers.append(await asyncio.start_server(
+                lambda r, w, p=port, h=handler: h(r, w, p), self.host, port, limit=STREAM_LIMIT
+            ))
+            logger.info(f"Mock {call_type}://{self.host}:{port} ({framing}) -> {name}")
+
+    async def serve_forever(self):
+        await self.start()
+        if not self._servers:
+            raise RuntimeError("No protocols to mock")
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self._servers))
+        finally:
+            self.close()
+
+    def close(self):
+        for server in self._servers:
+            server.close()
+        self._servers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": dict(self.requests), "errors": dict(self.errors)}
+
+    async def _delay(self) -> bool:
+        """注入延迟；返回 True 表示本次请求注入错误"""
+        if self.latency_ms or self.jitter_ms:
+            delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+            if delay > 0:
+                await asyncio.sleep(delay / 1000)
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    # ------------------------------------------------------------------
+    # HTTP (HTTP/1.1 keep-alive，仅支持 Content-Length 请求体)
+    # ------------------------------------------------------------------
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                if len(head) > MAX_HEADER_SIZE:
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split(" ")
+                if len(parts) != 3:
+                    await self._http_reply(writer, 400, b'{"error": "bad request"}', False)
+                    return
+                _, target, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    key, sep, value = line.partition(":")
+                    if sep:
+                        headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                path = target.split("?", 1)[0]
+                route = self.http_routes.get(path)
+                if route is None:
+                    await self._http_reply(writer, 404, b'{"error": "not found"}', keep_alive)
+                else:
+                    self.requests[route[0]] += 1
+                    if await self._delay():
+                        self.errors[route[0]] += 1
+                        await self._http_reply(writer, 500, json.dumps(ERROR_PAYLOAD).encode("utf-8"), keep_alive)
+                    else:
+                        await self._http_reply(writer, 200, route[1], keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _http_reply(writer: asyncio.StreamWriter, status: int, body: bytes, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {status} {HTTP_STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    # ------------------------------------------------------------------
+    # JSON socket
+    # ------------------------------------------------------------------
+    async def _handle_socket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int):
+        name, _, framing, payload = self.tcp_routes[port]
+        try:
+            while await self._read_socket_request(reader, framing):
+                self.requests[name] += 1
+                if await self._delay():
+                    self.errors[name] += 1
+                    writer.write(encode_message(ERROR_PAYLOAD, framing))
+                else:
+                    writer.write(payload)
+                await writer.drain()
+                if framing == "close":
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_socket_request(reader: asyncio.StreamReader, framing: str) -> bool:
+        """读取一条请求，连接关闭时返回 False"""
+        if framing == "newline":
+            return bool(await reader.readuntil(b"\n"))
+        if framing == "length":
+            (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(4))
+            await reader.readexactly(length)
+            return True
+        # json / close：没有分帧信息，读到能完整解析的 JSON 文档为止
+        buf = bytearray()
+        while True:
+            chunk = await reader.read(STREAM_LIMIT)
+            if not chunk:
+                return False
+            buf += chunk
+            if buf.rstrip()[-1:] in (b"}", b"]"):
+                try:
+                    json.loads(buf)
+                    return True
+                except ValueError:
+                    continue
+
+    # ------------------------------------------------------------------
+    # Protobuf (4 字节长度前缀)
+    # ------------------------------------------------------------------
+    async def _handle_protobuf(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int):
+        name, _, _, frame = self.tcp_routes[port]
+        try:
+            while True:
+                (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(4))
+                await reader.readexactly(length)
+                self.requests[name] += 1
+                if await self._delay():
+                    # 模拟服务端异常：只发送长度前缀后断开 (客户端已收到数据，不会静默重试)
+                    self.errors[name] += 1
+                    writer.write(frame[:LENGTH_PREFIX.size])
+                    await writer.drain()
+                    return
+                writer.write(frame)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.mock_server",
+        description="根据 test_cases 中的协议定义启动 mock 后端，返回 sample_return",
+    )
+    parser.add_argument("-d", "--dir", default=str(TEST_CASES_PATH), help="协议定义目录")
+    parser.add_argument("-p", "--protocol", action="append", help="只 mock 指定的协议 (ID 或名称，可重复)")
+    parser.add_argument("--host", default=MOCK_CONFIG.get("host", "127.0.0.1"))
+    parser.add_argument("--http-port", type=int, default=int(MOCK_CONFIG.get("http_port", 8080)), help="HTTP 协议统一监听的端口")
+    parser.add_argument("--latency-ms", type=float, default=float(MOCK_CONFIG.get("latency_ms", 0)), help="注入的平均延迟 (毫秒)")
+    parser.add_argument("--jitter-ms", type=float, default=float(MOCK_CONFIG.get("jitter_ms", 0)), help="延迟的随机抖动范围 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=float(MOCK_CONFIG.get("error_rate", 0)), help="注入错误的概率 (0~1)")
+    args = parser.parse_args(argv)
+
+    cases = TestCaseRegistry(args.dir).all()
+    if args.protocol:
+        keys = set(args.protocol)
+        cases = [c for c in cases if str(c["id"]) in keys or c["name"] in keys]
+
+    server = MockServer(
+        cases, host=args.host, http_port=args.http_port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+    )
+    try:
+        import uvloop  # 可选依赖，安装后使用更快的事件循环
+        uvloop.install()
+    except ImportError:
+        pass
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    except (RuntimeError, OSError) as e:
+        logger.error(f"Mock server failed: {e}")
+        return 1
+    finally:
+        logger.info(f"Mock server stats: {server.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import yaml
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from app.config import APP_CONFIG, TEST_CASES_PATH
+
+# 两次目录扫描之间的最小间隔 (秒)，间隔内的请求直接命中内存索引
+CHECK_INTERVAL = float(APP_CONFIG.get("test_cases_check_interval", 1.0))
+
+# 用例文件中各字段期望的类型，用于加载时校验
+_FIELD_TYPES = {
+    "params": dict,
+    "sample_return": (dict, list),
+    "assertions": list,
+    "target_config": dict,
+    "test_cases": list,
+}
+
+
+class TestCaseRegistry:
+    """
+    协议用例注册表。
+
+    一次性加载并校验 test_cases 目录下的 YAML 文件，维护按 ID 和名称的索引。
+    之后仅在检查间隔到期时扫描目录，只重新解析 mtime 或大小发生变化的文件。
+    ID 仍按文件名排序后的位置分配，与原先的 load_all_test_cases 保持一致。
+    """
+
+    def __init__(self, directory=None, check_interval: float = CHECK_INTERVAL):
+        self.directory = Path(directory or TEST_CASES_PATH)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # filename -> (mtime_ns, size, 解析后的内容或 None)
+        self._files: Dict[str, Tuple[int, int, Optional[Dict[str, Any]]]] = {}
+        self._cases: List[Dict[str, Any]] = []
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._last_check: Optional[float] = None
+        # (版本, 用例列表) 成对替换，读取方拿到的版本总与用例内容一致
+        self._snapshot: Tuple[str, List[Dict[str, Any]]] = (self._version_of([]), [])
+        self._stats = {
+            "scans": 0,          # 目录扫描 (stat) 次数
+            "file_loads": 0,     # YAML 解析次数
+            "file_errors": 0,    # 解析或校验失败次数
+            "rebuilds": 0,       # 索引重建次数
+            "lookups": 0,        # 查询次数
+        }
+
+    # ------------------------------------------------------------------
+    # 查询接口
+    # ------------------------------------------------------------------
+    def all(self) -> List[Dict[str, Any]]:
+        """返回全部用例 (按 ID 排序)，调用方不应修改返回的字典"""
+        self.refresh()
+        self._stats["lookups"] += 1
+        return self._cases
+
+    def get(self, case_id: int) -> Optional[Dict[str, Any]]:
+        """按 ID 查找用例"""
+        self.refresh()
+        self._stats["lookups"] += 1
+        return self._by_id.get(case_id)
+
+    def get_by_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """按名称查找用例"""
+        self.refresh()
+        self._stats["lookups"] += 1
+        return self._by_name.get(name)
+
+    def versioned(self) -> Tuple[str, List[Dict[str, Any]]]:
+        """返回 (版本, 全部用例)；版本为用例内容的摘要，仅在用例集合实际变化时改变"""
+        self.refresh()
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self.versioned()[0]
+
+    @staticmethod
+    def _version_of(cases: List[Dict[str, Any]]) -> str:
+        data = json.dumps(cases, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return hashlib.sha1(data).hexdigest()[:20]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回加载计数器，用于确认热路径没有触达磁盘"""
+        data = dict(self._stats)
+        data["files"] = len(self._files)
+        data["cases"] = len(self._cases)
+        data["version"] = self._snapshot[0]
+        return data
+
+    # ------------------------------------------------------------------
+    # 加载逻辑
+    # ------------------------------------------------------------------
+    def refresh(self, force: bool = False):
+        """检查间隔到期 (或 force=True) 时扫描目录并增量重载"""
+        now = time.monotonic()
+        last = self._last_check
+        if not force and last is not None and now - last < self.check_interval:
+            return
+        with self._lock:
+            # 双重检查，避免并发请求重复扫描
+            last = self._last_check
+            if not force and last is not None and now - last < self.check_interval:
+                return
+            self._scan()
+            self._last_check = time.monotonic()
+
+    def _scan(self):
+        self._stats["scans"] += 1
+        if not self.directory.exists():
+            if self._files or self._last_check is None:
+                logger.warning(f"Test cases directory not found: {self.directory}")
+            if self._files:
+                self._files = {}
+                self._rebuild([])
+            return
+
+        stats = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith((".yaml", ".yml")) and entry.is_file():
+                    st = entry.stat()
+                    stats[entry.name] = (st.st_mtime_ns, st.st_size)
+
+        changed = set(stats) != set(self._files)
+        files = {}
+        for filename, (mtime_ns, size) in stats.items():
+            cached = self._files.get(filename)
+            if cached is not None and cached[0] == mtime_ns and cached[1] == size:
+                files[filename] = cached
+                continue
+            files[filename] = (mtime_ns, size, self._load_file(filename))
+            changed = True
+
+        if changed:
+            self._files = files
+            # 按文件名排序，保证 ID 相对稳定
+            self._rebuild(sorted(files))
+
+    def _load_file(self, filename: str) -> Optional[Dict[str, Any]]:
+        """解析并校验单个 YAML 文件，失败时返回 None"""
+        filepath = self.directory / filename
+        self._stats["file_loads"] += 1
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                content = yaml.safe_load(f)
+        except Exception as e:
+            self._stats["file_errors"] += 1
+            logger.error(f"Failed to load test case {filename}: {e}")
+            return None
+
+        if not isinstance(content, dict):
+            return None
+
+        for field, expected in _FIELD_TYPES.items():
+            value = content.get(field)
+            if value is not None and not isinstance(value, expected):
+                self._stats["file_errors"] += 1
+                logger.error(f"Invalid test case {filename}: field '{field}' has type {type(value).__name__}")
+                return None
+        return content
+
+    def _rebuild(self, filenames: List[str]):
+        """根据已加载的文件重建用例列表与索引"""
+        cases = []
+        for idx, filename in enumerate(filenames):
+            content = self._files[filename][2]
+            if content is None:
+                continue
+            # 构造符合前端预期的结构
+            cases.append({
+                "id": idx + 1,  # 动态生成 ID
+                "name": content.get("name", filename),
+                "description": content.get("description", ""),
+                "params": content.get("params") or {},
+                "sample_return": content.get("sample_return") or {},
+                "assertions": content.get("assertions") or [],
+                "call_type": content.get("call_type", "http"),
+                "target_config": content.get("target_config") or {},
+                "test_cases": content.get("test_cases") or [],
+                # 保留原始文件名以便调试或其他用途
+                "file_source": filename
+            })
+
+        self._cases = cases
+        self._snapshot = (self._version_of(cases), cases)
+        self._by_id = {c["id"]: c for c in cases}
+        self._by_name = {}
+        for c in cases:
+            # 名称重复时保留 ID 最小的一个
+            self._by_name.setdefault(c["name"], c)
+        self._stats["rebuilds"] += 1
+
+
+# 模块级单例
+registry = TestCaseRegistry()
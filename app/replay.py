@@ -0,0 +1,345 @@
+"""
+抓包回放。
+
+按记录顺序读取抓包文件 (内存映射，不整体载入)，把每个请求按原始分帧重新发送到原目标 (或 --target 指定的地址)，
+并与抓包中记录的响应比较。--speed 控制相对原始时间间隔的倍速，--max 则不等待、按在途上限尽快发送。
+
+    python -m app.replay logs/captures/capture-20240101-120000-1234.ptcap --speed 2
+    python -m app.replay capture.ptcap --max --compare decoded --ignore server_time
+    python -m app.replay capture.ptcap --info
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+from app.connect.capture import ERROR, REQUEST, RESPONSE, SESSION, STREAM, CaptureReader
+from app.connect.codec import get_codec
+from app.connect.pool import tcp_pool
+from app.connect.socket import REUSABLE_FRAMINGS, frame_message, read_frame
+from app.stats import LatencyHistogram
+
+# 比较方式：bytes 逐字节比较，decoded 解码后比较 (可忽略指定字段)，none 只回放不比较
+COMPARE_MODES = ("bytes", "decoded", "none")
+# 结果中保留的不一致样例数
+MAX_MISMATCH_SAMPLES = 20
+# 样例中响应内容的最大展示长度
+PREVIEW_CHARS = 500
+
+
+def _decode(meta: Dict[str, Any], data) -> Any:
+    """按流定义解码一条消息 (socket 为 JSON，protobuf 使用流定义中的消息类)"""
+    if meta.get("call_type") == "protobuf":
+        codec = get_codec(meta["proto_module"], meta["request_class"], meta["response_class"])
+        return codec.decode(data, raw=meta.get("raw_decode", False))
+    return json.loads(str(data, "utf-8")) if len(data) else {}
+
+
+def _drop(obj: Any, path: Sequence[str]):
+    """删除嵌套字典中的一个字段 (path 为按 . 拆分的字段路径)"""
+    for key in path[:-1]:
+        if not isinstance(obj, dict):
+            return
+        obj = obj.get(key)
+    if isinstance(obj, dict):
+        obj.pop(path[-1], None)
+
+
+def _preview(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        try:
+            value = data.decode("utf-8")
+        except UnicodeDecodeError:
+            value = data.hex()
+    if isinstance(value, str) and len(value) > PREVIEW_CHARS:
+        return value[:PREVIEW_CHARS] + "..."
+    return value
+
+
+class Replayer:
+    """
+    回放一个抓包文件。
+
+    读取线程按记录时间 (除以 speed) 调度请求，交给线程池发送；在途请求数达到上限时读取线程等待。
+    抓包中的响应记录通常紧跟在请求之后，读取到时与回放得到的实际响应配对比较，
+    因此只需保留在途请求的配对状态，内存占用与文件大小无关。
+    """
+
+    def __init__(
+        self,
+        path,
+        speed: Optional[float] = 1.0,
+        target: Optional[Tuple[str, int]] = None,
+        protocols: Optional[Sequence[str]] = None,
+        compare: str = "bytes",
+        ignore: Sequence[str] = (),
+        max_in_flight: int = 64,
+    ):
+        if compare not in COMPARE_MODES:
+            raise ValueError(f"compare must be one of {COMPARE_MODES}")
+        self.path = path
+        # speed 为空或 0 时不按原始间隔等待
+        self.speed = speed or None
+        self.target = target
+        self.protocols = set(protocols) if protocols else None
+        self.compare = compare
+        self.ignore = [field.split(".") for field in ignore]
+        self.max_in_flight = max(1, max_in_flight)
+
+        self.latency = LatencyHistogram()
+        self.counters = dict.fromkeys(
+            ("requests", "responses", "errors", "matched", "mismatched", "unrecorded", "skipped"), 0
+        )
+        self.mismatches: List[Dict[str, Any]] = []
+        self.max_lag_ms = 0.0
+        self.truncated = False
+        self.started_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+        # (会话序号, 请求序号) -> [抓包中的 (类型, 内容), 回放得到的 (类型, 内容)]
+        self._pending: Dict[Tuple[int, int], List[Any]] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self) -> Dict[str, Any]:
+        """回放整个文件，返回汇总结果"""
+        self.started_at = time.perf_counter()
+        with CaptureReader(self.path) as reader:
+            with ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="replay") as pool:
+                self._replay(reader, pool)
+            with self._lock:
+                # 抓包中没有对应响应记录的请求 (抓包在响应到达前停止)
+                self.counters["unrecorded"] += len(self._pending)
+                self._pending.clear()
+            self.truncated = reader.truncated
+        self.ended_at = time.perf_counter()
+        return self.results()
+
+    def _replay(self, reader: CaptureReader, pool: ThreadPoolExecutor):
+        session = 0
+        streams: Dict[int, Dict[str, Any]] = {}
+        first_ts = base = None
+        for record in reader:
+            if self._stop.is_set():
+                break
+            kind = record.kind
+            if kind == SESSION:
+                session += 1
+                streams = {}
+            elif kind == STREAM:
+                meta = json.loads(str(record.data, "utf-8"))
+                if self.protocols is None or meta.get("protocol") in self.protocols:
+                    streams[record.stream] = meta
+            elif kind == REQUEST:
+                meta = streams.get(record.stream)
+                if meta is None:
+                    self.counters["skipped"] += 1
+                    continue
+                if self.speed:
+                    if first_ts is None:
+                        first_ts, base = record.ts, time.perf_counter()
+                    delay = base + (record.ts - first_ts) / self.speed - time.perf_counter()
+                    if delay > 0:
+                        if self._stop.wait(delay):
+                            break
+                    else:
+                        self.max_lag_ms = max(self.max_lag_ms, -delay * 1000)
+                self._slots.acquire()
+                key = (session, record.seq)
+                with self._lock:
+                    self._pending[key] = [None, None]
+                    self.counters["requests"] += 1
+                pool.submit(self._send, key, meta, record.data)
+            elif kind in (RESPONSE, ERROR):
+                self._settle((session, record.seq), 0, (kind, record.data))
+
+    def _send(self, key: Tuple[int, int], meta: Dict[str, Any], body: memoryview):
+        try:
+            host, port = self.target or (meta["host"], meta["port"])
+            framing = meta.get("framing") or "json"
+            frame = frame_message(body, framing)
+
+            def exchange(conn) -> bytes:
+                conn.sendall(frame)
+                # 连接的接收缓冲区会被复用，保留响应需要复制
+                return bytes(read_frame(conn, framing))
+
+            started = time.perf_counter()
+            try:
+                actual = (RESPONSE, tcp_pool.call(host, int(port), exchange, keep_alive=framing in REUSABLE_FRAMINGS))
+            except Exception as e:
+                actual = (ERROR, str(e))
+            self._settle(key, 1, actual, meta, (time.perf_counter() - started) * 1000)
+        finally:
+            self._slots.release()
+
+    def _settle(
+        self,
+        key: Tuple[int, int],
+        slot: int,
+        value: Tuple[int, Any],
+        meta: Optional[Dict[str, Any]] = None,
+        latency_ms: Optional[float] = None,
+    ):
+        """填入抓包响应 (slot 0) 或实际响应 (slot 1，附带耗时)，两者都到齐时比较"""
+        with self._lock:
+            if latency_ms is not None:
+                self.latency.record(latency_ms)
+            entry = self._pending.get(key)
+            if entry is None:
+                return  # 未回放的请求 (被过滤) 的响应记录
+            entry[slot] = value
+            if meta is not None:
+                entry.append(meta)
+            if entry[0] is None or entry[1] is None:
+                return
+            del self._pending[key]
+            if entry[1][0] == RESPONSE:
+                self.counters["responses"] += 1
+            else:
+                self.counters["errors"] += 1
+        self._compare(key, entry[0], entry[1], entry[2])
+
+    def _compare(self, key: Tuple[int, int], expected: Tuple[int, Any], actual: Tuple[int, Any], meta: Dict[str, Any]):
+        if self.compare == "none":
+            return
+        (expected_kind, expected_data), (actual_kind, actual_data) = expected, actual
+        if expected_kind != actual_kind:
+            matched = False
+        elif expected_kind == ERROR:
+            # 原始调用与回放都失败，视为一致
+            matched = True
+        elif self.compare == "bytes":
+            matched = expected_data == actual_data
+        else:
+            try:
+                expected_data, actual_data = _decode(meta, expected_data), _decode(meta, actual_data)
+                for path in self.ignore:
+                    _drop(expected_data, path)
+                    _drop(actual_data, path)
+            except Exception:
+                # 无法解码时退回逐字节比较
+                pass
+            matched = expected_data == actual_data
+
+        with self._lock:
+            if matched:
+                self.counters["matched"] += 1
+                return
+            self.counters["mismatched"] += 1
+            if len(self.mismatches) >= MAX_MISMATCH_SAMPLES:
+                return
+            self.mismatches.append({
+                "protocol": meta.get("protocol"),
+                "seq": key[1],
+                "expected": _preview(expected_data) if expected_kind == RESPONSE else {"error": _preview(expected_data)},
+                "actual": _preview(actual_data) if actual_kind == RESPONSE else {"error": actual_data},
+            })
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self.counters)
+        end = self.ended_at or time.perf_counter()
+        data["elapsed_s"] = round(end - self.started_at, 3) if self.started_at else 0
+        return data
+
+    def results(self) -> Dict[str, Any]:
+        data = self.status()
+        data.update({
+            "path": str(self.path),
+            "speed": self.speed or "max",
+            "compare": self.compare,
+            "throughput": round(data["requests"] / data["elapsed_s"], 2) if data["elapsed_s"] else 0,
+            "latency_ms": self.latency.summary(),
+            "max_schedule_lag_ms": round(self.max_lag_ms, 3),
+            "truncated": self.truncated,
+            "mismatches": list(self.mismatches),
+        })
+        return data
+
+
+def _parse_target(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    if not host or not port.isdigit():
+        raise argparse.ArgumentTypeError("target must be host:port")
+    return host, int(port)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.replay", description="回放抓包文件并比较响应，输出 JSON 结果")
+    parser.add_argument("file", help="抓包文件 (.ptcap)")
+    parser.add_argument("--speed", type=float, default=1.0, help="相对原始时间间隔的倍速，默认 1")
+    parser.add_argument("--max", action="store_true", help="不按原始间隔等待，尽快发送")
+    parser.add_argument("--target", type=_parse_target, help="把所有请求发往 host:port，默认使用抓包时的目标")
+    parser.add_argument("-p", "--protocol", action="append", help="只回放指定协议 (名称，可重复)")
+    parser.add_argument("--compare", choices=COMPARE_MODES, default="bytes", help="响应比较方式")
+    parser.add_argument("--ignore", action="append", default=[], help="decoded 比较时忽略的字段 (a.b 表示嵌套字段，可重复)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="同时在途的最大请求数")
+    parser.add_argument("--info", action="store_true", help="只输出抓包文件的概要，不回放")
+    parser.add_argument("-o", "--output", help="结果输出文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.info:
+            with CaptureReader(args.file) as reader:
+                result = reader.summary()
+            code = 0
+        else:
+            replayer = Replayer(
+                args.file, speed=None if args.max else args.speed, target=args.target, protocols=args.protocol,
+                compare=args.compare, ignore=args.ignore, max_in_flight=args.max_in_flight,
+            )
+            result = _run_with_progress(replayer)
+            code = 0 if not (result["mismatched"] or result["errors"]) else 1
+    except (OSError, ValueError) as e:
+        print(f"Replay failed: {e}", file=sys.stderr)
+        return 2
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return code
+
+
+def _run_with_progress(replayer: Replayer) -> Dict[str, Any]:
+    """在后台线程中回放，每秒向标准错误输出进度；Ctrl+C 停止回放并输出已完成部分的结果"""
+    outcome: Dict[str, Any] = {}
+
+    def target():
+        try:
+            outcome["result"] = replayer.run()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, name="replay-reader", daemon=True)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(1)
+            status = replayer.status()
+            print(
+                f"[{status['elapsed_s']:>7.1f}s] {status['requests']} sent, {status['matched']} matched, "
+                f"{status['mismatched']} mismatched, {status['errors']} errors",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        replayer.stop()
+        thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    logger.info(f"Replay finished: {replayer.path}")
+    return outcome["result"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterator, List, Optional
+from app.config import APP_CONFIG
+
+# 全局工作线程池上限，所有请求共享，防止单个大并发请求耗尽进程资源
+MAX_WORKERS = int(APP_CONFIG.get("max_workers", 32))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取 (懒加载) 全局有界线程池"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="protocol-call")
+    return _executor
+
+
+def shutdown_executor(wait_pending: bool = True):
+    """关闭全局线程池，等待已提交的调用结束"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait_pending)
+
+
+atexit.register(shutdown_executor)
+
+
+def iter_parallel(func: Callable[[int], Any], count: int, limit: Optional[int] = None) -> Iterator[Any]:
+    """
+    在全局线程池中执行 func(1..count)，按完成顺序逐个产出结果。
+    同时在途的任务数不超过 limit (默认且最多为 MAX_WORKERS)，避免一次性提交全部任务，
+    内存占用只与 limit 有关而与 count 无关。
+    """
+    limit = max(1, min(limit or MAX_WORKERS, MAX_WORKERS))
+    executor = get_executor()
+    pending = set()
+    next_index = 1
+    try:
+        while next_index <= count or pending:
+            while next_index <= count and len(pending) < limit:
+                pending.add(executor.submit(func, next_index))
+                next_index += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # 调用方提前停止迭代 (如流式输出时客户端断开) 时取消尚未开始的任务
+        for future in pending:
+            future.cancel()
+
+
+def run_parallel(func: Callable[[int], Any], count: int, limit: Optional[int] = None) -> List[Any]:
+    """并发执行 func(1..count)，按 index 顺序返回结果列表"""
+    results: List[Any] = [None] * count
+    for index, result in iter_parallel(lambda i: (i, func(i)), count, limit):
+        results[index - 1] = result
+    return results
@@ -0,0 +1,190 @@
+"""
+生产环境服务入口。
+
+    python -m app.serve                 # 使用 config.yaml -> server 中的配置
+    python -m app.serve -w 4 -t 16 --port 8000
+
+Linux / macOS 默认使用 Gunicorn (多进程 gthread worker，应用在主进程中预加载后 fork)；
+Windows 或未安装 Gunicorn 时使用 Waitress (单进程多线程)；两者都未安装时回退到 Flask 自带服务器。
+收到 SIGTERM / SIGINT 后停止接受新连接，等待执行中的请求完成 (最长 graceful_timeout 秒，Waitress 下为尽力而为)，
+再停止后台负载任务、写完历史记录队列并关闭连接池。
+"""
+import os
+import sys
+import random
+import signal
+import argparse
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from app.config import SERVER_CONFIG
+
+HOST = SERVER_CONFIG.get("host", "0.0.0.0")
+PORT = int(SERVER_CONFIG.get("port", 5000))
+# auto / gunicorn / waitress
+BACKEND = SERVER_CONFIG.get("backend", "auto")
+# worker 进程数 (仅 Gunicorn)。后台负载任务、抓包与调用指标保存在各进程内存中，多于 1 个时这些功能受限
+WORKERS = int(SERVER_CONFIG.get("workers") or 1)
+# 每个 worker 处理请求的线程数
+THREADS = int(SERVER_CONFIG.get("threads", 8))
+# 停止时等待执行中请求完成的最长时间 (秒)
+GRACEFUL_TIMEOUT = float(SERVER_CONFIG.get("graceful_timeout", 30))
+# 单个请求无响应的超时 (秒)，并发调用与流式输出可能持续较久
+TIMEOUT = int(SERVER_CONFIG.get("timeout", 300))
+# 每个 worker 处理该数量的请求后重启 (0 表示不重启)
+MAX_REQUESTS = int(SERVER_CONFIG.get("max_requests", 0))
+
+BACKENDS = ("auto", "gunicorn", "waitress")
+
+
+def after_fork():
+    """
+    fork 出的 worker 进程中重置按进程持有的状态。
+    SQLite 连接按应用上下文 (每个请求线程) 创建，主进程 fork 前不持有连接；
+    历史写入线程在子进程首次写入时按进程号重新启动。
+    """
+    from app.connect.capture import capture
+    from app.database import db
+
+    # 各 worker 的随机数序列 (with_random 等) 互不相同
+    random.seed()
+    db.after_fork()
+    if capture.active:
+        # 主进程已在 fork 前写出缓冲区，子进程改写各自的抓包文件
+        capture.start()
+
+
+def drain():
+    """进程退出前停止后台负载任务、写完历史记录并关闭连接"""
+    from app.connect import close_pools
+    from app.connect.capture import capture
+    from app.history import history_writer
+    from app.jobs import job_manager
+
+    job_manager.stop_all(GRACEFUL_TIMEOUT)
+    # 负载任务结束时会写入历史记录，最后停止写入线程
+    history_writer.stop()
+    capture.stop()
+    close_pools()
+
+
+def _pre_fork(server, worker):
+    from app.connect.capture import capture
+    capture.flush()
+
+
+def _post_fork(server, worker):
+    after_fork()
+
+
+def _worker_exit(server, worker):
+    drain()
+
+
+def serve_gunicorn(app, host: str, port: int, workers: int, threads: int) -> int:
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "graceful_timeout": int(GRACEFUL_TIMEOUT),
+        "timeout": TIMEOUT,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS // 10,
+        # 主进程中创建应用 (含数据库初始化) 一次，worker 直接 fork
+        "preload_app": True,
+        "pre_fork": _pre_fork,
+        "post_fork": _post_fork,
+        "worker_exit": _worker_exit,
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Application().run()
+    return 0
+
+
+def _interrupt(signum, frame):
+    # SIGTERM 与 Ctrl+C 相同处理：结束事件循环后进入排空流程
+    raise KeyboardInterrupt
+
+
+def serve_waitress(app, host: str, port: int, threads: int) -> int:
+    from waitress import create_server
+
+    server = create_server(app, host=host, port=port, threads=threads, channel_timeout=TIMEOUT)
+
+    signal.signal(signal.SIGTERM, _interrupt)
+    logger.info(f"Serving on http://{host}:{port} (waitress, {threads} threads)")
+    # run() 收到 KeyboardInterrupt 后停止事件循环，并等待工作线程中执行中的请求 (最长数秒)；
+    # Waitress 不提供公开的排空接口，尚未发送完的响应与更长的请求不保证完成
+    server.run()
+    server.close()
+    drain()
+    return 0
+
+
+def _installed(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def _resolve_backend(backend: str) -> str:
+    """auto 时依次选择 gunicorn (非 Windows)、waitress；两者都未安装时回退到 Flask 自带服务器 (dev)"""
+    if backend != "auto":
+        return backend
+    if os.name != "nt" and _installed("gunicorn"):
+        return "gunicorn"
+    if _installed("waitress"):
+        return "waitress"
+    return "dev"
+
+
+def main(argv: Optional[List[str]] = None, app=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.serve", description="以生产模式启动 Web 服务")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help="worker 进程数 (仅 gunicorn)")
+    parser.add_argument("-t", "--threads", type=int, default=THREADS, help="每个 worker 的线程数")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND)
+    args = parser.parse_args(argv)
+
+    backend = _resolve_backend(args.backend)
+    options: Dict[str, Any] = {"host": args.host, "port": args.port, "threads": max(1, args.threads)}
+    if backend != "dev" and not _installed(backend):
+        print(f"{backend} is not installed, run: pip install {backend}", file=sys.stderr)
+        return 2
+
+    if app is None:
+        from app import create_app
+        app = create_app()
+    if backend == "dev":
+        logger.warning("Neither gunicorn nor waitress is installed, falling back to the Flask development server")
+        signal.signal(signal.SIGTERM, _interrupt)
+        app.run(host=args.host, port=args.port, threaded=True)
+        drain()
+        return 0
+    if backend == "gunicorn":
+        workers = max(1, args.workers)
+        # 后台任务与抓包开关的接口据此拒绝多进程下的请求 (状态只保存在单个进程内)
+        app.config["SERVER_WORKERS"] = workers
+        if workers > 1:
+            logger.warning(f"Running {workers} workers: load jobs and capture control are disabled, metrics are per worker")
+        return serve_gunicorn(app, workers=workers, **options)
+    if args.workers > 1:
+        logger.info("waitress runs a single process, --workers is ignored")
+    return serve_waitress(app, **options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
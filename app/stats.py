@@ -0,0 +1,341 @@
+import json
+import math
+import random
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+from app.config import AGGREGATE_CONFIG
+
+# 汇总中输出的延迟分位点
+PERCENTILES = (50, 90, 99)
+
+# 汇总模式保留的完整结果样本数与最先出现的失败结果数
+SAMPLE_SIZE = int(AGGREGATE_CONFIG.get("sample_size", 20))
+MAX_FAILURES = int(AGGREGATE_CONFIG.get("max_failures", 20))
+# 分别计数的响应结构 / 错误信息种类上限，超出的计入 other
+MAX_SHAPES = int(AGGREGATE_CONFIG.get("max_shapes", 50))
+MAX_ERROR_KINDS = int(AGGREGATE_CONFIG.get("max_error_kinds", 50))
+# 响应结构展开的最大深度，更深的层级只记录 object / array
+MAX_SHAPE_DEPTH = 8
+# 汇总中错误信息与结构描述的最大长度
+MAX_TEXT_LENGTH = 500
+
+_TYPE_NAMES = {str: "string", int: "integer", float: "number", bool: "boolean", type(None): "null"}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩 (nearest-rank) 分位数，要求输入已升序排列"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_latencies(latencies_ms: Iterable[float]) -> Dict[str, float]:
+    """计算 min/mean/pXX/max 延迟 (毫秒)"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {}
+    summary = {
+        "min": round(values[0], 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+    for pct in PERCENTILES:
+        summary[f"p{pct}"] = round(percentile(values, pct), 3)
+    summary["max"] = round(values[-1], 3)
+    return summary
+
+
+class LatencyHistogram:
+    """
+    对数-线性分桶的延迟直方图 (HDR 风格)，内存占用与样本数无关。
+
+    以微秒整数记录：小于 2^precision_bits 的值精确记录，更大的值每个 2 的幂区间
+    再均分为 2^(precision_bits-1) 个子桶，相对误差不超过 1/2^(precision_bits-1)
+    (默认 8 位，约 0.8%)。桶计数以稀疏字典保存，同精度的直方图可以直接合并。
+    """
+
+    __slots__ = ("precision_bits", "counts", "count", "total", "min", "max")
+
+    def __init__(self, precision_bits: int = 8):
+        self.precision_bits = precision_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        bits = self.precision_bits
+        if value < (1 << bits):
+            return value
+        shift = value.bit_length() - bits
+        return (1 << bits) + (shift - 1) * (1 << (bits - 1)) + (value >> shift) - (1 << (bits - 1))
+
+    def _upper_bound(self, index: int) -> int:
+        """桶内的最大值 (微秒)"""
+        bits = self.precision_bits
+        if index < (1 << bits):
+            return index
+        half = 1 << (bits - 1)
+        shift, offset = divmod(index - (1 << bits), half)
+        shift += 1
+        return ((half + offset + 1) << shift) - 1
+
+    def record(self, value_ms: float, n: int = 1):
+        """记录一个延迟 (毫秒)，n 为相同值的次数"""
+        us = max(0, int(value_ms * 1000))
+        index = self._index(us)
+        self.counts[index] = self.counts.get(index, 0) + n
+        if not self.count or us < self.min:
+            self.min = us
+        if us > self.max:
+            self.max = us
+        self.count += n
+        self.total += us * n
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个同精度的直方图"""
+        if other.precision_bits != self.precision_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        if not other.count:
+            return
+        for index, n in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + n
+        self.min = other.min if not self.count else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def to_dict(self) -> Dict[str, Any]:
+        """紧凑的可序列化形式 (JSON / pickle)，用于在进程或主机之间传输后合并"""
+        return {
+            "precision_bits": self.precision_bits,
+            "counts": sorted(self.counts.items()),
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        hist = cls(int(data.get("precision_bits", 8)))
+        hist.counts = {int(index): int(n) for index, n in data.get("counts") or []}
+        hist.count = int(data.get("count", 0))
+        hist.total = int(data.get("total", 0))
+        hist.min = int(data.get("min", 0))
+        hist.max = int(data.get("max", 0))
+        return hist
+
+    def percentile(self, pct: float) -> float:
+        """最近秩分位数 (毫秒)，返回所在桶的上界 (不超过最大值)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self) -> Dict[str, float]:
+        """与 summarize_latencies 相同格式的 min/mean/pXX/max (毫秒)"""
+        if not self.count:
+            return {}
+        summary = {
+            "min": round(self.min / 1000, 3),
+            "mean": round(self.total / self.count / 1000, 3),
+        }
+        for pct in PERCENTILES:
+            summary[f"p{pct}"] = round(self.percentile(pct), 3)
+        summary["max"] = round(self.max / 1000, 3)
+        return summary
+
+
+class RunSummary:
+    """
+    增量汇总一次运行的结果。
+    耗时计入 LatencyHistogram，内存占用与结果数无关，流式输出结果时不需要在内存中保存任何结果。
+    """
+
+    __slots__ = ("count", "errors", "assertion_failures", "latency")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.assertion_failures = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, result: Dict[str, Any]):
+        """计入一条带有 elapsed_ms / error / assertions 字段的结果"""
+        self.count += 1
+        if result.get("error"):
+            self.errors += 1
+        if any(a.get("status") != "pass" for a in result.get("assertions") or []):
+            self.assertion_failures += 1
+        if "elapsed_ms" in result:
+            self.latency.record(result["elapsed_ms"])
+
+    def result(self, wall_time_s: float) -> Dict[str, Any]:
+        """
+        :param wall_time_s: 整批调用的墙钟耗时 (秒)
+        """
+        return {
+            "count": self.count,
+            "success": self.count - self.errors,
+            "errors": self.errors,
+            "assertion_failures": self.assertion_failures,
+            "wall_time_ms": round(wall_time_s * 1000, 3),
+            "throughput": round(self.count / wall_time_s, 3) if wall_time_s > 0 else 0.0,
+            "latency_ms": self.latency.summary(),
+        }
+
+
+def response_shape(value: Any, depth: int = MAX_SHAPE_DEPTH) -> str:
+    """
+    响应的结构描述：字段名与值类型，不含具体值。
+    对象按字段名排序；数组只记录去重后的元素结构，与元素个数无关。
+    例如 {"code": 0, "items": [{"id": 1}, {"id": 2}]} -> {"code":integer,"items":[{"id":integer}]}
+    """
+    if isinstance(value, dict):
+        if depth <= 0:
+            return "object"
+        fields = sorted((str(k), v) for k, v in value.items())
+        return "{" + ",".join(f"{json.dumps(k, ensure_ascii=False)}:{response_shape(v, depth - 1)}" for k, v in fields) + "}"
+    if isinstance(value, (list, tuple)):
+        if depth <= 0:
+            return "array"
+        return "[" + "|".join(sorted({response_shape(item, depth - 1) for item in value})) + "]"
+    return _TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+def result_status(result: Dict[str, Any]) -> str:
+    """结果状态：error (调用失败) / fail (有断言未通过) / ok"""
+    if result.get("error"):
+        return "error"
+    if any(a.get("status") != "pass" for a in result.get("assertions") or ()):
+        return "fail"
+    return "ok"
+
+
+class RunAggregator:
+    """
+    汇总模式：把一次运行的结果逐条折叠为固定大小的统计，内存占用与调用次数无关。
+
+    累计延迟直方图、各阶段耗时直方图、状态与错误信息计数、按哈希分桶的响应结构计数；
+    完整结果只保留蓄水池抽样的 sample_size 条和最先出现的 max_failures 条失败 (fail / error)。
+    每条断言的计数由 AssertionBatch 累计，在 result 中换算通过率。
+    """
+
+    def __init__(
+        self,
+        sample_size: int = SAMPLE_SIZE,
+        max_failures: int = MAX_FAILURES,
+        max_shapes: int = MAX_SHAPES,
+        max_error_kinds: int = MAX_ERROR_KINDS,
+        seed: Optional[int] = None,
+    ):
+        self.sample_size = max(0, sample_size)
+        self.max_failures = max(0, max_failures)
+        self.max_shapes = max_shapes
+        self.max_error_kinds = max_error_kinds
+        self.count = 0
+        self.statuses = {"ok": 0, "fail": 0, "error": 0}
+        self.errors: Dict[str, int] = {}
+        self.other_errors = 0
+        self.latency = LatencyHistogram()
+        self.phases: Dict[str, LatencyHistogram] = {}
+        self.shapes: Dict[str, Dict[str, Any]] = {}
+        self.other_shapes = 0
+        self.samples: List[Dict[str, Any]] = []
+        self.failures: List[Dict[str, Any]] = []
+        self._random = random.Random(seed)
+
+    def add(self, result: Dict[str, Any]):
+        """计入一条已执行断言的结果"""
+        self.count += 1
+        status = result_status(result)
+        self.statuses[status] += 1
+        if status == "error":
+            self._count_error(str(result["error"]))
+        if "elapsed_ms" in result:
+            self.latency.record(result["elapsed_ms"])
+        for phase, ms in (result.get("timings") or {}).items():
+            hist = self.phases.get(phase)
+            if hist is None:
+                hist = self.phases[phase] = LatencyHistogram()
+            hist.record(ms)
+        self._count_shape(result)
+
+        if status != "ok" and len(self.failures) < self.max_failures:
+            self.failures.append(result)
+        # 蓄水池抽样 (Algorithm R)：每条结果留在样本中的概率都是 sample_size / count
+        if len(self.samples) < self.sample_size:
+            self.samples.append(result)
+        elif self.sample_size:
+            slot = self._random.randrange(self.count)
+            if slot < self.sample_size:
+                self.samples[slot] = result
+
+    def _count_error(self, message: str):
+        message = message[:MAX_TEXT_LENGTH]
+        if message in self.errors:
+            self.errors[message] += 1
+        elif len(self.errors) < self.max_error_kinds:
+            self.errors[message] = 1
+        else:
+            self.other_errors += 1
+
+    def _count_shape(self, result: Dict[str, Any]):
+        shape = response_shape(result.get("response"))
+        key = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12]
+        bucket = self.shapes.get(key)
+        if bucket is not None:
+            bucket["count"] += 1
+        elif len(self.shapes) < self.max_shapes:
+            self.shapes[key] = {"hash": key, "count": 1, "shape": shape[:MAX_TEXT_LENGTH], "first_index": result.get("index")}
+        else:
+            self.other_shapes += 1
+
+    def result(self, wall_time_s: float, assertions: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        :param wall_time_s: 整批调用的墙钟耗时 (秒)
+        :param assertions: AssertionBatch.summary() 的每条规则计数
+        """
+        errors = self.statuses["error"]
+        summary = {
+            "count": self.count,
+            "success": self.count - errors,
+            "errors": errors,
+            "assertion_failures": self.statuses["fail"],
+            "wall_time_ms": round(wall_time_s * 1000, 3),
+            "throughput": round(self.count / wall_time_s, 3) if wall_time_s > 0 else 0.0,
+            "latency_ms": self.latency.summary(),
+            "latency_histogram": self.latency.to_dict(),
+            "statuses": dict(self.statuses),
+            "error_counts": dict(sorted(self.errors.items(), key=lambda item: -item[1])),
+            "other_errors": self.other_errors,
+            "response_shapes": sorted(self.shapes.values(), key=lambda bucket: -bucket["count"]),
+            "other_shapes": self.other_shapes,
+        }
+        if self.phases:
+            summary["timings"] = {phase: hist.summary() for phase, hist in self.phases.items()}
+        if assertions is not None:
+            summary["assertions"] = []
+            for counts in assertions:
+                total = counts["pass"] + counts["fail"] + counts["error"]
+                summary["assertions"].append(dict(counts, pass_rate=round(counts["pass"] / total, 4) if total else None))
+        return summary
+
+
+def summarize_run(results: List[Dict[str, Any]], wall_time_s: float) -> Dict[str, Any]:
+    """
+    汇总一次运行的结果。
+    :param results: 带有 elapsed_ms / error / assertions 字段的结果列表
+    :param wall_time_s: 整批调用的墙钟耗时 (秒)
+    """
+    summary = RunSummary()
+    for result in results:
+        summary.add(result)
+    return summary.result(wall_time_s)
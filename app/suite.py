@@ -0,0 +1,187 @@
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from app.assertions import compile_rules, evaluate
+from app.config import GAME_SERVER
+from app.connect import execute_protocol, is_error_response
+from app.database import db
+from app.registry import registry
+from app.runner import MAX_WORKERS, iter_parallel
+from app.stats import summarize_latencies
+
+# 用例状态：passed 全部断言通过；failed 有断言未通过；error 调用失败
+STATUSES = ("passed", "failed", "error")
+
+
+def default_params(protocol: Dict[str, Any]) -> Dict[str, Any]:
+    """协议 params 定义中的默认值"""
+    return {
+        key: spec.get("default")
+        for key, spec in (protocol.get("params") or {}).items()
+        if isinstance(spec, dict) and "default" in spec
+    }
+
+
+def select_cases(
+    protocols: Optional[Iterable[Any]] = None,
+    cases: Optional[Iterable[str]] = None,
+    call_types: Optional[Iterable[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    从注册表中选出要运行的用例 (协议 YAML 中 test_cases 列表的条目)。
+    :param protocols: 协议 ID 或名称，为空表示全部协议
+    :param cases: 用例名称，为空表示全部用例
+    :param call_types: 调用类型 (http / socket / protobuf)，为空表示不限
+    """
+    protocol_keys = {str(p) for p in protocols or ()}
+    case_names = set(cases or ())
+    types = {t.lower() for t in call_types or ()}
+
+    selected = []
+    for protocol in registry.all():
+        if protocol_keys and str(protocol["id"]) not in protocol_keys and protocol.get("name") not in protocol_keys:
+            continue
+        if types and (protocol.get("call_type") or "socket").lower() not in types:
+            continue
+        defaults = default_params(protocol)
+        for position, case in enumerate(protocol.get("test_cases") or [], start=1):
+            if not isinstance(case, dict):
+                continue
+            name = case.get("name") or f"case-{position}"
+            if case_names and name not in case_names:
+                continue
+            params = dict(defaults)
+            params.update(case.get("params") or {})
+            selected.append({
+                "protocol": protocol,
+                "name": name,
+                "params": params,
+                # 协议默认断言对每个用例生效，用例自己的断言追加在后面
+                "assertions": list(protocol.get("assertions") or []) + list(case.get("assertions") or []),
+            })
+    return selected
+
+
+def _run_case(item: Dict[str, Any], global_url: str) -> Dict[str, Any]:
+    protocol = item["protocol"]
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    response = execute_protocol(protocol, item["params"], global_url)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    result = {
+        "protocol_id": protocol["id"],
+        "protocol": protocol.get("name"),
+        "call_type": (protocol.get("call_type") or "socket").lower(),
+        "case": item["name"],
+        "params": item["params"],
+        "start_time": started_at.isoformat() + "Z",
+        "elapsed_ms": round(elapsed_ms, 3),
+        "response": response,
+        "assertions": [],
+    }
+    if is_error_response(response):
+        result["status"] = "error"
+        result["error"] = response["error"]
+        return result
+
+    result["assertions"] = evaluate(compile_rules(item["assertions"]), response, item["params"])
+    passed = all(a["status"] == "pass" for a in result["assertions"])
+    result["status"] = "passed" if passed else "failed"
+    return result
+
+
+def iter_suite(selected: List[Dict[str, Any]], global_url: str, concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """并发执行用例，按完成顺序逐个产出结果 (result["position"] 为用例在 selected 中的序号)"""
+    def run(index: int) -> Dict[str, Any]:
+        result = _run_case(selected[index - 1], global_url)
+        result["position"] = index
+        return result
+
+    return iter_parallel(run, len(selected), limit=concurrency)
+
+
+def run_suite(
+    selected: List[Dict[str, Any]],
+    global_url: str,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    并发执行一组用例并生成报告。
+    :param concurrency: 同时执行的用例数上限 (不超过全局线程池大小)
+    """
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    results: List[Dict[str, Any]] = [None] * len(selected)
+    for result in iter_suite(selected, global_url, concurrency):
+        results[result.pop("position") - 1] = result
+    wall_time = time.perf_counter() - started
+
+    counts = {status: 0 for status in STATUSES}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "summary": dict(
+            total=len(results),
+            **counts,
+            ok=counts["failed"] == 0 and counts["error"] == 0,
+            target_url=global_url,
+            concurrency=max(1, min(concurrency or MAX_WORKERS, MAX_WORKERS)),
+            start_time=started_at.isoformat() + "Z",
+            wall_time_ms=round(wall_time * 1000, 3),
+            latency_ms=summarize_latencies(r["elapsed_ms"] for r in results),
+        ),
+        "cases": results,
+    }
+
+
+def _default_global_url() -> str:
+    """命令行运行时从数据库设置读取全局目标地址，数据库未初始化时使用配置文件中的默认值"""
+    try:
+        return db.get_setting("global_target_url", GAME_SERVER)
+    except sqlite3.Error:
+        return GAME_SERVER
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.suite",
+        description="并发运行协议 YAML 中定义的 test_cases，输出 JSON 报告",
+    )
+    parser.add_argument("-p", "--protocol", action="append", help="协议 ID 或名称 (可重复)，默认全部")
+    parser.add_argument("-c", "--case", action="append", help="用例名称 (可重复)，默认全部")
+    parser.add_argument("-t", "--call-type", action="append", help="调用类型 http / socket / protobuf (可重复)")
+    parser.add_argument("-n", "--concurrency", type=int, default=None, help=f"并发用例数上限，默认 {MAX_WORKERS}")
+    parser.add_argument("-u", "--target-url", help="全局目标地址，默认读取数据库中的设置")
+    parser.add_argument("-o", "--output", help="报告输出文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    selected = select_cases(args.protocol, args.case, args.call_type)
+    if not selected:
+        print("No test cases selected", file=sys.stderr)
+        return 2
+
+    report = run_suite(selected, args.target_url or _default_global_url(), args.concurrency)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    summary = report["summary"]
+    print(
+        f"{summary['total']} cases: {summary['passed']} passed, {summary['failed']} failed, "
+        f"{summary['error']} error in {summary['wall_time_ms']} ms",
+        file=sys.stderr,
+    )
+    # 非零退出码便于在定时任务 / CI 中判断回归结果
+    return 0 if summary["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+多进程负载任务。
+
+协调进程把负载计划按速率均分给多个工作进程，每个工作进程独立运行一个 LoadJob 分片
+(各自的线程池、连接池与编解码，不受协调进程 GIL 的限制)，并定期通过连接发送累计快照：
+计数器与 LatencyHistogram 的紧凑序列化形式，而不是逐条结果。协调进程合并各分片的快照，
+对外提供与 LoadJob 相同的 status / results 接口。
+
+工作进程的消息循环 (worker_main) 只依赖 multiprocessing.connection 的 send / recv / poll，
+本机使用 Pipe；同样的循环也可以运行在通过 multiprocessing.connection.Client 连接的其他主机上。
+
+    python -m app.workers -p 3 --rate 2000 --duration 30 -w 4
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from app.config import WORKERS_CONFIG
+from app.jobs import FAILED, FINISHED, STOPPED, LoadJob, parse_stages
+from app.registry import registry
+from app.stats import LatencyHistogram
+from app.suite import _default_global_url, default_params
+
+# 工作进程发送快照的间隔 (秒)
+REPORT_INTERVAL = float(WORKERS_CONFIG.get("report_interval", 0.5))
+# 工作进程的启动方式；spawn 不继承协调进程中的线程与连接，最安全
+START_METHOD = WORKERS_CONFIG.get("start_method", "spawn")
+# 单个任务可使用的工作进程数上限，默认为 CPU 核数
+MAX_PROCESSES = int(WORKERS_CONFIG.get("max_processes") or os.cpu_count() or 1)
+# 等待全部工作进程就绪的超时 (秒)
+READY_TIMEOUT = float(WORKERS_CONFIG.get("ready_timeout", 30))
+# 全部就绪后统一开始前的延迟 (秒)，使各分片的计划时刻对齐
+START_DELAY = 0.2
+
+# 快照中按工作进程求和的计数器
+COUNTERS = ("scheduled", "completed", "errors", "assertion_failures", "missed", "cancelled")
+
+
+def scale_stages(stages: List[Dict[str, float]], share: float) -> List[Dict[str, float]]:
+    """按比例缩放各阶段的速率，得到单个分片的负载计划"""
+    return [dict(stage, **{"from": stage["from"] * share, "rate": stage["rate"] * share}) for stage in stages]
+
+
+def worker_main(conn: Connection):
+    """
+    工作进程入口：接收任务 -> 回复 ready -> 等待 start -> 运行并定期发送快照 -> 发送 final。
+    运行中收到 stop 时停止分片；连接断开时停止分片并退出。
+    """
+    job: Optional[LoadJob] = None
+    try:
+        task = conn.recv()
+        job = LoadJob(
+            task["case"], task["params"], task["stages"], task["global_url"],
+            assertions=task["assertions"], max_in_flight=task["max_in_flight"], max_queue=task["max_queue"],
+            feed=task.get("feed"), shard=tuple(task.get("shard", (0, 1))),
+        )
+        conn.send({"type": "ready", "pid": os.getpid()})
+
+        message = conn.recv()
+        if message.get("type") != "start":
+            return
+        delay = message["start_at"] - time.time()
+        if delay > 0 and conn.poll(delay):
+            return  # 开始前收到 stop
+        job.start()
+
+        interval = float(task.get("report_interval", REPORT_INTERVAL))
+        while not job.done:
+            if conn.poll(interval) and conn.recv().get("type") == "stop":
+                job.stop()
+            conn.send({"type": "snapshot", "snapshot": job.snapshot()})
+        conn.send({"type": "final", "snapshot": job.snapshot()})
+    except (EOFError, OSError):
+        # 协调进程已退出
+        if job is not None:
+            job.stop()
+            job.join()
+    finally:
+        conn.close()
+
+
+class DistributedLoadJob(LoadJob):
+    """在 processes 个本机工作进程中运行的负载任务，接口与 LoadJob 相同"""
+
+    def __init__(self, *args, processes: int = 2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.processes = max(1, min(int(processes), MAX_PROCESSES))
+        # 单个进程的在途上限按进程数均分
+        self.max_in_flight = max(1, math.ceil(self.max_in_flight / self.processes))
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+
+    def status(self) -> Dict[str, Any]:
+        data = super().status()
+        data["processes"] = self.processes
+        return data
+
+    def results(self, include_timeline: bool = True) -> Dict[str, Any]:
+        data = super().results(include_timeline)
+        data["processes"] = self.processes
+        return data
+
+    def _run(self):
+        ctx = multiprocessing.get_context(START_METHOD)
+        task = {
+            "case": self.case,
+            "params": self.params,
+            "stages": scale_stages(self.plan.stages, 1.0 / self.processes),
+            "global_url": self.global_url,
+            "assertions": self.assertion_rules,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "feed": self.feed,
+            "report_interval": REPORT_INTERVAL,
+        }
+        workers: Dict[Connection, int] = {}
+        procs = []
+        try:
+            for i in range(self.processes):
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=worker_main, args=(child,), name=f"load-worker-{self.id}-{i}", daemon=True)
+                proc.start()
+                child.close()
+                procs.append(proc)
+                workers[parent] = i
+                parent.send(dict(task, shard=(i, self.processes)))
+
+            self._wait_ready(workers)
+            if not self._stop.is_set():
+                start_at = time.time() + START_DELAY
+                self.started_at = time.perf_counter() + START_DELAY
+                self._broadcast(workers, {"type": "start", "start_at": start_at})
+                self._collect(workers)
+        except Exception as e:
+            logger.error(f"Load job {self.id} failed: {e}")
+            self.error = str(e)
+        finally:
+            self._broadcast(workers, {"type": "stop"})
+            for conn in workers:
+                conn.close()
+            for proc in procs:
+                proc.join(5)
+                if proc.is_alive():
+                    proc.terminate()
+            self.ended_at = time.perf_counter()
+            if self.started_at is None:
+                self.started_at = self.ended_at
+            elif self._snapshots:
+                # 运行时长取各分片自身的运行时长，不含进程退出的耗时
+                self.ended_at = self.started_at + max(s["elapsed"] for s in self._snapshots.values())
+            if self.error:
+                self.state = FAILED
+            elif self._stop.is_set():
+                self.state = STOPPED
+            else:
+                self.state = FINISHED
+            self._log_history()
+
+    def _wait_ready(self, workers: Dict[Connection, int]):
+        pending = set(workers)
+        deadline = time.monotonic() + READY_TIMEOUT
+        while pending and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"{len(pending)} worker(s) did not become ready")
+            for conn in wait(list(pending), min(remaining, 0.5)):
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f"worker {workers[conn]} exited during startup")
+                if message.get("type") == "ready":
+                    pending.discard(conn)
+
+    def _collect(self, workers: Dict[Connection, int]):
+        """接收快照直到全部工作进程发送 final 或断开；期间转发 stop"""
+        active = set(workers)
+        stop_sent = False
+        while active:
+            if self._stop.is_set() and not stop_sent:
+                self._broadcast(workers, {"type": "stop"})
+                stop_sent = True
+            for conn in wait(list(active), REPORT_INTERVAL):
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    active.discard(conn)
+                    state = self._snapshots.get(workers[conn], {}).get("state")
+                    if state not in (FINISHED, STOPPED) and not self._stop.is_set():
+                        self.error = f"worker {workers[conn]} exited unexpectedly"
+                    continue
+                self._snapshots[workers[conn]] = message["snapshot"]
+                self._merge()
+                if message.get("type") == "final":
+                    active.discard(conn)
+                    if message["snapshot"].get("error"):
+                        self.error = message["snapshot"]["error"]
+
+    @staticmethod
+    def _broadcast(workers: Dict[Connection, int], message: Dict[str, Any]):
+        for conn in workers:
+            try:
+                conn.send(message)
+            except (OSError, ValueError):
+                pass
+
+    def _merge(self):
+        """合并各工作进程的最新快照"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        latency = LatencyHistogram()
+        service_time = LatencyHistogram()
+        assertion_counts = [{"rule": c["rule"], "pass": 0, "fail": 0, "error": 0} for c in self._assertion_counts]
+        timeline: List[List[int]] = []
+        for snapshot in self._snapshots.values():
+            for key in COUNTERS:
+                totals[key] += snapshot[key]
+            latency.merge(LatencyHistogram.from_dict(snapshot["latency"]))
+            service_time.merge(LatencyHistogram.from_dict(snapshot["service_time"]))
+            for merged, counts in zip(assertion_counts, snapshot["assertions"]):
+                for status in ("pass", "fail", "error"):
+                    merged[status] += counts[status]
+            for second, completed, errors in snapshot["timeline"]:
+                while len(timeline) <= second:
+                    timeline.append([len(timeline), 0, 0])
+                timeline[second][1] += completed
+                timeline[second][2] += errors
+
+        with self._lock:
+            for key, value in totals.items():
+                setattr(self, key, value)
+            self.latency = latency
+            self.service_time = service_time
+            self._assertion_counts = assertion_counts
+            self.timeline = timeline
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.workers", description="多进程运行负载任务，输出 JSON 结果")
+    parser.add_argument("-p", "--protocol", required=True, help="协议 ID 或名称")
+    parser.add_argument("-w", "--workers", type=int, default=MAX_PROCESSES, help=f"工作进程数，默认 {MAX_PROCESSES}")
+    parser.add_argument("--rate", type=float, required=True, help="目标到达速率 (次/秒，所有进程合计)")
+    parser.add_argument("--duration", type=float, required=True, help="保持时长 (秒)")
+    parser.add_argument("--ramp-up", type=float, default=0, help="爬坡时长 (秒)")
+    parser.add_argument("--params", help="请求参数 JSON，默认使用协议定义中的默认值")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="同时在途的最大调用数 (所有进程合计)")
+    parser.add_argument("-u", "--target-url", help="全局目标地址，默认读取数据库中的设置")
+    parser.add_argument("-o", "--output", help="结果输出文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    case = registry.get_by_name(args.protocol)
+    if case is None and args.protocol.isdigit():
+        case = registry.get(int(args.protocol))
+    if case is None:
+        print(f"Protocol not found: {args.protocol}", file=sys.stderr)
+        return 2
+
+    job = DistributedLoadJob(
+        case,
+        json.loads(args.params) if args.params else default_params(case),
+        parse_stages({"rate": args.rate, "duration": args.duration, "ramp_up": args.ramp_up}),
+        args.target_url or _default_global_url(),
+        max_in_flight=args.max_in_flight,
+        processes=args.workers,
+    )
+    job.start()
+    try:
+        while not job.done:
+            job.join(1)
+            status = job.status()
+            print(
+                f"[{status['elapsed_s']:>7.1f}s] {status['completed']} done, {status['errors']} errors, "
+                f"p99 {status['latency_ms'].get('p99', 0)} ms",
+                file=sys.stderr,
+            )
+    except KeyboardInterrupt:
+        job.stop()
+        job.join()
+
+    text = json.dumps(job.results(), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if job.state == FINISHED and not job.errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
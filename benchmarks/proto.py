@@ -0,0 +1,54 @@
+"""
+基准测试使用的 protobuf 消息。
+运行时通过描述符动态构建 google.protobuf 消息类，无需 protoc 编译。
+"""
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+_FILE_NAME = "benchmarks/bench_login.proto"
+_PACKAGE = "bench"
+
+
+def _build_file() -> descriptor_pb2.FileDescriptorProto:
+    T = descriptor_pb2.FieldDescriptorProto
+    fd = descriptor_pb2.FileDescriptorProto(name=_FILE_NAME, package=_PACKAGE, syntax="proto3")
+
+    def add_message(name, fields):
+        msg = fd.message_type.add(name=name)
+        for number, (field_name, field_type, type_name) in enumerate(fields, start=1):
+            field = msg.field.add(name=field_name, number=number, type=field_type, label=T.LABEL_OPTIONAL)
+            if type_name:
+                field.type_name = type_name
+
+    add_message("LoginRequest", [
+        ("username", T.TYPE_STRING, None),
+        ("password", T.TYPE_STRING, None),
+        ("server_id", T.TYPE_INT32, None),
+        ("device_id", T.TYPE_STRING, None),
+    ])
+    add_message("UserProfile", [
+        ("user_id", T.TYPE_INT64, None),
+        ("nickname", T.TYPE_STRING, None),
+        ("level", T.TYPE_INT32, None),
+    ])
+    add_message("LoginResponse", [
+        ("result_code", T.TYPE_INT32, None),
+        ("error_message", T.TYPE_STRING, None),
+        ("token", T.TYPE_STRING, None),
+        ("profile", T.TYPE_MESSAGE, f".{_PACKAGE}.UserProfile"),
+    ])
+    return fd
+
+
+def _load_classes():
+    pool = descriptor_pool.Default()
+    try:
+        pool.FindFileByName(_FILE_NAME)
+    except KeyError:
+        pool.Add(_build_file())
+    return tuple(
+        message_factory.GetMessageClass(pool.FindMessageTypeByName(f"{_PACKAGE}.{name}"))
+        for name in ("LoginRequest", "UserProfile", "LoginResponse")
+    )
+
+
+LoginRequest, UserProfile, LoginResponse = _load_classes()
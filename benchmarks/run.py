@@ -0,0 +1,231 @@
+"""
+平台自身开销的基准测试。
+
+在进程内启动替身后端，分别测量用例加载、各协议处理器、execute_protocol
+以及完整的 call_protocol 路由 (Flask 测试客户端) 的吞吐与延迟分位数，
+并与基线文件比较，吞吐下降超过阈值时以非零退出码结束。不需要访问外部网络。
+
+    python -m benchmarks.run                    # 运行并与 benchmarks/baseline.json 比较
+    python -m benchmarks.run --save-baseline    # 运行并更新基线
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import yaml
+from app.connect import execute_protocol, get_handler, is_error_response, CallType
+from app.history import history_writer
+from app.registry import registry
+from app.stats import summarize_latencies
+from benchmarks.servers import StandInServers
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# 吞吐低于基线的比例超过该值时视为性能回退
+DEFAULT_THRESHOLD = 0.3
+# 路由并发测试中每个请求的调用次数
+ROUTE_CONCURRENCY = 50
+
+
+def bench(fn: Callable[[], Any], iterations: int, warmup: int) -> Dict[str, Any]:
+    """串行执行 fn，返回每秒操作数与单次延迟分位数 (毫秒)"""
+    for _ in range(warmup):
+        fn()
+    perf = time.perf_counter
+    latencies: List[float] = []
+    started = perf()
+    for _ in range(iterations):
+        t = perf()
+        fn()
+        latencies.append((perf() - t) * 1000)
+    wall = perf() - started
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / wall, 1),
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+def _protocol_cases(servers: StandInServers) -> List[Dict[str, Any]]:
+    """指向替身后端的协议定义 (与 test_cases/*.yaml 结构相同)"""
+    return [
+        {
+            "name": "bench-http",
+            "call_type": "http",
+            "target_config": {"url": f"http://127.0.0.1:{servers.http_port}/echo", "method": "POST"},
+            "params": {"msg": {"type": "string", "default": "ping"}},
+            "assertions": ["response['code'] == 0"],
+        },
+        {
+            "name": "bench-socket",
+            "call_type": "socket",
+            "target_config": {"host": "127.0.0.1", "port": servers.socket_port, "framing": "newline"},
+            "params": {"msg": {"type": "string", "default": "ping"}},
+            "assertions": ["response['code'] == 0"],
+        },
+        {
+            "name": "bench-protobuf",
+            "call_type": "protobuf",
+            "target_config": {
+                "host": "127.0.0.1",
+                "port": servers.protobuf_port,
+                "proto_module": "benchmarks.proto",
+                "request_class": "LoginRequest",
+                "response_class": "LoginResponse",
+            },
+            "params": {"username": {"type": "string", "default": "player1"}},
+            "assertions": ["response['result_code'] == 0"],
+        },
+    ]
+
+
+_PARAMS = {
+    "http": {"msg": "ping"},
+    "socket": {"msg": "ping"},
+    "protobuf": {"username": "player1", "password": "123", "server_id": 1001, "device_id": "dev001"},
+}
+
+
+def _checked(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """调用失败时立即中止，避免把错误路径的耗时当作结果"""
+    def run():
+        result = fn()
+        if is_error_response(result):
+            raise RuntimeError(result["error"])
+        return result
+    return run
+
+
+def run_benchmarks(iterations: int, warmup: int, only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, fn: Callable[[], Any], n: int = iterations):
+        if only and not any(name.startswith(prefix) for prefix in only):
+            return
+        results[name] = bench(fn, n, min(warmup, n))
+        stats = results[name]
+        print(f"{name:<40} {stats['ops_per_sec']:>10.1f} ops/s  p50 {stats['latency_ms']['p50']:.3f} ms  "
+              f"p99 {stats['latency_ms']['p99']:.3f} ms", file=sys.stderr)
+
+    original_directory = registry.directory
+    with StandInServers() as servers, tempfile.TemporaryDirectory() as cases_dir, \
+            tempfile.TemporaryDirectory() as data_dir:
+        protocols = _protocol_cases(servers)
+        for protocol in protocols:
+            with open(Path(cases_dir) / f"{protocol['name']}.yaml", "w", encoding="utf-8") as f:
+                yaml.safe_dump(protocol, f, allow_unicode=True)
+
+        # 注册表指向临时用例目录，基准结束后恢复
+        registry.directory = Path(cases_dir)
+        try:
+            registry.refresh(force=True)
+            rows = {p["call_type"]: p for p in registry.all()}
+            global_url = f"http://127.0.0.1:{servers.http_port}/"
+
+            record("registry.load_all_test_cases", registry.all)
+            record("registry.refresh_forced", lambda: registry.refresh(force=True), max(iterations // 10, 10))
+
+            for call_type in ("http", "socket", "protobuf"):
+                handler = get_handler(CallType(call_type))
+                config = rows[call_type]["target_config"]
+                params = _PARAMS[call_type]
+                record(f"handler.{call_type}", lambda h=handler, c=config, p=params: h.execute(c, p))
+
+            for call_type in ("http", "socket", "protobuf"):
+                row, params = rows[call_type], _PARAMS[call_type]
+                record(
+                    f"execute_protocol.{call_type}",
+                    _checked(lambda r=row, p=params: execute_protocol(r, p, global_url)),
+                )
+
+            # 数据库与日志写入临时目录，不在工作目录中生成 app.db / logs (同 benchmarks/startup.py)
+            import app
+            import app.database
+            app.database.DB_PATH = Path(data_dir) / "app.db"
+            app.LOG_PATH = Path(data_dir) / "logs" / "app.log"
+            history_writer.db_path = app.database.DB_PATH
+            client = app.create_app().test_client()
+            for call_type in ("http", "socket", "protobuf"):
+                row, params = rows[call_type], _PARAMS[call_type]
+
+                def call(r=row, p=params, payload=None):
+                    resp = client.post(f"/api/protocol/{r['id']}/call", json=payload or {"params": p})
+                    if resp.status_code != 200 or "error" in resp.get_json():
+                        raise RuntimeError(resp.get_data(as_text=True)[:200])
+
+                record(f"route.call_protocol.{call_type}", call)
+                record(
+                    f"route.call_protocol.{call_type}.c{ROUTE_CONCURRENCY}",
+                    lambda c=call, p=params: c(payload={"params": p, "concurrency": ROUTE_CONCURRENCY}),
+                    max(iterations // ROUTE_CONCURRENCY, 10),
+                )
+        finally:
+            registry.directory = original_directory
+            registry.refresh(force=True)
+            # 临时目录删除前写完排队中的历史记录
+            history_writer.flush(10)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """与基线比较，在结果中写入 baseline_ops_per_sec / change，返回吞吐回退超过阈值的路径"""
+    regressions = []
+    for name, stats in results.items():
+        base = (baseline.get("paths") or {}).get(name)
+        if not base or not base.get("ops_per_sec"):
+            continue
+        ratio = stats["ops_per_sec"] / base["ops_per_sec"]
+        stats["baseline_ops_per_sec"] = base["ops_per_sec"]
+        stats["change"] = round(ratio - 1, 3)
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="平台开销基准测试")
+    parser.add_argument("-n", "--iterations", type=int, default=2000, help="每个路径的测量次数")
+    parser.add_argument("-w", "--warmup", type=int, default=200, help="每个路径的预热次数")
+    parser.add_argument("--only", action="append", help="只运行名称以该前缀开头的路径 (可重复)")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="基线文件路径")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的吞吐下降比例")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果写入基线文件")
+    parser.add_argument("-o", "--output", help="将结果 JSON 写入文件")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.iterations, args.warmup, args.only)
+
+    baseline_path = Path(args.baseline)
+    regressions: List[str] = []
+    if args.save_baseline:
+        baseline = {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "paths": {name: {"ops_per_sec": s["ops_per_sec"], "latency_ms": s["latency_ms"]} for name, s in results.items()},
+        }
+        baseline_path.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {baseline_path}", file=sys.stderr)
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        for name in results:
+            if "change" in results[name]:
+                mark = "  REGRESSION" if name in regressions else ""
+                print(f"{name:<40} {results[name]['change']:+.1%} vs baseline{mark}", file=sys.stderr)
+    else:
+        print(f"No baseline at {baseline_path}, skipping comparison", file=sys.stderr)
+
+    report = {"results": results, "regressions": regressions, "threshold": args.threshold}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+进程内的本地替身后端 (HTTP / JSON socket / 长度前缀 protobuf)，只监听 127.0.0.1 的随机端口。
+"""
+import json
+import struct
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from benchmarks.proto import LoginRequest, LoginResponse
+
+LENGTH_PREFIX = struct.Struct(">I")
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    """返回 {"code": 0, "echo": 参数} 的 keep-alive JSON 接口"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，关闭 Nagle 避免与客户端延迟确认叠加出 40ms 延迟
+    disable_nagle_algorithm = True
+
+    def _reply(self, params):
+        body = json.dumps({"code": 0, "echo": params}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(dict(parse_qsl(urlsplit(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self._reply(json.loads(self.rfile.read(length) or b"{}"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _JsonSocketHandler(socketserver.StreamRequestHandler):
+    """newline 分帧的 JSON 回显服务，连接可复用"""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        for line in self.rfile:
+            reply = json.dumps({"code": 0, "echo": json.loads(line)}).encode("utf-8") + b"\n"
+            self.wfile.write(reply)
+
+
+class _ProtobufHandler(socketserver.StreamRequestHandler):
+    """4 字节长度前缀的 LoginRequest -> LoginResponse 服务，连接可复用"""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            head = self.rfile.read(4)
+            if len(head) < 4:
+                return
+            req = LoginRequest()
+            req.ParseFromString(self.rfile.read(LENGTH_PREFIX.unpack(head)[0]))
+            res = LoginResponse(result_code=0, token="token-" + req.username)
+            res.profile.user_id = req.server_id
+            res.profile.nickname = req.username
+            res.profile.level = 10
+            data = res.SerializeToString()
+            self.wfile.write(LENGTH_PREFIX.pack(len(data)) + data)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class StandInServers:
+    """
+    启动 / 停止全部替身后端。
+    端口在 start() 之后通过 http_port / socket_port / protobuf_port 获取。
+    """
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self._servers = []
+
+    def start(self) -> "StandInServers":
+        http_server = ThreadingHTTPServer((self.host, 0), _HttpHandler)
+        http_server.daemon_threads = True
+        socket_server = _ThreadingTCPServer((self.host, 0), _JsonSocketHandler)
+        protobuf_server = _ThreadingTCPServer((self.host, 0), _ProtobufHandler)
+        self._servers = [http_server, socket_server, protobuf_server]
+        for server in self._servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.http_port = http_server.server_address[1]
+        self.socket_port = socket_server.server_address[1]
+        self.protobuf_port = protobuf_server.server_address[1]
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def __enter__(self) -> "StandInServers":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
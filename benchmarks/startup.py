@@ -0,0 +1,133 @@
+"""
+启动开销基准测试。
+
+每次测量启动一个新的解释器进程，分别记录 import app、create_app (新数据库 / 已是最新版本的数据库)
+以及各协议处理器首次使用时的加载耗时，取多次运行的中位数。
+数据库与日志写入临时目录，不影响项目目录。
+
+    python -m benchmarks.startup                       # 测量当前代码
+    python -m benchmarks.startup --root ../old-tree    # 测量另一份检出 (如改动前的版本) 以便对比
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CALL_TYPES = ("http", "socket", "protobuf")
+# create_app 之后仍未导入即说明按需加载生效的第三方模块
+HEAVY_MODULES = ("requests", "aiohttp", "google.protobuf")
+
+# 在子进程中执行：计时导入，把数据库与日志指向临时目录 (导入本身不访问数据库) 后计时创建应用
+_PROBE = r"""
+import sys, json, time
+from pathlib import Path
+perf = time.perf_counter
+t0 = perf()
+import app
+t1 = perf()
+import app.database
+app.database.DB_PATH = Path(sys.argv[1])
+app.LOG_PATH = Path(sys.argv[2])
+db, init_db, init_db_ms = app.database.db, app.database.db.init_db, []
+def timed_init_db(application):
+    t = perf()
+    init_db(application)
+    init_db_ms.append((perf() - t) * 1000)
+db.init_db = timed_init_db
+app.create_app()
+t2 = perf()
+out = {
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "init_db_ms": init_db_ms[0] if init_db_ms else None,
+    "modules": len(sys.modules),
+    "eager_imports": [m for m in json.loads(sys.argv[3]) if m in sys.modules],
+}
+from app.connect import get_handler
+for call_type in json.loads(sys.argv[4]):
+    t = perf()
+    try:
+        get_handler(call_type)
+        out[f"handler.{call_type}_ms"] = (perf() - t) * 1000
+    except Exception:
+        out[f"handler.{call_type}_ms"] = None
+print(json.dumps(out))
+"""
+
+
+def probe(root: Path, db_path: Path, log_path: Path) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE, str(db_path), str(log_path), json.dumps(HEAVY_MODULES), json.dumps(CALL_TYPES)],
+        cwd=root, capture_output=True, text=True, env=_env(root),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip()[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _env(root: Path) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(root), env.get("PYTHONPATH")]))
+    env.setdefault("PYTHONDONTWRITEBYTECODE", "1")
+    return env
+
+
+def _median(runs: List[Dict[str, Any]], key: str) -> Optional[float]:
+    values = [run[key] for run in runs if run.get(key) is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def run_startup(root: Path, repeat: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        log_path = tmp_dir / "app.log"
+        # 预热一次 (生成 .pyc、填充文件系统缓存)，同时得到已初始化的数据库
+        migrated = tmp_dir / "migrated.db"
+        probe(root, migrated, log_path)
+
+        fresh_runs = [probe(root, tmp_dir / f"fresh-{i}.db", log_path) for i in range(repeat)]
+        warm_runs = [probe(root, migrated, log_path) for _ in range(repeat)]
+
+    results["import_ms"] = _median(warm_runs, "import_ms")
+    results["create_app_ms.fresh_db"] = _median(fresh_runs, "create_app_ms")
+    results["create_app_ms.migrated_db"] = _median(warm_runs, "create_app_ms")
+    results["init_db_ms.fresh_db"] = _median(fresh_runs, "init_db_ms")
+    results["init_db_ms.migrated_db"] = _median(warm_runs, "init_db_ms")
+    results["startup_ms"] = round(results["import_ms"] + results["create_app_ms.migrated_db"], 1)
+    for call_type in CALL_TYPES:
+        results[f"handler.{call_type}_ms"] = _median(warm_runs, f"handler.{call_type}_ms")
+    results["modules"] = warm_runs[-1]["modules"]
+    results["eager_imports"] = warm_runs[-1]["eager_imports"]
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="启动开销基准测试")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="每项测量的进程数 (取中位数)")
+    parser.add_argument("--root", default=str(PROJECT_ROOT), help="被测代码的项目目录")
+    parser.add_argument("-o", "--output", help="将结果 JSON 写入文件")
+    args = parser.parse_args(argv)
+
+    root = Path(args.root).resolve()
+    results = run_startup(root, max(1, args.repeat))
+    print(f"{root}", file=sys.stderr)
+    for name, value in results.items():
+        if isinstance(value, float):
+            print(f"  {name:<32} {value:>8.1f} ms", file=sys.stderr)
+        else:
+            print(f"  {name:<32} {value}", file=sys.stderr)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"root": str(root), "results": results}, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
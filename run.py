@@ -1,6 +1,12 @@
+import sys
 from app import create_app
 
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    if "--dev" in sys.argv[1:]:
+        # 开发模式：单进程 Werkzeug 服务器，带调试器与自动重载
+        app.run(debug=True, host="0.0.0.0", port=5000)
+    else:
+        from app.serve import main
+        sys.exit(main(sys.argv[1:], app=app))